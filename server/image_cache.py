@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""报工单图片渲染缓存
+
+同一工单在一个班次内经常被重复打印，工单数据不变时生成的图片也完全相同。
+缓存以“规范化工单数据 + 渲染器版本 + 输出格式”的哈希为键（见 work_order_image.render_cache_key），
+把编码好的PNG保存在本地目录中，多个Python进程共享命中。目录总大小超过上限时按最近使用时间淘汰。
+目录总大小和命中计数保存在目录中的 SQLite 文件（STATS_FILE）里，各进程累加，启动时不需要扫描目录；
+不可用时退化为进程内计数，在第一次写入时扫描一次目录。
+
+命令行：
+  python image_cache.py stats
+  python image_cache.py clear
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import sqlite3
+import tempfile
+import threading
+from typing import Dict, Optional
+
+# 缓存目录总大小上限（字节）
+MAX_CACHE_BYTES = int(os.getenv('SAP_RENDER_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+# 超过上限时淘汰到上限的该比例以下，避免每次写入都扫描目录
+EVICT_TARGET_RATIO = 0.9
+
+DEFAULT_CACHE_DIR = os.getenv(
+    'SAP_RENDER_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'renders')
+)
+
+CACHE_SUFFIX = '.png'
+# 缓存目录中保存总大小和计数的文件
+STATS_FILE = 'cache_stats.sqlite3'
+# 命中次数累加到SQLite的间隔（秒），进程退出时也会写入
+STATS_FLUSH_SECONDS = 10.0
+STAT_NAMES = ('hits', 'misses', 'bytes_saved', 'evictions')
+
+
+def write_file_atomic(path: str, data: bytes):
+    """先写临时文件再改名，读取方不会看到写了一半的文件"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class RenderCache:
+    """按键保存渲染结果（PNG字节），目录总大小有上限"""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 命中时省去重新渲染的图片字节数
+        self.bytes_saved = 0
+        # 尚未累加到SQLite的计数
+        self._unflushed = dict.fromkeys(STAT_NAMES, 0)
+        self._stats_flushed_at = time.monotonic()
+        # 没有SQLite时进程内跟踪的目录总大小，第一次写入时扫描目录得到
+        self._size = None
+        self._db = self._open_db()
+
+    def _open_db(self) -> Optional[sqlite3.Connection]:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            db = sqlite3.connect(os.path.join(self.directory, STATS_FILE), timeout=5, check_same_thread=False,
+                                 isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS render_cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            return db
+        except (sqlite3.Error, OSError):
+            return None
+
+    def path(self, key: str) -> str:
+        """键对应的缓存文件路径"""
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def _scan(self):
+        """返回缓存目录中的 (路径, 大小, 最近使用时间)"""
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(CACHE_SUFFIX):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        except OSError:
+            pass
+        return entries
+
+    def _count(self, name: str, value: int = 1):
+        """（持有锁时调用）计数，并定期累加到SQLite"""
+        setattr(self, name, getattr(self, name) + value)
+        self._unflushed[name] += value
+        if time.monotonic() - self._stats_flushed_at >= STATS_FLUSH_SECONDS:
+            self._flush_stats()
+
+    def _flush_stats(self):
+        """（持有锁时调用）把未写入的计数累加到SQLite"""
+        self._stats_flushed_at = time.monotonic()
+        pending = [(name, value) for name, value in self._unflushed.items() if value]
+        if self._db is None or not pending:
+            return
+        try:
+            self._db.executemany(
+                "INSERT INTO render_cache_stats (name, value) VALUES (?, ?)"
+                " ON CONFLICT (name) DO UPDATE SET value = value + excluded.value", pending)
+        except sqlite3.Error:
+            return
+        self._unflushed = dict.fromkeys(STAT_NAMES, 0)
+
+    def flush_stats(self):
+        with self._lock:
+            self._flush_stats()
+
+    def _add_size(self, delta: int) -> int:
+        """（持有锁时调用）目录总大小加上 delta，返回新的总大小；SQLite中还没有记录时扫描一次目录"""
+        if self._db is not None:
+            db = self._db
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    found = db.execute("SELECT value FROM render_cache_stats WHERE name = 'size_bytes'").fetchone()
+                    if found is None:
+                        # 目录中已经包含刚写入的文件
+                        size = sum(size for _, size, _ in self._scan())
+                    else:
+                        size = found[0] + delta
+                    db.execute("INSERT OR REPLACE INTO render_cache_stats (name, value) VALUES ('size_bytes', ?)",
+                               (size,))
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+                return size
+            except sqlite3.Error:
+                pass
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._scan())
+        else:
+            self._size += delta
+        return self._size
+
+    def _set_size(self, size: int):
+        """（持有锁时调用）扫描目录后记录准确的总大小"""
+        self._size = size
+        if self._db is not None:
+            try:
+                self._db.execute("INSERT OR REPLACE INTO render_cache_stats (name, value) VALUES ('size_bytes', ?)",
+                                 (size,))
+            except sqlite3.Error:
+                pass
+
+    def tracked_size(self) -> int:
+        """记录的目录总大小（不扫描目录，还没有记录时除外）"""
+        with self._lock:
+            return self._add_size(0)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # 用修改时间记录最近使用时间，淘汰时先删除最久未使用的文件
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._count('misses')
+            return None
+        with self._lock:
+            self._count('hits')
+            self._count('bytes_saved', len(data))
+        return data
+
+    def contains(self, key: str) -> bool:
+        """只检查是否已缓存，不读取文件，也不计入命中率"""
+        return os.path.exists(self.path(key))
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        path = self.path(key)
+        try:
+            # 覆盖已有的文件时只增加大小之差
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = 0
+        try:
+            write_file_atomic(path, data)
+        except OSError:
+            # 磁盘不可用时只是不缓存
+            return
+        with self._lock:
+            if self._add_size(len(data) - previous) > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """重新扫描目录（其他进程也会写入），删除最久未使用的文件直到低于目标大小"""
+        entries = sorted(self._scan(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TARGET_RATIO
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            self._count('evictions')
+        self._set_size(total)
+
+    def clear(self) -> int:
+        """删除所有缓存文件，返回删除的文件数"""
+        removed = 0
+        with self._lock:
+            for path, _, _ in self._scan():
+                try:
+                    os.unlink(path)
+                    removed += 1
+                except OSError:
+                    pass
+            self._set_size(0)
+        return removed
+
+    def stats(self) -> Dict:
+        """本进程的计数；使用SQLite时 all_processes 为所有进程累计的计数（含本进程）"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._scan()
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'bytes_saved': self.bytes_saved,
+                'evictions': self.evictions,
+                'entries': len(entries),
+                'size_bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+            }
+            if self._db is not None:
+                self._flush_stats()
+                totals = dict.fromkeys(STAT_NAMES, 0)
+                try:
+                    totals.update((name, value) for name, value in
+                                  self._db.execute("SELECT name, value FROM render_cache_stats")
+                                  if name in totals)
+                except sqlite3.Error:
+                    pass
+                else:
+                    lookups = totals['hits'] + totals['misses']
+                    totals['hit_rate'] = round(totals['hits'] / lookups, 4) if lookups else 0.0
+                    stats['all_processes'] = totals
+            return stats
+
+
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache() -> Optional[RenderCache]:
+    """进程内共享的渲染缓存；设置 SAP_RENDER_CACHE_DISABLED=1 时返回 None"""
+    global _render_cache
+    if os.getenv('SAP_RENDER_CACHE_DISABLED') == '1':
+        return None
+    with _render_cache_lock:
+        if _render_cache is None:
+            _render_cache = RenderCache()
+            atexit.register(_render_cache.flush_stats)
+        return _render_cache
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    cache = RenderCache()
+    if len(sys.argv) == 2 and sys.argv[1] == 'clear':
+        print(json.dumps({'success': True, 'removed': cache.clear()}, ensure_ascii=False))
+    elif len(sys.argv) == 2 and sys.argv[1] == 'stats':
+        stats = cache.stats()
+        # 本进程没有查询过缓存，输出所有进程累计的计数
+        stats.update(stats.pop('all_processes', {}))
+        print(json.dumps(stats, ensure_ascii=False))
+    else:
+        print(json.dumps({'success': False, 'error': '用法: image_cache.py stats | clear'}, ensure_ascii=False))
+        sys.exit(1)
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""多工单批量打印：按A4分页，输出为一个多页PDF或TIFF
+
+整班打印时不再为每个工单生成一张很长的PNG：
+  - 各工单的报工单在进程池中并行渲染（默认进程数为可用CPU核数，SAP_PRINT_WORKERS 可覆盖）
+  - 按版面计算的分页位置逐页绘制A4页面（WorkOrderRenderer.iter_pages），优先在工序之间分页，其次在行首分页，
+    不会切断文字，也不需要先绘制整张长图
+  - 页面按工单顺序边生成边写入输出文件，同时在途的工单数有上限，内存占用与工单数量无关
+  - 渲染进程用 forkserver 启动（Windows 为 spawn），不 fork 常驻进程（sap_worker.py）：
+    fork 多线程进程时子进程可能继承其他线程持有的锁（日志、SQLite、SAP连接池）而死锁
+
+用法：
+  python print_job.py --output shift.pdf 123456,123457 123458
+  python print_job.py --output shift.tiff --format tiff 123456
+  python print_job.py --bench 100 --output /tmp/bench.pdf      # 使用构造数据，无需SAP
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image, TiffImagePlugin
+
+from work_order_image import WIDTH, ONE_BIT_THRESHOLD, get_renderer
+
+PRINT_FORMATS = ('pdf', 'tiff')
+# 页面为A4比例（210×297mm），宽度与报工单图片相同
+PAGE_WIDTH = WIDTH
+PAGE_HEIGHT = round(WIDTH * 297 / 210)
+# 页面宽度对应210mm时的分辨率，PDF/TIFF阅读器按此换算为A4纸张大小
+PAGE_DPI = WIDTH / (210 / 25.4)
+# PDF 每次追加写入的页数
+PDF_PAGES_PER_APPEND = 32
+# 渲染进程的启动方式：不使用 fork（调用方可能是多线程的常驻进程）
+PRINT_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+DEFAULT_PRINT_DIR = os.getenv(
+    'SAP_PRINT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'print')
+)
+
+
+def default_workers() -> int:
+    """进程池大小：SAP_PRINT_WORKERS，否则为当前进程可用的CPU核数"""
+    configured = os.getenv('SAP_PRINT_WORKERS')
+    if configured:
+        return max(1, int(configured))
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def _process_context():
+    """渲染进程池使用的 multiprocessing 上下文；forkserver 预先导入渲染模块，每个渲染进程不必重新导入"""
+    context = multiprocessing.get_context(PRINT_START_METHOD)
+    if PRINT_START_METHOD == 'forkserver':
+        context.set_forkserver_preload(['work_order_image'])
+    return context
+
+
+def render_order_pages(order_data: Dict) -> List[bytes]:
+    """（在进程池中执行）按版面分页逐页绘制一个工单，返回每页的1位PNG字节"""
+    encoded = []
+    for region in get_renderer().iter_pages(order_data, PAGE_HEIGHT):
+        page = Image.new('L', (PAGE_WIDTH, PAGE_HEIGHT), 255)
+        page.paste(region.convert('L'), (0, 0))
+        # 与 1bit 输出相同的阈值，保留浅灰色的工序分隔线
+        page = page.point(lambda v: 255 if v >= ONE_BIT_THRESHOLD else 0, mode='1')
+        buffer = io.BytesIO()
+        page.save(buffer, format='PNG')
+        encoded.append(buffer.getvalue())
+    return encoded
+
+
+class _PdfWriter:
+    """分批追加页面到PDF文件，内存中最多保留 PDF_PAGES_PER_APPEND 页"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pending = []
+        self.started = False
+
+    def add_page(self, page: Image.Image):
+        self.pending.append(page)
+        if len(self.pending) >= PDF_PAGES_PER_APPEND:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        first, rest = self.pending[0], self.pending[1:]
+        first.save(self.path, format='PDF', save_all=True, append_images=rest,
+                   append=self.started, resolution=PAGE_DPI)
+        self.started = True
+        self.pending = []
+
+    def close(self):
+        self._flush()
+
+
+class _TiffWriter:
+    """逐页写入多页TIFF（CCITT Group 4 压缩）"""
+
+    def __init__(self, path: str):
+        self._file = open(path, 'w+b')
+        self._writer = TiffImagePlugin.AppendingTiffWriter(self._file, new=True)
+
+    def add_page(self, page: Image.Image):
+        page.save(self._writer, format='TIFF', compression='group4', dpi=(PAGE_DPI, PAGE_DPI))
+        self._writer.newFrame()
+
+    def close(self):
+        self._writer.close()
+        self._file.close()
+
+
+def _open_writer(path: str, output_format: str):
+    if output_format == 'pdf':
+        return _PdfWriter(path)
+    return _TiffWriter(path)
+
+
+def write_print_job(orders: Iterable[Tuple[str, Optional[Dict]]], path: str, output_format: str = 'pdf',
+                    workers: Optional[int] = None) -> Dict:
+    """把 (工单号, 工单数据) 依次渲染分页并写入一个文件
+
+    工单数据为空或渲染失败的工单记录错误并跳过，不影响其他工单。
+    """
+    if output_format not in PRINT_FORMATS:
+        raise ValueError(f'不支持的打印格式: {output_format}')
+    workers = workers or default_workers()
+    # 同时提交给进程池的工单数上限，已渲染但尚未写出的页面不会无限堆积
+    window = workers * 2
+
+    results = []
+    total_pages = 0
+    writer = None
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_process_context()) as executor:
+        in_flight = []
+        orders = iter(orders)
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < window:
+                try:
+                    order_number, order_data = next(orders)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = executor.submit(render_order_pages, order_data) if order_data else None
+                in_flight.append((order_number, future))
+            if not in_flight:
+                break
+
+            # 按提交顺序写出，保证页面顺序与工单顺序一致
+            order_number, future = in_flight.pop(0)
+            if future is None:
+                results.append({'order_number': order_number, 'success': False, 'error': '未找到工单数据'})
+                continue
+            try:
+                pages = future.result()
+            except Exception as e:
+                results.append({'order_number': order_number, 'success': False, 'error': str(e)})
+                continue
+            if writer is None:
+                writer = _open_writer(path, output_format)
+            for png in pages:
+                with Image.open(io.BytesIO(png)) as page:
+                    page.load()
+                    writer.add_page(page)
+            total_pages += len(pages)
+            results.append({'order_number': order_number, 'success': True, 'pages': len(pages)})
+
+    if writer is None:
+        return {'success': False, 'error': '没有可打印的工单', 'results': results}
+    writer.close()
+    return {'success': True, 'file': path, 'format': output_format, 'pages': total_pages, 'results': results}
+
+
+def _output_path(output_format: str) -> str:
+    os.makedirs(DEFAULT_PRINT_DIR, exist_ok=True)
+    return os.path.join(DEFAULT_PRINT_DIR, f"work_orders_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.{output_format}")
+
+
+def print_work_orders(order_numbers: List[str], conn=None, output_format: str = 'pdf',
+                      output_path: Optional[str] = None, workers: Optional[int] = None) -> Dict:
+    """批量读取工单数据并生成一个多页打印文件，返回文件路径、总页数及每个工单的结果
+
+    conn 为空时从连接池借用连接并在结束后归还，读取SAP受批量请求时限 SAP_BATCH_DEADLINE 限制（渲染不计入）；
+    常驻进程（sap_worker.py）会传入已建立的连接复用。
+    """
+    # 渲染子进程只需要本模块和 work_order_image，SAP相关模块在此处才导入
+    from sap_breaker import BATCH_REQUEST_DEADLINE, error_message, request_deadline
+    from sap_common import pooled_connection
+    from sap_rfc_extended import get_production_orders_data
+
+    order_numbers = [str(n).strip() for n in order_numbers if str(n).strip()]
+    if not order_numbers:
+        return {'success': False, 'error': '请提供工单号参数'}
+    try:
+        if conn is not None:
+            orders_data = get_production_orders_data(conn, order_numbers)
+        else:
+            with request_deadline(BATCH_REQUEST_DEADLINE), pooled_connection() as conn:
+                orders_data = get_production_orders_data(conn, order_numbers)
+
+        path = output_path or _output_path(output_format)
+        return write_print_job(orders_data.items(), path, output_format, workers)
+    except Exception as e:
+        return {
+            'success': False,
+            'error': error_message(e)
+        }
+
+
+def _benchmark(orders: int, operations: int, path: str, output_format: str, workers: Optional[int]) -> Dict:
+    """使用构造的工单数据测量批量打印耗时与本进程峰值内存"""
+    import resource
+    from work_order_image import sample_order_data
+
+    def sample_orders():
+        for i in range(orders):
+            order_data = sample_order_data(operations + i % 5)
+            order_data["基础信息"]["工单号"] = str(1000000 + i).zfill(12)
+            yield str(1000000 + i), order_data
+
+    started = time.perf_counter()
+    result = write_print_job(sample_orders(), path, output_format, workers)
+    elapsed = time.perf_counter() - started
+    return {
+        'orders': orders,
+        'workers': workers or default_workers(),
+        'pages': result.get('pages'),
+        'seconds': round(elapsed, 2),
+        'file_bytes': os.path.getsize(path) if result.get('success') else 0,
+        # Linux 下单位为KB
+        'parent_peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description='多工单批量打印（A4分页PDF/TIFF）')
+    parser.add_argument('order_numbers', nargs='*', help='工单号，可用逗号分隔')
+    parser.add_argument('--output', help='输出文件路径（默认写入 SAP_PRINT_DIR）')
+    parser.add_argument('--format', choices=PRINT_FORMATS, default='pdf')
+    parser.add_argument('--workers', type=int, help='渲染进程数（默认为CPU核数）')
+    parser.add_argument('--bench', type=int, metavar='N', help='使用N个构造工单测量耗时，无需SAP')
+    parser.add_argument('--operations', type=int, default=10, help='基准测试中每个工单的工序数')
+    args = parser.parse_args()
+
+    if args.bench:
+        output = args.output or _output_path(args.format)
+        print(json.dumps(_benchmark(args.bench, args.operations, output, args.format, args.workers),
+                         ensure_ascii=False, indent=2))
+        sys.exit(0)
+
+    numbers = [n for arg in args.order_numbers for n in arg.split(',')]
+    if not numbers:
+        print(json.dumps({'success': False, 'error': '请提供工单号参数'}, ensure_ascii=False))
+        sys.exit(1)
+    print(json.dumps(print_work_orders(numbers, output_format=args.format, output_path=args.output,
+                                       workers=args.workers), ensure_ascii=False))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""常驻进程的请求合并与短期结果缓存
+
+多个终端（例如看板刷新）常在同一秒内请求同一个工单，每个请求都会完整读取一遍SAP：
+  - SingleFlight：相同的请求同时到达时只执行一次，其余请求等待并共享这次的结果
+  - ResultCache：可选的短期结果缓存。有效期（ttl）内直接返回；过期但仍在 stale 时间内时立即返回旧结果，
+    同时由调用方在后台刷新（stale-while-revalidate）；超过 ttl + stale 后按未命中处理
+只缓存成功的结果。缓存和合并都只在进程内，见 sap_worker.py。
+报工单结果带有图片（base64 或待发送的图片帧），条目数上限之外还可以按估算的字节数限制（sizeof），
+超过 ttl + stale 的条目在写入时定期清除，不会一直占用内存。
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# 结果缓存最多保留的条目数（按最近使用淘汰）
+MAX_RESULT_ENTRIES = 1000
+# 指定 sizeof 时结果缓存的总大小上限（字节，按最近使用淘汰）
+MAX_RESULT_BYTES = int(os.getenv('SAP_RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# estimate_size 中每个字典项、列表元素或其他对象另计的字节数
+ITEM_OVERHEAD = 64
+
+RESULT_FRESH = 'fresh'
+RESULT_STALE = 'stale'
+RESULT_MISS = 'miss'
+
+
+def estimate_size(value: Any) -> int:
+    """结果的近似内存占用（字节）：字符串和字节串的长度之和，每个容器元素另计 ITEM_OVERHEAD"""
+    total = 0
+    pending = [value]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, (str, bytes, bytearray)):
+            total += len(item)
+        elif isinstance(item, dict):
+            total += ITEM_OVERHEAD * len(item)
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            total += ITEM_OVERHEAD * len(item)
+            pending.extend(item)
+        else:
+            total += ITEM_OVERHEAD
+    return total
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """相同键的并发调用只执行一次"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._flights
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """执行 fn 或等待正在执行的相同调用，返回 (结果, 是否为共享的结果)；fn 抛出的异常同样共享"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+
+class ResultCache:
+    """短期结果缓存（stale-while-revalidate）
+
+    sizeof 不为空时按其估算的大小累计，总大小超过 max_bytes 时淘汰最久未使用的条目，单个超过 max_bytes 的结果不缓存。
+    """
+
+    def __init__(self, ttl: float, stale: float = 0.0, max_entries: int = MAX_RESULT_ENTRIES,
+                 clock: Callable[[], float] = time.monotonic, sizeof: Optional[Callable[[Any], int]] = None,
+                 max_bytes: int = MAX_RESULT_BYTES):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._clock = clock
+        # 键 -> (写入时间, 结果, 大小)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._purged_at = clock()
+        self.counts = {RESULT_FRESH: 0, RESULT_STALE: 0, RESULT_MISS: 0}
+        self.evictions = 0
+        self.expired = 0
+
+    def lookup(self, key: Hashable) -> Tuple[str, Optional[Any]]:
+        """返回 (fresh/stale/miss, 结果)"""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            state = RESULT_MISS
+            if entry is not None:
+                age = now - entry[0]
+                if age <= self.ttl:
+                    state = RESULT_FRESH
+                elif age <= self.ttl + self.stale:
+                    state = RESULT_STALE
+                else:
+                    self._remove(key)
+                    self.expired += 1
+            if state != RESULT_MISS:
+                self._entries.move_to_end(key)
+            self.counts[state] += 1
+            return state, entry[1] if state != RESULT_MISS else None
+
+    def is_fresh(self, key: Hashable) -> bool:
+        """是否有有效期内的结果（不计入命中统计，也不影响淘汰顺序）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and self._clock() - entry[0] <= self.ttl
+
+    def _remove(self, key: Hashable):
+        """（持有锁时调用）"""
+        self._size -= self._entries.pop(key)[2]
+
+    def _purge_expired(self, now: float):
+        """（持有锁时调用）每隔 ttl + stale 清除一次超过该时间、已不能再返回的条目"""
+        limit = self.ttl + self.stale
+        if now - self._purged_at < limit:
+            return
+        self._purged_at = now
+        for key in [key for key, entry in self._entries.items() if now - entry[0] > limit]:
+            self._remove(key)
+            self.expired += 1
+
+    def put(self, key: Hashable, value: Any):
+        size = self._sizeof(value) if self._sizeof is not None else 0
+        now = self._clock()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._purge_expired(now)
+            if self._sizeof is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (now, value, size)
+            self._size += size
+            while len(self._entries) > self.max_entries or (self._sizeof is not None and self._size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._size = 0
+            return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = sum(self.counts.values())
+            return {
+                'ttl': self.ttl,
+                'stale': self.stale,
+                'fresh_hits': self.counts[RESULT_FRESH],
+                'stale_hits': self.counts[RESULT_STALE],
+                'misses': self.counts[RESULT_MISS],
+                'hit_rate': round((lookups - self.counts[RESULT_MISS]) / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'size_bytes': self._size,
+                'evictions': self.evictions,
+                'expired': self.expired,
+            }
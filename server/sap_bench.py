@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""取数与生成图片的基准测试（使用 sap_fake.py 的离线SAP后端，无需SAP）
+
+对 get_order_details、get_production_order_data、generate_work_order_image 分别用 small/medium/huge
+三个规模的工单测量：
+  - round_trips：一次请求的RFC调用次数（与延迟无关，可以精确比较）
+  - p50_ms / p95_ms：多次执行的耗时分位数（包含模拟的网络延迟）
+  - peak_rss_kb：执行该场景的子进程的峰值内存
+每个场景在单独的子进程中执行，峰值内存互不影响；主数据缓存、渲染缓存和本地副本均关闭，每次都完整取数和渲染。
+
+与基线（sap_bench_baseline.json）比较：往返次数增加、p95 超过基线的 (1 + --latency-tolerance) 倍、
+峰值内存超过基线的 (1 + --rss-tolerance) 倍视为退化，退出码为1。
+
+用法：
+  python sap_bench.py                                   # 运行并与基线比较
+  python sap_bench.py --update-baseline                 # 运行并写入基线
+  python sap_bench.py --only get_order_details --sizes small,medium
+  python sap_bench.py --fixture recorded.json --orders small=123456,medium=234567,huge=345678
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import subprocess
+from typing import Dict, List, Optional
+
+from sap_fake import FIXTURE_SIZES, FakeConnection, Fixture, generate_fixture
+
+SCENARIOS = ('get_order_details', 'get_production_order_data', 'generate_work_order_image')
+# 各规模默认执行次数
+DEFAULT_RUNS = {'small': 20, 'medium': 10, 'huge': 3}
+# 默认每次RFC调用的模拟延迟（秒）
+DEFAULT_LATENCY = 0.005
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sap_bench_baseline.json')
+LATENCY_TOLERANCE = 0.5
+RSS_TOLERANCE = 0.25
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩法分位数"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+
+def _scenario_call(scenario: str, conn: FakeConnection, order_number: str):
+    """返回执行一次场景的函数；生成图片场景先取好数据，只测量渲染"""
+    if scenario == 'get_order_details':
+        from sap_rfc import get_order_details
+
+        def run():
+            result = get_order_details(order_number, conn)
+            if not result.get('success'):
+                raise RuntimeError(result.get('error'))
+        return run
+
+    from sap_rfc_extended import get_production_order_data
+    if scenario == 'get_production_order_data':
+        def run():
+            if get_production_order_data(conn, order_number) is None:
+                raise RuntimeError(f'未找到工单 {order_number}')
+        return run
+
+    from work_order_image import generate_work_order_image
+    order_data = get_production_order_data(conn, order_number)
+    if order_data is None:
+        raise RuntimeError(f'未找到工单 {order_number}')
+    return lambda: generate_work_order_image(order_data)
+
+
+def run_scenario(scenario: str, size: str, order_number: str, runs: int, fixture: Fixture,
+                 latency: float, latency_per_row: float) -> Dict:
+    """（在子进程中执行）运行一个场景 runs 次，返回往返次数、耗时分位数和峰值内存"""
+    import resource
+
+    conn = FakeConnection(fixture, latency, latency_per_row)
+    run = _scenario_call(scenario, conn, order_number)
+    timings = []
+    round_trips = 0
+    rows = 0
+    for _ in range(runs):
+        conn.reset_stats()
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+        round_trips = max(round_trips, conn.calls)
+        rows = max(rows, conn.rows_returned)
+    return {
+        'scenario': scenario,
+        'size': size,
+        'order_number': order_number,
+        'runs': runs,
+        'round_trips': round_trips,
+        'rows': rows,
+        'p50_ms': round(percentile(timings, 0.5), 1),
+        'p95_ms': round(percentile(timings, 0.95), 1),
+        # Linux 下单位为KB
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def _spawn_scenario(scenario: str, size: str, order_number: str, runs: int, fixture_path: Optional[str],
+                    latency: float, latency_per_row: float) -> Dict:
+    command = [sys.executable, os.path.abspath(__file__), '--child', scenario, size, order_number,
+               '--runs', str(runs), '--latency', str(latency), '--latency-per-row', str(latency_per_row)]
+    if fixture_path:
+        command += ['--fixture', fixture_path]
+    # 关闭缓存和本地副本，每次都完整取数和渲染
+    env = dict(os.environ, SAP_CACHE_DISABLED='1', SAP_RENDER_CACHE_DISABLED='1', SAP_REPLICA_DISABLED='1')
+    completed = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', env=env,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    if completed.returncode != 0:
+        lines = (completed.stderr or completed.stdout).strip().splitlines()
+        return {'scenario': scenario, 'size': size, 'error': lines[-1] if lines else '子进程失败'}
+    return json.loads(completed.stdout)
+
+
+def run_suite(scenarios: List[str], sizes: List[str], orders: Dict[str, str], runs: Optional[int],
+              fixture_path: Optional[str], latency: float, latency_per_row: float) -> Dict:
+    results = {}
+    for scenario in scenarios:
+        for size in sizes:
+            results[f'{scenario}/{size}'] = _spawn_scenario(
+                scenario, size, orders[size], runs or DEFAULT_RUNS.get(size, 5), fixture_path, latency,
+                latency_per_row)
+    return {
+        'settings': {'fixture': fixture_path or 'synthetic', 'latency': latency, 'latency_per_row': latency_per_row},
+        'results': results,
+    }
+
+
+def compare_with_baseline(report: Dict, baseline: Dict, latency_tolerance: float = LATENCY_TOLERANCE,
+                          rss_tolerance: float = RSS_TOLERANCE) -> List[str]:
+    """返回相对基线的退化项；基线的夹具或延迟设置不同时不比较耗时"""
+    regressions = []
+    same_settings = report['settings'] == baseline.get('settings')
+    for key, result in report['results'].items():
+        expected = baseline.get('results', {}).get(key)
+        if 'error' in result:
+            regressions.append(f"{key}: {result['error']}")
+            continue
+        if not expected or 'error' in expected:
+            continue
+        if result['round_trips'] > expected['round_trips']:
+            regressions.append(f"{key}: RFC往返次数 {expected['round_trips']} -> {result['round_trips']}")
+        if same_settings and result['p95_ms'] > expected['p95_ms'] * (1 + latency_tolerance):
+            regressions.append(f"{key}: p95 {expected['p95_ms']}ms -> {result['p95_ms']}ms")
+        if result['peak_rss_kb'] > expected['peak_rss_kb'] * (1 + rss_tolerance):
+            regressions.append(f"{key}: 峰值内存 {expected['peak_rss_kb']}KB -> {result['peak_rss_kb']}KB")
+    return regressions
+
+
+def _parse_orders(value: Optional[str]) -> Dict[str, str]:
+    orders = {size: spec[0] for size, spec in FIXTURE_SIZES.items()}
+    for item in (value or '').split(','):
+        if item.strip():
+            size, order_number = item.split('=', 1)
+            orders[size.strip()] = order_number.strip()
+    return orders
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='取数与生成图片的基准测试（离线SAP后端）')
+    parser.add_argument('--only', help='只运行这些场景（逗号分隔）：' + ','.join(SCENARIOS))
+    parser.add_argument('--sizes', default=','.join(FIXTURE_SIZES), help='工单规模（逗号分隔）')
+    parser.add_argument('--runs', type=int, help='每个场景执行次数（默认 small 20 / medium 10 / huge 3）')
+    parser.add_argument('--fixture', help='录制的夹具文件（默认使用构造数据）')
+    parser.add_argument('--orders', help='规模对应的工单号，例如 small=123456,medium=234567')
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help='每次RFC调用的模拟延迟（秒）')
+    parser.add_argument('--latency-per-row', type=float, default=0.0, help='每返回一行增加的模拟延迟（秒）')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='基线文件路径')
+    parser.add_argument('--update-baseline', action='store_true', help='把本次结果写入基线文件')
+    parser.add_argument('--latency-tolerance', type=float, default=LATENCY_TOLERANCE)
+    parser.add_argument('--rss-tolerance', type=float, default=RSS_TOLERANCE)
+    parser.add_argument('--child', nargs=3, metavar=('SCENARIO', 'SIZE', 'ORDER'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        scenario, size, order_number = args.child
+        fixture = Fixture.load(args.fixture) if args.fixture else generate_fixture()
+        print(json.dumps(run_scenario(scenario, size, order_number, args.runs, fixture, args.latency,
+                                      args.latency_per_row), ensure_ascii=False))
+        return 0
+
+    scenarios = args.only.split(',') if args.only else list(SCENARIOS)
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f'未知的场景: {",".join(unknown)}')
+    orders = _parse_orders(args.orders)
+    sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    missing = [s for s in sizes if s not in orders]
+    if missing:
+        parser.error(f'未指定规模对应的工单号: {",".join(missing)}')
+
+    report = run_suite(scenarios, sizes, orders, args.runs, args.fixture, args.latency, args.latency_per_row)
+    if args.update_baseline:
+        if os.path.exists(args.baseline):
+            # 只更新本次运行的场景，保留其他场景的基线
+            with open(args.baseline, encoding='utf-8') as f:
+                previous = json.load(f)
+            if previous.get('settings') == report['settings']:
+                report['results'] = {**previous.get('results', {}), **report['results']}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_with_baseline(report, json.load(f), args.latency_tolerance, args.rss_tolerance)
+    report['regressions'] = regressions
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.exit(main())
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""SAP连接的熔断与请求时限（sap_common.ConnectionPool 使用）
+
+SAP变慢或不可用时，每个请求都要等完连接超时，请求越积越多：
+  - request_deadline：为一次请求设置总耗时上限。等待连接池、每次RFC调用前检查剩余时间，并把剩余时间作为
+    RFC调用的超时传给连接；超时抛出 SapDeadlineExceeded。单个工单的请求默认 DEFAULT_REQUEST_DEADLINE，
+    多个工单的请求（批量取数和打印、需求汇总、班次预热）默认 BATCH_REQUEST_DEADLINE
+  - CircuitBreaker：连续失败（连接失败、通信错误、超时）达到阈值后断开，之后 reset_timeout 秒内的请求
+    直接抛出 SapUnavailable；到时后放行一次试探（ping 或新建连接），成功则恢复，失败则继续断开
+ABAP侧的业务错误（例如 TABLE_NOT_AVAILABLE、FIELD_NOT_VALID）说明SAP可用，不计入失败。
+"""
+
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+# 连续失败多少次后断开
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('SAP_BREAKER_FAILURES', '5'))
+# 断开后多少秒放行一次试探
+BREAKER_RESET_TIMEOUT = float(os.getenv('SAP_BREAKER_RESET_SECONDS', '30'))
+# 每个请求默认的总耗时上限（秒，0 表示不限制）
+DEFAULT_REQUEST_DEADLINE = float(os.getenv('SAP_REQUEST_DEADLINE', '60'))
+# 多个工单的请求默认的总耗时上限（秒，0 表示不限制）
+BATCH_REQUEST_DEADLINE = float(os.getenv('SAP_BATCH_DEADLINE', '600'))
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+# 表示SAP不可达的 pyrfc 异常类名（pyrfc 按需导入，这里按类名判断；sap_fake 的模拟异常使用相同类名）
+CONNECTION_ERROR_NAMES = ('CommunicationError', 'LogonError')
+
+
+class SapUnavailable(ConnectionError):
+    """熔断器断开期间不再连接SAP，直接失败"""
+
+
+class SapDeadlineExceeded(TimeoutError):
+    """请求超过了设置的总耗时上限"""
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """是否为SAP不可达或超时一类的错误（区别于ABAP侧的业务错误）"""
+    if isinstance(error, (SapUnavailable, SapDeadlineExceeded, ConnectionError, TimeoutError)):
+        return True
+    return any(cls.__name__ in CONNECTION_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def error_message(error: BaseException) -> str:
+    """返回给调用方的错误信息：连接故障加上"SAP连接失败"前缀，与"未找到工单数据"等数据问题区分开"""
+    if is_connection_error(error) and not isinstance(error, (SapUnavailable, SapDeadlineExceeded)):
+        return f'SAP连接失败: {error}'
+    return str(error)
+
+
+_deadline = contextvars.ContextVar('sap_request_deadline', default=None)
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float]):
+    """在 with 块内限制SAP访问的总耗时；seconds 为空或不大于0时不限制，嵌套时以更早的时限为准"""
+    if not seconds or seconds <= 0:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def deadline_remaining() -> Optional[float]:
+    """当前请求剩余的时间（秒），没有时限时返回 None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline(action: str) -> Optional[float]:
+    """时限已到时抛出 SapDeadlineExceeded，否则返回剩余时间"""
+    remaining = deadline_remaining()
+    if remaining is not None and remaining <= 0:
+        raise SapDeadlineExceeded(f'SAP请求超过时限（{action}）')
+    return remaining
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后断开，reset_timeout 秒后放行一次试探"""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self.last_error = None
+
+    def before_request(self) -> bool:
+        """请求取连接前调用：断开时抛出 SapUnavailable；返回 True 表示本次请求是半开状态下的试探"""
+        with self._lock:
+            now = self._clock()
+            if self.state == BREAKER_OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = BREAKER_HALF_OPEN
+                self.trial_started = 0.0
+            if self.state == BREAKER_HALF_OPEN:
+                # 同一时间只放行一个试探；试探迟迟没有结果时（例如请求没有用到SAP）允许下一个
+                if not self.trial_started or now - self.trial_started >= self.reset_timeout:
+                    self.trial_started = now
+                    return True
+            if self.state != BREAKER_CLOSED:
+                self.rejected += 1
+                raise SapUnavailable(f'SAP暂时不可用（连续失败{self.failures}次，'
+                                     f'{max(0.0, self.reset_timeout - (now - self.opened_at)):.0f}秒后重试）：'
+                                     f'{self.last_error}')
+            return False
+
+    def allow_call(self):
+        """已取得连接的请求每次调用前检查：断开期间同样直接失败（半开状态下的试探可以继续）"""
+        with self._lock:
+            if self.state == BREAKER_OPEN:
+                self.rejected += 1
+                raise SapUnavailable(f'SAP暂时不可用：{self.last_error}')
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = BREAKER_CLOSED
+            self.trial_started = 0.0
+
+    def record_failure(self, error: BaseException):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == BREAKER_HALF_OPEN or (self.state == BREAKER_CLOSED
+                                                   and self.failures >= self.failure_threshold):
+                self.state = BREAKER_OPEN
+                self.opened_at = self._clock()
+                self.trial_started = 0.0
+                self.trips += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'last_error': self.last_error,
+            }
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""SAP 主数据缓存（MAKT / MARA / CRHD / CRTX）
+
+物料描述、图号、工作中心编号/描述很少变化，没有必要每次请求都去SAP读取。
+缓存分两层：
+  - 进程内LRU（有上限，超出时淘汰最久未使用的条目）
+  - 本地SQLite文件，单独启动的多个Python进程之间共享命中
+每张表单独设置有效期（TTL），过期条目视为未命中。
+
+失效（invalidate）删除SQLite中的条目并递增该表的失效代数；各进程最多每 GENERATION_CHECK_SECONDS 秒检查一次代数，
+变化时丢弃进程内该表的条目，常驻进程不会在失效后继续使用旧数据。写入时定期清理SQLite中过期的条目，
+条目数超过 SAP_CACHE_MAX_DISK_ENTRIES 时先删除最早过期的。命中/未命中次数定期累加到SQLite，stats 命令显示所有进程的合计。
+
+同一个SQLite文件中还保存班次预热读取的报工单数据（WarmOrderCache，见 shift_prewarm.py），有效期 SAP_WARM_ORDER_TTL 秒
+（默认1800）：预热过的工单第一次打印时 get_production_order_data 直接使用，不再读取SAP。
+
+命令行：
+  python sap_cache.py stats
+  python sap_cache.py invalidate MAKT 000000000000200000
+  python sap_cache.py invalidate CRHD          # 清除整张表
+  python sap_cache.py invalidate ORDER_DATA [工单号]   # 清除预热的报工单数据
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# 每张表的缓存有效期（秒）
+MASTER_DATA_TTLS = {
+    "MAKT": 24 * 3600,
+    "MARA": 24 * 3600,
+    "CRHD": 7 * 24 * 3600,
+    "CRTX": 7 * 24 * 3600,
+}
+# SAP中查不到的键只缓存较短时间，避免新建主数据长时间不可见
+NEGATIVE_TTL = 300
+# 进程内最多缓存的条目数
+MAX_MEMORY_ENTRIES = int(os.getenv('SAP_CACHE_MAX_ENTRIES', '5000'))
+# SQLite中最多保留的条目数
+MAX_DISK_ENTRIES = int(os.getenv('SAP_CACHE_MAX_DISK_ENTRIES', '200000'))
+# 平均每写入多少次清理一次过期条目（起始位置随机，只写入少量条目的命令行进程也会分摊清理）
+PURGE_EVERY_PUTS = 500
+# 进程内条目最多在失效后继续使用的秒数（检查其他进程失效代数的间隔）
+GENERATION_CHECK_SECONDS = 2.0
+# 命中/未命中次数累加到SQLite的间隔（秒），进程退出时也会写入
+STATS_FLUSH_SECONDS = 10.0
+STAT_NAMES = ('hits', 'misses', 'evictions')
+# 班次预热保存的报工单数据的有效期（秒，0为不保存）
+WARM_ORDER_TTL = float(os.getenv('SAP_WARM_ORDER_TTL', '1800'))
+# 命令行 invalidate 使用的表名
+WARM_ORDER_TABLE = 'ORDER_DATA'
+
+DEFAULT_CACHE_PATH = os.getenv(
+    'SAP_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'sap_master_data.sqlite3')
+)
+
+
+class MasterDataCache:
+    """按 (表, 字段/条件, 键) 缓存 RFC_READ_TABLE 的行"""
+
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE_PATH, max_entries: int = MAX_MEMORY_ENTRIES,
+                 ttls: Optional[Dict[str, int]] = None, max_disk_entries: int = MAX_DISK_ENTRIES,
+                 purge_every: int = PURGE_EVERY_PUTS):
+        self.ttls = dict(MASTER_DATA_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.purge_every = max(1, purge_every)
+        self._puts_until_purge = random.randint(1, self.purge_every)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 尚未累加到SQLite的计数
+        self._unflushed = dict.fromkeys(STAT_NAMES, 0)
+        self._stats_flushed_at = time.monotonic()
+        # 表 -> 已知的失效代数
+        self._generations = {}
+        self._generations_checked_at = 0.0
+        if path:
+            self._open_db(path)
+
+    def _open_db(self, path: str):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS master_data ("
+                " tbl TEXT NOT NULL, variant TEXT NOT NULL, k TEXT NOT NULL,"
+                " rows TEXT NOT NULL, expires_at REAL NOT NULL,"
+                " PRIMARY KEY (tbl, k, variant))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS master_data_expires ON master_data (expires_at)")
+            db.execute("CREATE TABLE IF NOT EXISTS invalidations (tbl TEXT PRIMARY KEY, generation INTEGER NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._generations = dict(db.execute("SELECT tbl, generation FROM invalidations"))
+            self._generations_checked_at = time.monotonic()
+            self._db = db
+        except (sqlite3.Error, OSError):
+            # 磁盘不可用时退化为纯内存缓存
+            self._db = None
+
+    def is_cached_table(self, table: str) -> bool:
+        return table in self.ttls
+
+    def _check_generations(self):
+        """（持有锁时调用）其他进程失效了某张表时，丢弃进程内该表的条目"""
+        if self._db is None or time.monotonic() - self._generations_checked_at < GENERATION_CHECK_SECONDS:
+            return
+        try:
+            generations = dict(self._db.execute("SELECT tbl, generation FROM invalidations"))
+        except sqlite3.Error:
+            return
+        self._generations_checked_at = time.monotonic()
+        changed = {table for table, generation in generations.items() if self._generations.get(table) != generation}
+        if changed:
+            for cache_key in [k for k in self._memory if k[0] in changed]:
+                del self._memory[cache_key]
+        self._generations = generations
+
+    def _count(self, name: str):
+        """（持有锁时调用）计数，并定期累加到SQLite"""
+        setattr(self, name, getattr(self, name) + 1)
+        self._unflushed[name] += 1
+        if time.monotonic() - self._stats_flushed_at >= STATS_FLUSH_SECONDS:
+            self._flush_stats()
+
+    def _flush_stats(self):
+        """（持有锁时调用）把未写入的计数累加到SQLite"""
+        self._stats_flushed_at = time.monotonic()
+        pending = [(name, value) for name, value in self._unflushed.items() if value]
+        if self._db is None or not pending:
+            return
+        try:
+            self._db.executemany(
+                "INSERT INTO cache_stats (name, value) VALUES (?, ?)"
+                " ON CONFLICT (name) DO UPDATE SET value = value + excluded.value", pending)
+        except sqlite3.Error:
+            return
+        self._unflushed = dict.fromkeys(STAT_NAMES, 0)
+
+    def flush_stats(self):
+        with self._lock:
+            self._flush_stats()
+
+    def get(self, table: str, variant: str, key: str) -> Tuple[bool, Optional[List[Dict]]]:
+        """返回 (是否命中, 行列表)"""
+        now = time.time()
+        cache_key = (table, variant, key)
+        with self._lock:
+            self._check_generations()
+            entry = self._memory.get(cache_key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(cache_key)
+                    self._count('hits')
+                    return True, entry[1]
+                del self._memory[cache_key]
+
+            if self._db is not None:
+                try:
+                    found = self._db.execute(
+                        "SELECT rows, expires_at FROM master_data WHERE tbl = ? AND k = ? AND variant = ?",
+                        (table, key, variant)
+                    ).fetchone()
+                except sqlite3.Error:
+                    found = None
+                if found and found[1] > now:
+                    rows = json.loads(found[0])
+                    self._remember(cache_key, found[1], rows)
+                    self._count('hits')
+                    return True, rows
+
+            self._count('misses')
+            return False, None
+
+    def put(self, table: str, variant: str, key: str, rows: List[Dict]):
+        ttl = self.ttls.get(table, 0) if rows else min(self.ttls.get(table, 0), NEGATIVE_TTL)
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._remember((table, variant, key), expires_at, rows)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO master_data (tbl, variant, k, rows, expires_at) VALUES (?, ?, ?, ?, ?)",
+                        (table, variant, key, json.dumps(rows, ensure_ascii=False), expires_at)
+                    )
+                except sqlite3.Error:
+                    return
+                self._puts_until_purge -= 1
+                if self._puts_until_purge <= 0:
+                    self._puts_until_purge = self.purge_every
+                    self._purge()
+
+    def _remember(self, cache_key, expires_at, rows):
+        self._memory[cache_key] = (expires_at, rows)
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._count('evictions')
+
+    def invalidate(self, table: str, key: Optional[str] = None) -> int:
+        """删除某张表某个键（所有字段组合）的缓存；key 为空时清除整张表。返回删除的条目数（SQLite，无SQLite时为内存）
+
+        同时递增该表的失效代数，其他进程在 GENERATION_CHECK_SECONDS 秒内丢弃进程内该表的条目。
+        """
+        with self._lock:
+            stale = [k for k in self._memory if k[0] == table and (key is None or k[2] == key)]
+            for k in stale:
+                del self._memory[k]
+            if self._db is None:
+                return len(stale)
+            db = self._db
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    if key is None:
+                        removed = db.execute("DELETE FROM master_data WHERE tbl = ?", (table,)).rowcount
+                    else:
+                        removed = db.execute("DELETE FROM master_data WHERE tbl = ? AND k = ?", (table, key)).rowcount
+                    db.execute("INSERT INTO invalidations (tbl, generation) VALUES (?, 1)"
+                               " ON CONFLICT (tbl) DO UPDATE SET generation = generation + 1", (table,))
+                    generation = db.execute("SELECT generation FROM invalidations WHERE tbl = ?", (table,)).fetchone()[0]
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error:
+                return len(stale)
+            # 本进程已删除内存中的条目，不需要在下次检查时再丢弃整张表
+            self._generations[table] = generation
+            return removed
+
+    def _purge(self) -> int:
+        """（持有锁时调用）删除SQLite中已过期的条目，条目数超过 max_disk_entries 时再删除最早过期的"""
+        try:
+            removed = self._db.execute("DELETE FROM master_data WHERE expires_at <= ?", (time.time(),)).rowcount
+            excess = self._db.execute("SELECT COUNT(*) FROM master_data").fetchone()[0] - self.max_disk_entries
+            if excess > 0:
+                removed += self._db.execute(
+                    "DELETE FROM master_data WHERE rowid IN"
+                    " (SELECT rowid FROM master_data ORDER BY expires_at LIMIT ?)", (excess,)).rowcount
+            return removed
+        except sqlite3.Error:
+            return 0
+
+    def purge_expired(self) -> int:
+        """清理SQLite中已过期（及超出条目数上限）的条目，返回删除的条目数；写入时也会定期执行"""
+        if self._db is None:
+            return 0
+        with self._lock:
+            return self._purge()
+
+    def stats(self) -> Dict:
+        """本进程的计数；使用SQLite时 all_processes 为所有进程累计的计数（含本进程）"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'max_entries': self.max_entries,
+                'persistent': self._db is not None,
+            }
+            if self._db is not None:
+                self._flush_stats()
+                try:
+                    stats['disk_entries'] = self._db.execute("SELECT COUNT(*) FROM master_data").fetchone()[0]
+                    stats['max_disk_entries'] = self.max_disk_entries
+                    totals = dict.fromkeys(STAT_NAMES, 0)
+                    totals.update(self._db.execute("SELECT name, value FROM cache_stats"))
+                except sqlite3.Error:
+                    pass
+                else:
+                    lookups = totals['hits'] + totals['misses']
+                    totals['hit_rate'] = round(totals['hits'] / lookups, 4) if lookups else 0.0
+                    stats['all_processes'] = totals
+            return stats
+
+
+class WarmOrderCache:
+    """班次预热读取的报工单数据（get_production_order_data 的结果），按工单号（12位）保存在SQLite中，多个进程共享"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = WARM_ORDER_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS warm_orders ("
+                         " aufnr TEXT PRIMARY KEY, order_data TEXT NOT NULL, expires_at REAL NOT NULL)")
+
+    def put_many(self, orders_data: Dict[str, Dict]) -> int:
+        """保存多个工单的数据（没有数据的工单跳过），同时删除已过期的条目；返回保存的工单数"""
+        expires_at = time.time() + self.ttl
+        rows = [(str(n).zfill(12), json.dumps(d, ensure_ascii=False), expires_at) for n, d in orders_data.items() if d]
+        with self._lock:
+            try:
+                self._db.execute("DELETE FROM warm_orders WHERE expires_at <= ?", (time.time(),))
+                self._db.executemany("INSERT OR REPLACE INTO warm_orders (aufnr, order_data, expires_at)"
+                                     " VALUES (?, ?, ?)", rows)
+            except sqlite3.Error:
+                return 0
+        return len(rows)
+
+    def get_many(self, order_numbers: List[str]) -> Dict[str, Dict]:
+        """有效期内的工单数据，返回 {调用方给出的工单号: 工单数据}"""
+        keys = {str(n).zfill(12): n for n in order_numbers}
+        if not keys:
+            return {}
+        with self._lock:
+            try:
+                found = self._db.execute(
+                    f"SELECT aufnr, order_data FROM warm_orders WHERE aufnr IN ({', '.join('?' * len(keys))})"
+                    f" AND expires_at > ?", list(keys) + [time.time()]).fetchall()
+            except sqlite3.Error:
+                return {}
+        return {keys[aufnr]: json.loads(data) for aufnr, data in found}
+
+    def invalidate(self, order_number: Optional[str] = None) -> int:
+        with self._lock:
+            try:
+                if order_number is None:
+                    return self._db.execute("DELETE FROM warm_orders").rowcount
+                return self._db.execute("DELETE FROM warm_orders WHERE aufnr = ?",
+                                        (str(order_number).zfill(12),)).rowcount
+            except sqlite3.Error:
+                return 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            try:
+                entries = self._db.execute("SELECT COUNT(*) FROM warm_orders WHERE expires_at > ?",
+                                           (time.time(),)).fetchone()[0]
+            except sqlite3.Error:
+                entries = 0
+        return {'ttl': self.ttl, 'entries': entries}
+
+
+_master_data_cache = None
+_master_data_cache_lock = threading.Lock()
+_warm_order_cache = None
+
+
+def get_master_data_cache() -> Optional[MasterDataCache]:
+    """进程内共享的主数据缓存；设置 SAP_CACHE_DISABLED=1 时返回 None"""
+    global _master_data_cache
+    if os.getenv('SAP_CACHE_DISABLED') == '1':
+        return None
+    with _master_data_cache_lock:
+        if _master_data_cache is None:
+            _master_data_cache = MasterDataCache()
+            atexit.register(_master_data_cache.flush_stats)
+        return _master_data_cache
+
+
+def get_warm_order_cache() -> Optional[WarmOrderCache]:
+    """进程内共享的预热工单数据缓存；设置 SAP_CACHE_DISABLED=1 或 SAP_WARM_ORDER_TTL=0 时返回 None"""
+    global _warm_order_cache
+    if os.getenv('SAP_CACHE_DISABLED') == '1' or WARM_ORDER_TTL <= 0:
+        return None
+    with _master_data_cache_lock:
+        if _warm_order_cache is None:
+            try:
+                _warm_order_cache = WarmOrderCache()
+            except (sqlite3.Error, OSError):
+                return None
+        return _warm_order_cache
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    cache = MasterDataCache()
+    if len(sys.argv) >= 3 and sys.argv[1] == 'invalidate':
+        table = sys.argv[2].upper()
+        key = sys.argv[3] if len(sys.argv) >= 4 else None
+        removed = WarmOrderCache().invalidate(key) if table == WARM_ORDER_TABLE else cache.invalidate(table, key)
+        print(json.dumps({'success': True, 'table': table, 'key': key, 'removed': removed}, ensure_ascii=False))
+    elif len(sys.argv) == 2 and sys.argv[1] == 'stats':
+        purged = cache.purge_expired()
+        stats = cache.stats()
+        # 本进程没有查询过缓存，输出所有进程累计的计数
+        stats.update(stats.pop('all_processes', {}))
+        print(json.dumps({**stats, 'purged': purged, 'warm_orders': WarmOrderCache().stats()}, ensure_ascii=False))
+    else:
+        print(json.dumps({'success': False, 'error': '用法: sap_cache.py stats | invalidate 表名 [键]'}, ensure_ascii=False))
+        sys.exit(1)
@@ -0,0 +1,574 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""SAP RFC 公共配置与连接工具（sap_rfc.py / sap_rfc_extended.py / sap_worker.py 共用）"""
+
+from __future__ import annotations
+
+import os
+import math
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from dotenv import load_dotenv
+from sap_breaker import CircuitBreaker, SapDeadlineExceeded, check_deadline, deadline_remaining, is_connection_error
+from sap_cache import get_master_data_cache
+from sap_decoder import get_decoder
+from sap_metrics import call_rfc, in_current_context, record_handled_error
+
+if TYPE_CHECKING:
+    from pyrfc import Connection
+
+# 加载环境变量（sap_rfc.py / sap_rfc_extended.py 通过导入本模块加载，不再各自重复加载）
+load_dotenv()
+
+# SAP连接配置
+SAP_CONFIG = {
+    "ashost": "192.168.202.40",
+    "sysnr": "00",
+    "client": "100",
+    "user": os.getenv('SAP_RFC_USERNAME'),
+    "passwd": os.getenv('SAP_RFC_PASSWORD'),
+    "lang": "ZH"
+}
+
+# RFC_READ_TABLE 的 OPTIONS 每行最多72个字符
+OPTIONS_LINE_LENGTH = 72
+# 一次 OR 查询最多携带的键数量，避免 WHERE 条件过长
+IN_QUERY_CHUNK_SIZE = 50
+# 分页读取时每次 RFC_READ_TABLE 返回的最大行数
+PAGE_SIZE = int(os.getenv('SAP_RFC_PAGE_SIZE', '5000'))
+# 单次取数内并发执行RFC读取的最大连接数（1 表示串行）
+DEFAULT_CONCURRENCY = int(os.getenv('SAP_RFC_CONCURRENCY', '1'))
+# 进程内连接池最多同时打开的SAP连接数
+DEFAULT_POOL_SIZE = int(os.getenv('SAP_RFC_POOL_SIZE', '4'))
+# 空闲超过多少秒的连接在复用前先 ping 一次（SAP或防火墙可能已断开长时间空闲的连接）
+PING_AFTER_IDLE = float(os.getenv('SAP_RFC_PING_AFTER', '60'))
+
+
+def open_connection() -> Connection:
+    """打开一个新的SAP RFC连接（失败时抛出异常）
+
+    pyrfc 在第一次连接时才导入，只处理已读取数据（如生成图片）的调用不需要加载SAP NW RFC库。
+    设置 SAP_FAKE_FIXTURE 时返回按该夹具回放数据的离线连接（见 sap_fake.py），不连接SAP。
+    """
+    fixture_path = os.getenv('SAP_FAKE_FIXTURE')
+    if fixture_path:
+        from sap_fake import open_fake_connection
+        return open_fake_connection(fixture_path)
+    from pyrfc import Connection
+    return Connection(**SAP_CONFIG)
+
+
+class PooledConnection:
+    """连接池借出的连接（接口与 pyrfc.Connection 相同）
+
+    每次调用前检查熔断器和请求时限（见 sap_breaker.py），把剩余时间作为RFC调用的超时；
+    通信失败或超时计入熔断器，并在归还时关闭该连接。close() 把连接归还连接池而不是关闭，
+    因此可以像 open_connection() 的连接一样用在 with 语句中。
+    """
+
+    def __init__(self, pool: ConnectionPool, conn: Connection):
+        self.pool = pool
+        self.conn = conn
+        self.broken = False
+        self.released = False
+
+    @property
+    def alive(self) -> bool:
+        return not self.broken and getattr(self.conn, 'alive', True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.pool.release(self, discard=exc_type is not None)
+
+    def _guarded(self, action: str, method: Callable, *args, **kwargs):
+        breaker = self.pool.breaker
+        breaker.allow_call()
+        try:
+            result = method(*args, **kwargs)
+        except Exception as e:
+            remaining = deadline_remaining()
+            expired = remaining is not None and remaining <= 0
+            if not (expired or is_connection_error(e)):
+                # ABAP侧的业务错误说明SAP可用
+                breaker.record_success()
+                raise
+            self.broken = True
+            breaker.record_failure(e)
+            if expired and not isinstance(e, SapDeadlineExceeded):
+                self.pool.count_deadline_exceeded()
+                raise SapDeadlineExceeded(f'SAP请求超过时限（{action}）: {e}') from e
+            raise
+        breaker.record_success()
+        return result
+
+    def call(self, func_name: str, **params) -> Dict:
+        remaining = self.pool.check_deadline(f'调用 {func_name}')
+        if remaining is not None:
+            # pyrfc 超时后取消调用并抛出异常，该连接随后不再可用；向上取整到毫秒，取消时时限一定已到，
+            # 按超过时限（SapDeadlineExceeded）处理而不是通信错误
+            params['options'] = {**params.get('options', {}), 'timeout': math.ceil(remaining * 1000) / 1000}
+        return self._guarded(f'调用 {func_name}', self.conn.call, func_name, **params)
+
+    def ping(self):
+        self.pool.check_deadline('检查SAP连接')
+        return self._guarded('检查SAP连接', self.conn.ping)
+
+    def close(self):
+        self.pool.release(self)
+
+
+class ConnectionPool:
+    """复用已建立的SAP连接，最多同时打开 max_size 个
+
+    - 空闲超过 ping_after 秒的连接在复用前先 ping，失败的关闭后换一个（或新建）
+    - 等待空闲连接的时间受请求时限限制（sap_breaker.request_deadline）
+    - 连接失败、通信错误和超时计入熔断器，熔断期间直接抛出 SapUnavailable 而不再连接SAP
+    - warm_up() 预先建立连接（常驻进程启动时在后台调用），第一个请求不必等待登录
+    """
+
+    def __init__(self, connect: Callable = open_connection, max_size: int = DEFAULT_POOL_SIZE,
+                 breaker: Optional[CircuitBreaker] = None, ping_after: float = PING_AFTER_IDLE):
+        self._connect = connect
+        # 空闲连接及其归还时间 (连接, time.monotonic())
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.max_size = max_size
+        self.breaker = breaker or CircuitBreaker()
+        self.ping_after = ping_after
+        self.created = 0
+        self.discarded = 0
+        self.ping_failures = 0
+        self.deadline_exceeded = 0
+        self.in_use = 0
+
+    def count_deadline_exceeded(self):
+        with self._lock:
+            self.deadline_exceeded += 1
+
+    def check_deadline(self, action: str) -> Optional[float]:
+        """sap_breaker.check_deadline，同时统计超时次数"""
+        try:
+            return check_deadline(action)
+        except SapDeadlineExceeded:
+            self.count_deadline_exceeded()
+            raise
+
+    def acquire(self, block: bool = True) -> Optional[PooledConnection]:
+        """取出一个空闲连接（没有时新建）；block 为 False 且连接数已满时返回 None
+
+        熔断期间抛出 SapUnavailable，等待超过请求时限时抛出 SapDeadlineExceeded。
+        """
+        trial = self.breaker.before_request()
+        remaining = self.check_deadline('等待SAP连接')
+        if not block:
+            acquired = self._slots.acquire(blocking=False)
+        else:
+            acquired = self._slots.acquire(timeout=max(0.0, remaining) if remaining is not None else None)
+        if not acquired:
+            if block:
+                self.count_deadline_exceeded()
+                raise SapDeadlineExceeded(f'SAP请求超过时限（等待空闲连接，连接池共{self.max_size}个连接均在使用中）')
+            return None
+        try:
+            conn = self._checkout(trial)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+        return PooledConnection(self, conn)
+
+    def _checkout(self, trial: bool) -> Connection:
+        """取出可用的空闲连接；熔断器半开时的试探请求和空闲较久的连接先 ping"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, idle_since = self._idle.pop()
+            if not trial and time.monotonic() - idle_since < self.ping_after:
+                return conn
+            try:
+                self.check_deadline('检查SAP连接')
+                conn.ping()
+            except SapDeadlineExceeded:
+                _close_quietly(conn)
+                raise
+            except Exception as e:
+                with self._lock:
+                    self.ping_failures += 1
+                    self.discarded += 1
+                _close_quietly(conn)
+                self.breaker.record_failure(e)
+                # 试探失败或连续失败达到阈值后熔断器断开，不再继续尝试
+                self.breaker.allow_call()
+                continue
+            self.breaker.record_success()
+            return conn
+        self.check_deadline('连接SAP')
+        try:
+            conn = self._connect()
+        except Exception as e:
+            self.breaker.record_failure(e)
+            raise
+        self.breaker.record_success()
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def release(self, conn: PooledConnection, discard: bool = False):
+        """归还连接；出错或已断开的连接直接关闭（重复归还时忽略）"""
+        with self._lock:
+            if conn.released:
+                return
+            conn.released = True
+            self.in_use -= 1
+            keep = not discard and conn.alive
+            if keep:
+                self._idle.append((conn.conn, time.monotonic()))
+            else:
+                self.discarded += 1
+        if not keep:
+            _close_quietly(conn.conn)
+        self._slots.release()
+
+    def try_acquire(self, count: int) -> List[PooledConnection]:
+        """不等待地取出最多 count 个连接，取不到或新建失败时返回已取得的部分"""
+        conns = []
+        for _ in range(count):
+            try:
+                conn = self.acquire(block=False)
+            except Exception:
+                break
+            if conn is None:
+                break
+            conns.append(conn)
+        return conns
+
+    @contextmanager
+    def connection(self) -> Iterator[PooledConnection]:
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            self.release(conn, discard=True)
+            raise
+        else:
+            self.release(conn)
+
+    def warm_up(self, count: Optional[int] = None) -> int:
+        """预先建立连接放入空闲列表（默认建满 max_size 个），返回可用的连接数；连接失败时停止"""
+        conns = self.try_acquire(self.max_size if count is None else min(count, self.max_size))
+        for conn in conns:
+            self.release(conn)
+        return len(conns)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = {
+                'max_size': self.max_size,
+                'idle': len(self._idle),
+                'in_use': self.in_use,
+                'created': self.created,
+                'discarded': self.discarded,
+                'ping_failures': self.ping_failures,
+                'deadline_exceeded': self.deadline_exceeded,
+            }
+        stats['breaker'] = self.breaker.stats()
+        return stats
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            _close_quietly(conn)
+
+
+def _close_quietly(conn):
+    if conn is None:
+        return
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
+
+
+def get_connection_pool() -> ConnectionPool:
+    """进程内共享的连接池（常驻进程通过 set_connection_pool 指定大小）"""
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is None:
+            _connection_pool = ConnectionPool()
+            atexit.register(_connection_pool.close)
+        return _connection_pool
+
+
+def set_connection_pool(pool: ConnectionPool):
+    global _connection_pool
+    with _connection_pool_lock:
+        _connection_pool = pool
+
+
+def pooled_connection() -> PooledConnection:
+    """从进程内共享的连接池借出一个连接，close()（或 with 语句结束）时归还"""
+    return get_connection_pool().acquire()
+
+
+def run_parallel(conn: Connection, tasks: List[Callable[[Connection], Any]], concurrency: Optional[int] = None,
+                 pool: Optional[ConnectionPool] = None) -> List[Any]:
+    """执行一组互不依赖的读取任务，结果按任务顺序返回
+
+    concurrency > 1 时从连接池额外借用连接，每个线程独占一个连接（pyrfc连接不能跨线程同时使用）；
+    连接池已满时以借到的连接数执行。任一任务出错后不再启动剩余任务，并在所有线程结束后抛出第一个错误。
+    """
+    concurrency = DEFAULT_CONCURRENCY if concurrency is None else concurrency
+    if concurrency <= 1 or len(tasks) <= 1:
+        return [task(conn) for task in tasks]
+
+    pool = pool or get_connection_pool()
+    extra_conns = pool.try_acquire(min(concurrency, len(tasks)) - 1)
+    results = [None] * len(tasks)
+    errors = []
+    broken = set()
+    lock = threading.Lock()
+    next_index = [0]
+
+    def worker(worker_conn):
+        while True:
+            with lock:
+                if errors or next_index[0] >= len(tasks):
+                    return
+                index = next_index[0]
+                next_index[0] += 1
+            try:
+                results[index] = tasks[index](worker_conn)
+            except BaseException as e:
+                with lock:
+                    errors.append(e)
+                    broken.add(id(worker_conn))
+                return
+
+    # 线程沿用当前请求的跟踪上下文（sap_metrics），并发读取的调用同样记录在请求跟踪中
+    threads = [threading.Thread(target=in_current_context(worker), args=(c,), daemon=True) for c in extra_conns]
+    try:
+        for thread in threads:
+            thread.start()
+        worker(conn)
+        for thread in threads:
+            thread.join()
+    finally:
+        for extra in extra_conns:
+            pool.release(extra, discard=id(extra) in broken)
+
+    if errors:
+        raise errors[0]
+    return results
+
+
+class SapTableTruncated(Exception):
+    """读取结果超过调用方指定的 max_rows，数据不完整"""
+
+    def __init__(self, table_name: str, max_rows: int):
+        super().__init__(f"{table_name} 返回的数据超过 {max_rows} 行，结果不完整")
+        self.table_name = table_name
+        self.max_rows = max_rows
+
+
+def _build_options(where_clause: Union[str, List[str]]) -> List[Dict]:
+    if isinstance(where_clause, str):
+        return [{"TEXT": where_clause}] if where_clause else []
+    return [{"TEXT": line} for line in where_clause]
+
+
+class SapTablePages:
+    """按 ROWSKIPS/ROWCOUNT 分页调用 RFC_READ_TABLE，逐页产出原始结果 {"DATA": [...], "FIELDS": [...]}
+
+    至少产出一页（可能为空）。指定 max_rows 时最多读取 max_rows 行：还有更多数据时
+    truncated 为 True，由调用方决定报错还是接受部分结果，不会静默截断。
+    """
+
+    def __init__(self, conn: Connection, table_name: str, fields: List[str], where_clause: Union[str, List[str]],
+                 page_size: Optional[int] = None, max_rows: Optional[int] = None, delimiter: str = "|"):
+        self.conn = conn
+        self.table_name = table_name
+        self.fields = fields
+        self.options = _build_options(where_clause)
+        self.page_size = page_size or PAGE_SIZE
+        self.max_rows = max_rows or None
+        self.delimiter = delimiter
+        self.rows_read = 0
+        self.pages = 0
+        self.truncated = False
+
+    def __iter__(self):
+        while True:
+            rowcount = self.page_size
+            if self.max_rows is not None:
+                # 多请求一行，用于判断是否还有未读取的数据
+                rowcount = min(rowcount, self.max_rows - self.rows_read + 1)
+            params = {
+                "QUERY_TABLE": self.table_name,
+                "FIELDS": [{"FIELDNAME": f} for f in self.fields],
+                "OPTIONS": self.options,
+                "ROWSKIPS": self.rows_read,
+                "ROWCOUNT": rowcount,
+            }
+            if self.delimiter:
+                params["DELIMITER"] = self.delimiter
+            result = call_rfc(self.conn, "RFC_READ_TABLE", **params)
+            data = result["DATA"] or []
+            if self.max_rows is not None and self.rows_read + len(data) > self.max_rows:
+                data = data[:self.max_rows - self.rows_read]
+                self.truncated = True
+            self.rows_read += len(data)
+            self.pages += 1
+            yield {"DATA": data, "FIELDS": result["FIELDS"]}
+            if self.truncated or len(data) < rowcount:
+                return
+
+
+def iter_sap_table(conn: Connection, table_name: str, fields: List[str], where_clause: Union[str, List[str]],
+                   page_size: Optional[int] = None, max_rows: Optional[int] = None) -> Iterator[Dict]:
+    """逐行产出SAP表数据，每次只在内存中保留一页；超过 max_rows 时抛出 SapTableTruncated"""
+    pages = SapTablePages(conn, table_name, fields, where_clause, page_size, max_rows)
+    for page in pages:
+        if page["DATA"]:
+            yield from get_decoder(page["FIELDS"]).decode_dicts(page["DATA"])
+    if pages.truncated:
+        raise SapTableTruncated(table_name, max_rows)
+
+
+def fetch_sap_table(conn: Connection, table_name: str, fields: List[str], where_clause: Union[str, List[str]], max_rows: Optional[int] = None) -> List[Dict]:
+    """读取SAP表的全部匹配数据（分页），出错时抛出异常（where_clause 可以是单个条件字符串，也可以是已拆分好的 OPTIONS 行列表）
+
+    max_rows 为空或0时读取全部；指定 max_rows 且数据更多时抛出 SapTableTruncated。
+    """
+    return list(iter_sap_table(conn, table_name, fields, where_clause, max_rows=max_rows))
+
+
+def read_sap_table(conn: Connection, table_name: str, fields: List[str], where_clause: Union[str, List[str]], max_rows: Optional[int] = None) -> List[Dict]:
+    """读取SAP表数据，出错时返回空列表
+
+    结果被截断（SapTableTruncated）以及SAP不可达、超时、熔断（sap_breaker.is_connection_error）时仍抛出异常，
+    避免把连接故障当作"没有数据"。
+    """
+    try:
+        return fetch_sap_table(conn, table_name, fields, where_clause, max_rows)
+    except SapTableTruncated:
+        raise
+    except Exception as e:
+        if is_connection_error(e):
+            raise
+        record_handled_error('read_sap_table', table_name, e)
+        return []
+
+
+def build_in_options(field: str, values: List[str], extra_where: str = "") -> List[str]:
+    """把 "field 等于 values 中任意一个" 拆成 RFC_READ_TABLE 的 OPTIONS 行（每行不超过72个字符）"""
+    tokens = [f"{extra_where} AND (" if extra_where else "("]
+    for i, value in enumerate(values):
+        condition = f"{field} = '{value}'"
+        tokens.append(condition if i == 0 else f"OR {condition}")
+    tokens.append(")")
+
+    lines = []
+    current = ""
+    for token in tokens:
+        if current and len(current) + 1 + len(token) > OPTIONS_LINE_LENGTH:
+            lines.append(current)
+            current = token
+        else:
+            current = f"{current} {token}" if current else token
+    if current:
+        lines.append(current)
+    return lines
+
+
+def read_sap_table_in(conn: Connection, table_name: str, fields: List[str], key_field: str, values: Iterable[str],
+                      extra_where: str = "", chunk_size: int = IN_QUERY_CHUNK_SIZE) -> List[Dict]:
+    """按 key_field 批量读取多个键的数据（fields 中需包含 key_field），值过多时分块查询，不限制返回行数
+
+    主数据表（见 sap_cache.MASTER_DATA_TTLS）先查缓存，只向SAP读取未命中的键。
+    """
+    unique_values = list(dict.fromkeys(v for v in values if v))
+    cache = get_master_data_cache()
+    if cache is None or not cache.is_cached_table(table_name):
+        rows = []
+        for start in range(0, len(unique_values), chunk_size):
+            chunk = unique_values[start:start + chunk_size]
+            rows.extend(read_sap_table(conn, table_name, fields, build_in_options(key_field, chunk, extra_where)))
+        return rows
+
+    variant = ",".join(fields) + "|" + extra_where
+    rows_by_key = {}
+    missing = []
+    for value in unique_values:
+        hit, cached_rows = cache.get(table_name, variant, value)
+        if hit:
+            rows_by_key[value] = cached_rows
+        else:
+            missing.append(value)
+
+    for start in range(0, len(missing), chunk_size):
+        chunk = missing[start:start + chunk_size]
+        try:
+            fetched = fetch_sap_table(conn, table_name, fields, build_in_options(key_field, chunk, extra_where))
+        except Exception as e:
+            # 与 read_sap_table 一致：出错的键按无数据处理，但不写入缓存；连接故障仍抛出
+            if is_connection_error(e):
+                raise
+            record_handled_error('read_sap_table_in', table_name, e)
+            continue
+        fetched_by_key = group_rows(fetched, key_field)
+        for value in chunk:
+            key_rows = fetched_by_key.get((value,), [])
+            cache.put(table_name, variant, value, key_rows)
+            rows_by_key[value] = key_rows
+
+    return [row for value in unique_values for row in rows_by_key.get(value, [])]
+
+
+def orders_in_window(conn: Connection, werks: Optional[str], date_from: str, date_to: str) -> List[str]:
+    """计划开始日期（AFKO.GSTRP）在范围内、未删除（且属于工厂 werks）的工单号（带前导零）"""
+    aufnrs = []
+    for page in SapTablePages(conn, 'AFKO', ['AUFNR'], f"GSTRP >= '{date_from}' AND GSTRP <= '{date_to}'"):
+        if page['DATA']:
+            aufnrs.extend(row[0] for row in get_decoder(page['FIELDS']).decode_tuples(page['DATA']))
+    extra_where = f"WERKS = '{werks}' AND LOEKZ = ''" if werks else "LOEKZ = ''"
+    kept = set()
+    for start in range(0, len(aufnrs), IN_QUERY_CHUNK_SIZE):
+        where = build_in_options('AUFNR', aufnrs[start:start + IN_QUERY_CHUNK_SIZE], extra_where)
+        for page in SapTablePages(conn, 'AUFK', ['AUFNR'], where):
+            if page['DATA']:
+                kept.update(row[0] for row in get_decoder(page['FIELDS']).decode_tuples(page['DATA']))
+    return [aufnr for aufnr in aufnrs if aufnr in kept]
+
+
+def group_rows(rows: List[Dict], *key_fields: str) -> Dict[Tuple, List[Dict]]:
+    """按键字段分组，保持SAP返回的行顺序"""
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[f] for f in key_fields), []).append(row)
+    return groups
+
+
+def read_material_descriptions(conn: Connection, matnrs: Iterable[str], spras: Optional[str] = None) -> Dict[str, str]:
+    """批量读取物料描述（MAKT），返回 {完整物料号(带前导零): 描述}
+
+    spras 为空时不按语言过滤，每个物料取SAP返回的第一条描述。
+    """
+    extra_where = f"SPRAS = '{spras}'" if spras else ""
+    rows = read_sap_table_in(conn, "MAKT", ["MATNR", "MAKTX"], "MATNR", matnrs, extra_where)
+    descriptions = {}
+    for row in rows:
+        descriptions.setdefault(row["MATNR"], row["MAKTX"])
+    return descriptions
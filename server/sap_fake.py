@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""离线SAP后端：按录制的表数据回放 RFC_READ_TABLE
+
+FakeConnection 提供与 pyrfc.Connection 相同的 call/ping/close 接口，从夹具（fixture）中的表数据
+按 OPTIONS（WHERE 条件）筛选，并按 ROWSKIPS/ROWCOUNT 分页，返回与真实系统格式一致的 DATA/FIELDS
+（按字段长度定宽拼接、数值右对齐、超过512字节报 DATA_BUFFER_EXCEEDED）。可以设置每次调用和每行的延迟，
+用来在没有SAP的环境下测量RFC往返次数与耗时（见 sap_bench.py）。
+FaultInjector 按概率注入连接失败和通信错误，或模拟SAP完全不可达；调用带 options={"timeout": 秒} 且模拟耗时
+超过该值时按 pyrfc 的方式取消调用，用来验证连接池的时限与熔断（见 sap_breaker.py）。
+
+夹具格式（JSON）：
+  {"version": 1, "tables": {"AFKO": {"fields": {"AUFNR": ["C", 12], ...}, "rows": [{"AUFNR": "...", ...}]}}}
+
+夹具来源：
+  - 构造数据：python sap_fake.py generate --output fixture.json（small/medium/huge 三个规模的工单）
+  - 录制真实系统：python sap_fake.py record 123456 123457 --output fixture.json，
+    通过真实连接执行一遍 get_order_details 与 get_production_order_data，记录返回的所有行
+
+设置 SAP_FAKE_FIXTURE=夹具路径 后，sap_common.open_connection 返回 FakeConnection 而不连接SAP；
+SAP_FAKE_FAIL_RATE / SAP_FAKE_CONNECT_FAIL_RATE / SAP_FAKE_DOWN=1 注入故障。
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sap_where import (NUMERIC_TYPES, WhereSyntaxError, candidate_values, compile_where, fixed_equalities,
+                       format_value, parse_where)
+
+FIXTURE_VERSION = 1
+# RFC_READ_TABLE 单行数据的最大长度
+MAX_ROW_WIDTH = 512
+OPTIONS_LINE_LENGTH = 72
+
+# 常用表的字段类型与输出长度（RFC_READ_TABLE 的 TYPE/LENGTH），构造数据和未录制到元数据的字段使用
+FIELD_CATALOG = {
+    'AUFK': {'AUFNR': ('C', 12), 'AUART': ('C', 4), 'KDAUF': ('C', 10), 'KDPOS': ('N', 6), 'ERNAM': ('C', 12),
+             'ERDAT': ('D', 8), 'AENAM': ('C', 12), 'AEDAT': ('D', 8), 'OBJNR': ('C', 22), 'WERKS': ('C', 4),
+             'LOEKZ': ('C', 1)},
+    'AFKO': {'AUFNR': ('C', 12), 'GSTRP': ('D', 8), 'GLTRP': ('D', 8), 'GAMNG': ('P', 17), 'GMEIN': ('C', 3),
+             'PLNBEZ': ('C', 18), 'DISPO': ('C', 3), 'FEVOR': ('C', 3), 'AUFPL': ('N', 10)},
+    'AFVC': {'AUFPL': ('N', 10), 'APLZL': ('N', 8), 'VORNR': ('C', 4), 'LTXA1': ('C', 40), 'ARBID': ('N', 8),
+             'OBJNR': ('C', 22), 'STEUS': ('C', 4)},
+    'AFVV': {'AUFPL': ('N', 10), 'APLZL': ('N', 8), 'VGW01': ('P', 13), 'VGE01': ('C', 3), 'VGW02': ('P', 13),
+             'VGE02': ('C', 3), 'VGW03': ('P', 13), 'VGE03': ('C', 3), 'VGW04': ('P', 13), 'VGE04': ('C', 3),
+             'BMSCH': ('P', 17)},
+    'ZAFVC': {'AUFNR': ('C', 12), 'VORNR': ('C', 4), 'PERNR': ('N', 8), 'PERNM': ('C', 40), 'ASENG': ('C', 10),
+              'PEROR': ('C', 10), 'REMAK': ('C', 50)},
+    'CRHD': {'OBJTY': ('C', 2), 'OBJID': ('N', 8), 'ARBPL': ('C', 8)},
+    'CRTX': {'OBJTY': ('C', 2), 'OBJID': ('N', 8), 'SPRAS': ('C', 1), 'KTEXT': ('C', 40)},
+    'MAKT': {'MATNR': ('C', 18), 'SPRAS': ('C', 1), 'MAKTX': ('C', 40)},
+    'MARA': {'MATNR': ('C', 18), 'ZPICTX': ('C', 40)},
+    'RESB': {'RSNUM': ('N', 10), 'RSPOS': ('N', 4), 'AUFNR': ('C', 12), 'WERKS': ('C', 4), 'MATNR': ('C', 18),
+             'BDMNG': ('P', 17), 'MEINS': ('C', 3), 'ENMNG': ('P', 17), 'POSNR': ('C', 4), 'BDTER': ('D', 8),
+             'XLOEK': ('C', 1)},
+}
+
+# 录制时合并同一行的键字段
+TABLE_KEYS = {
+    'AUFK': ('AUFNR',), 'AFKO': ('AUFNR',), 'AFVC': ('AUFPL', 'APLZL'), 'AFVV': ('AUFPL', 'APLZL'),
+    'ZAFVC': ('AUFNR', 'VORNR', 'PERNR'), 'CRHD': ('OBJID',), 'CRTX': ('OBJID', 'SPRAS'),
+    'MAKT': ('MATNR', 'SPRAS'), 'MARA': ('MATNR',), 'RESB': ('RSNUM', 'RSPOS'),
+}
+
+# 基准测试的工单规模：名称 -> (工单号, 工序数, 每道工序员工数, 组件数)
+FIXTURE_SIZES = {
+    'small': ('1000001', 5, 1, 10),
+    'medium': ('1000002', 40, 3, 150),
+    'huge': ('1000003', 400, 4, 6000),
+}
+
+
+class FakeRfcError(Exception):
+    """模拟 RFC_READ_TABLE 的异常（key 与ABAP异常名相同，例如 TABLE_NOT_AVAILABLE）"""
+
+    def __init__(self, key: str, message: str = ''):
+        super().__init__(f'{key}: {message}' if message else key)
+        self.key = key
+
+
+class CommunicationError(FakeRfcError):
+    """模拟 pyrfc.CommunicationError（网络中断、SAP不可达、调用超时被取消）"""
+
+
+class LogonError(FakeRfcError):
+    """模拟 pyrfc.LogonError"""
+
+
+class FaultInjector:
+    """为同一夹具打开的所有连接注入故障
+
+    fail_rate 为每次调用（含 ping）抛出 CommunicationError 的概率，connect_fail_rate 为建立连接失败的概率，
+    down 为 True 时模拟SAP完全不可达（建立连接和调用都失败，可在运行中切换）。seed 固定随机序列。
+    """
+
+    def __init__(self, fail_rate: float = 0.0, connect_fail_rate: float = 0.0, down: bool = False,
+                 seed: Optional[int] = None):
+        self.fail_rate = fail_rate
+        self.connect_fail_rate = connect_fail_rate
+        self.down = down
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.injected = 0
+
+    def _fail(self, rate: float) -> bool:
+        with self._lock:
+            failed = self.down or (rate > 0 and self._random.random() < rate)
+            if failed:
+                self.injected += 1
+            return failed
+
+    def on_connect(self):
+        if self._fail(self.connect_fail_rate):
+            raise CommunicationError('RFC_COMMUNICATION_FAILURE', '模拟：无法连接SAP')
+
+    def on_call(self):
+        if self._fail(self.fail_rate):
+            raise CommunicationError('RFC_COMMUNICATION_FAILURE', '模拟：连接中断')
+
+    @classmethod
+    def from_env(cls) -> Optional['FaultInjector']:
+        """按 SAP_FAKE_FAIL_RATE / SAP_FAKE_CONNECT_FAIL_RATE / SAP_FAKE_DOWN 创建，都未设置时返回 None"""
+        fail_rate = float(os.getenv('SAP_FAKE_FAIL_RATE', '0'))
+        connect_fail_rate = float(os.getenv('SAP_FAKE_CONNECT_FAIL_RATE', '0'))
+        down = os.getenv('SAP_FAKE_DOWN') == '1'
+        if not (fail_rate or connect_fail_rate or down):
+            return None
+        return cls(fail_rate, connect_fail_rate, down)
+
+
+# ---------------------------------------------------------------------------
+# 夹具
+# ---------------------------------------------------------------------------
+
+class Fixture:
+    """按表保存的行数据及字段元数据（字段名 -> (类型, 长度)）"""
+
+    def __init__(self, tables: Optional[Dict] = None):
+        self.tables = {}
+        for name, table in (tables or {}).items():
+            fields = {field: (meta[0], int(meta[1])) for field, meta in table.get('fields', {}).items()}
+            self.tables[name] = {'fields': fields, 'rows': list(table.get('rows', []))}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> 'Fixture':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != FIXTURE_VERSION:
+            raise ValueError(f'不支持的夹具版本: {data.get("version")}')
+        return cls(data['tables'])
+
+    def save(self, path: str):
+        with self._lock:
+            tables = {name: {'fields': {k: list(v) for k, v in table['fields'].items()}, 'rows': table['rows']}
+                      for name, table in sorted(self.tables.items())}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'version': FIXTURE_VERSION, 'tables': tables}, f, ensure_ascii=False)
+
+    def table(self, name: str) -> Dict:
+        table = self.tables.get(name)
+        if table is None:
+            raise FakeRfcError('TABLE_NOT_AVAILABLE', name)
+        return table
+
+    def add_rows(self, name: str, fields: Dict[str, Tuple[str, int]], rows: List[Dict]):
+        """合并录制到的一批行（同一次调用返回，字段相同）
+
+        包含全部键字段时按键合并；缺少部分键字段（例如不读取 RSPOS 的 RESB）时，与其余键字段相同
+        且共有字段取值都一致的已有行合并，每个已有行在一批中只合并一次，否则作为新行追加。
+        """
+        if not rows:
+            return
+        with self._lock:
+            table = self.tables.setdefault(name, {'fields': {}, 'rows': []})
+            table.pop('indexes', None)
+            for field, meta in fields.items():
+                table['fields'].setdefault(field, meta)
+            keys = TABLE_KEYS.get(name)
+            present = [k for k in keys if k in rows[0]] if keys else sorted(rows[0])
+            complete = keys is not None and len(present) == len(keys)
+            index = {}
+            for existing in table['rows']:
+                index.setdefault(tuple(existing.get(k) for k in present), []).append(existing)
+            claimed = set()
+            for row in rows:
+                key = tuple(row.get(k) for k in present)
+                match = None
+                for existing in index.get(key, ()):
+                    if id(existing) in claimed:
+                        continue
+                    if complete or all(existing[k] == v for k, v in row.items() if k in existing):
+                        match = existing
+                        break
+                if match is None:
+                    match = {}
+                    table['rows'].append(match)
+                    index.setdefault(key, []).append(match)
+                match.update(row)
+                claimed.add(id(match))
+
+    def candidate_rows(self, name: str, field: str, values: Iterable[str]) -> List[Dict]:
+        """按字段取值从索引中取出候选行（保持表中的行顺序），索引在第一次使用时建立"""
+        with self._lock:
+            table = self.tables[name]
+            indexes = table.setdefault('indexes', {})
+            index = indexes.get(field)
+            if index is None:
+                index = indexes[field] = {}
+                for position, row in enumerate(table['rows']):
+                    index.setdefault((row.get(field) or '').rstrip(), []).append(position)
+        positions = sorted(p for value in values for p in index.get(value.rstrip(), ()))
+        return [table['rows'][p] for p in positions]
+
+    def row_count(self) -> Dict[str, int]:
+        return {name: len(table['rows']) for name, table in sorted(self.tables.items())}
+
+
+def _field_names(fields) -> List[str]:
+    return [f['FIELDNAME'] if isinstance(f, dict) else f for f in fields or []]
+
+
+class FakeConnection:
+    """按夹具回放 RFC_READ_TABLE 的连接（接口与 pyrfc.Connection 相同）
+
+    latency 为每次调用的固定延迟（秒），latency_per_row 为每返回一行增加的延迟，用来模拟网络往返和SAP侧读取。
+    faults 为注入故障的 FaultInjector（可多个连接共享）。
+    calls/rows_returned/history 记录调用次数、返回行数和每次调用的 (表, 条件, 行数)。
+    """
+
+    def __init__(self, fixture: Fixture, latency: float = 0.0, latency_per_row: float = 0.0,
+                 faults: Optional[FaultInjector] = None):
+        self.fixture = fixture
+        self.latency = latency
+        self.latency_per_row = latency_per_row
+        self.faults = faults
+        self.alive = True
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = 0
+            self.rows_returned = 0
+            self.history = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _check(self):
+        if not self.alive:
+            raise CommunicationError('COMMUNICATION_FAILURE', '连接已关闭')
+        if self.faults is not None:
+            try:
+                self.faults.on_call()
+            except CommunicationError:
+                self.alive = False
+                raise
+
+    def _wait(self, delay: float, timeout: Optional[float]):
+        """模拟耗时；超过 timeout 时与 pyrfc 一样取消调用，连接随后不可用"""
+        if timeout is not None and delay > timeout:
+            time.sleep(max(0.0, timeout))
+            self.alive = False
+            raise CommunicationError('RFC_CANCELED', f'模拟：调用超过{timeout}秒被取消')
+        if delay:
+            time.sleep(delay)
+
+    def ping(self):
+        self._check()
+        self._wait(self.latency, None)
+
+    def close(self):
+        self.alive = False
+
+    def call(self, func_name: str, options: Optional[Dict] = None, **params) -> Dict:
+        self._check()
+        timeout = (options or {}).get('timeout')
+        if func_name == 'RFC_PING':
+            self._wait(self.latency, timeout)
+            return {}
+        if func_name != 'RFC_READ_TABLE':
+            raise FakeRfcError('FU_NOT_FOUND', func_name)
+        result, table_name, where = self._read_table(**params)
+        rows = len(result['DATA'])
+        with self._lock:
+            self.calls += 1
+            self.rows_returned += rows
+            self.history.append((table_name, where, rows))
+        self._wait(self.latency + self.latency_per_row * rows, timeout)
+        return result
+
+    def _read_table(self, QUERY_TABLE: str, FIELDS=(), OPTIONS=(), DELIMITER: str = '', ROWSKIPS: int = 0,
+                    ROWCOUNT: int = 0, NO_DATA: str = '', **_) -> Tuple[Dict, str, str]:
+        table = self.fixture.table(QUERY_TABLE)
+        catalog = FIELD_CATALOG.get(QUERY_TABLE, {})
+        field_meta = dict(catalog)
+        field_meta.update(table['fields'])
+
+        names = _field_names(FIELDS) or list(field_meta)
+        for name in names:
+            if name not in field_meta:
+                raise FakeRfcError('FIELD_NOT_VALID', f'{QUERY_TABLE}-{name}')
+
+        for option in OPTIONS or []:
+            if len(option['TEXT']) > OPTIONS_LINE_LENGTH:
+                raise FakeRfcError('OPTION_NOT_VALID', f'OPTIONS 行超过{OPTIONS_LINE_LENGTH}个字符')
+        where = ' '.join(option['TEXT'] for option in OPTIONS or [])
+        try:
+            condition = parse_where(where)
+            matches = compile_where(condition, {k: v[0] for k, v in field_meta.items()})
+        except WhereSyntaxError as e:
+            raise FakeRfcError('OPTION_NOT_VALID', str(e))
+        rows = table['rows']
+        candidates = candidate_values(condition)
+        if candidates and field_meta[candidates[0]][0] not in NUMERIC_TYPES:
+            rows = self.fixture.candidate_rows(QUERY_TABLE, *candidates)
+
+        fields = []
+        offset = 0
+        for i, name in enumerate(names):
+            field_type, length = field_meta[name]
+            fields.append({'FIELDNAME': name, 'OFFSET': str(offset).zfill(6), 'LENGTH': str(length).zfill(6),
+                           'TYPE': field_type, 'FIELDTEXT': name})
+            offset += length + (len(DELIMITER) if i < len(names) - 1 else 0)
+        if offset > MAX_ROW_WIDTH:
+            raise FakeRfcError('DATA_BUFFER_EXCEEDED', f'{QUERY_TABLE} 行长度 {offset}')
+
+        data = []
+        skipped = 0
+        for row in rows:
+            if not matches(row):
+                continue
+            if skipped < ROWSKIPS:
+                skipped += 1
+                continue
+            if NO_DATA != 'X':
+                data.append({'WA': DELIMITER.join(
+                    format_value(row.get(name), *field_meta[name]) for name in names)})
+            if ROWCOUNT and len(data) >= ROWCOUNT:
+                break
+        return {'DATA': data, 'FIELDS': fields, 'OPTIONS': list(OPTIONS or [])}, QUERY_TABLE, where
+
+
+class RecordingConnection:
+    """包装真实连接：调用原样转发，同时把 RFC_READ_TABLE 返回的行记录到夹具中"""
+
+    def __init__(self, conn, fixture: Optional[Fixture] = None):
+        self.conn = conn
+        self.fixture = fixture or Fixture()
+
+    @property
+    def alive(self):
+        return getattr(self.conn, 'alive', True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def ping(self):
+        return self.conn.ping()
+
+    def close(self):
+        self.conn.close()
+
+    def call(self, func_name: str, **params) -> Dict:
+        result = self.conn.call(func_name, **params)
+        if func_name == 'RFC_READ_TABLE':
+            self._record(params, result)
+        return result
+
+    def _record(self, params: Dict, result: Dict):
+        from sap_decoder import get_decoder
+
+        fields = result.get('FIELDS') or []
+        data = result.get('DATA') or []
+        rows = get_decoder(fields, 'raw').decode_dicts(data) if fields else []
+        where = ' '.join(option['TEXT'] for option in params.get('OPTIONS') or [])
+        # 条件中固定的字段（例如 AUFNR = '...'）即使没有选择也能确定取值，一并写入夹具
+        fixed = fixed_equalities(parse_where(where))
+        meta = {f['FIELDNAME']: (f.get('TYPE', 'C'), int(f['LENGTH'])) for f in fields}
+        self.fixture.add_rows(params['QUERY_TABLE'], meta, [{**fixed, **row} for row in rows])
+
+
+# ---------------------------------------------------------------------------
+# 构造数据
+# ---------------------------------------------------------------------------
+
+def _table(name: str) -> Dict:
+    return {'fields': dict(FIELD_CATALOG[name]), 'rows': []}
+
+
+def generate_fixture(sizes: Optional[Dict[str, Tuple[str, int, int, int]]] = None) -> Fixture:
+    """按规模构造工单数据（结构与真实表一致，数据确定可重复）"""
+    sizes = sizes or FIXTURE_SIZES
+    tables = {name: _table(name) for name in FIELD_CATALOG}
+    work_centers = 8
+    for i in range(work_centers):
+        objid = str(10000000 + i)
+        tables['CRHD']['rows'].append({'OBJTY': 'A', 'OBJID': objid, 'ARBPL': f'WC{i:02d}'})
+        tables['CRTX']['rows'].append({'OBJTY': 'A', 'OBJID': objid, 'SPRAS': '1', 'KTEXT': f'数控加工中心{i}'})
+
+    materials = set()
+    for index, (order_number, operations, employees, components) in enumerate(sizes.values()):
+        aufnr = order_number.zfill(12)
+        aufpl = str(5000 + index).zfill(10)
+        plnbez = str(200000 + index).zfill(18)
+        rsnum = str(9000000 + index).zfill(10)
+        materials.add(plnbez)
+        tables['AUFK']['rows'].append({
+            'AUFNR': aufnr, 'AUART': 'ZP01', 'KDAUF': '0010000001', 'KDPOS': '000010', 'ERNAM': 'PLANNER',
+            'ERDAT': '20250101', 'AENAM': 'PLANNER', 'AEDAT': '20250101', 'OBJNR': 'OR' + aufnr, 'WERKS': '1000',
+            'LOEKZ': ''})
+        tables['AFKO']['rows'].append({
+            'AUFNR': aufnr, 'GSTRP': '20250102', 'GLTRP': '20250105', 'GAMNG': '100.000', 'GMEIN': 'EA',
+            'PLNBEZ': plnbez, 'DISPO': '001', 'FEVOR': '002', 'AUFPL': aufpl})
+        for op in range(operations):
+            vornr = str((op + 1) * 10).zfill(4)
+            aplzl = str(op + 1).zfill(8)
+            tables['AFVC']['rows'].append({
+                'AUFPL': aufpl, 'APLZL': aplzl, 'VORNR': vornr, 'LTXA1': f'工序{op + 1} 粗加工/精加工',
+                'ARBID': str(10000000 + op % work_centers), 'OBJNR': f'OV{aufpl}{aplzl}', 'STEUS': 'PP01'})
+            tables['AFVV']['rows'].append({
+                'AUFPL': aufpl, 'APLZL': aplzl, 'VGW01': '0.750', 'VGE01': 'H', 'VGW02': '1.000', 'VGE02': 'H',
+                'VGW03': '', 'VGE03': '', 'VGW04': '1.500', 'VGE04': 'MIN', 'BMSCH': '1.000'})
+            for e in range(employees):
+                tables['ZAFVC']['rows'].append({
+                    'AUFNR': aufnr, 'VORNR': vornr, 'PERNR': str(10000 + e).zfill(8), 'PERNM': f'员工{e}',
+                    'ASENG': '5', 'PEROR': '', 'REMAK': ''})
+        for c in range(components):
+            matnr = str(300000 + c % 2000).zfill(18)
+            materials.add(matnr)
+            tables['RESB']['rows'].append({
+                'RSNUM': rsnum, 'RSPOS': str(c + 1).zfill(4), 'AUFNR': aufnr, 'WERKS': '1000', 'MATNR': matnr,
+                'BDMNG': f'{(c % 9 + 1) * 2:.3f}', 'MEINS': 'EA', 'ENMNG': f'{c % 9 + 1:.3f}',
+                'POSNR': str((c + 1) * 10 % 10000).zfill(4), 'BDTER': '20250102', 'XLOEK': ''})
+
+    for matnr in sorted(materials):
+        tables['MAKT']['rows'].append({'MATNR': matnr, 'SPRAS': '1', 'MAKTX': f'物料{int(matnr)}'})
+        tables['MARA']['rows'].append({'MATNR': matnr, 'ZPICTX': f'DWG-{int(matnr)}'})
+    return Fixture(tables)
+
+
+_loaded_fixtures = {}
+_loaded_fixtures_lock = threading.Lock()
+_fault_injectors = {}
+
+
+def open_fake_connection(path: str) -> FakeConnection:
+    """sap_common.open_connection 在设置 SAP_FAKE_FIXTURE 时调用；同一夹具文件在进程内只加载一次
+
+    SAP_FAKE_LATENCY / SAP_FAKE_LATENCY_PER_ROW 设置每次调用和每行的延迟（秒）；
+    故障注入见 FaultInjector.from_env，同一夹具打开的连接共享一个 FaultInjector。
+    """
+    with _loaded_fixtures_lock:
+        fixture = _loaded_fixtures.get(path)
+        if fixture is None:
+            fixture = _loaded_fixtures[path] = Fixture.load(path)
+            _fault_injectors[path] = FaultInjector.from_env()
+        faults = _fault_injectors[path]
+    if faults is not None:
+        faults.on_connect()
+    return FakeConnection(fixture, float(os.getenv('SAP_FAKE_LATENCY', '0')),
+                          float(os.getenv('SAP_FAKE_LATENCY_PER_ROW', '0')), faults)
+
+
+def record_orders(order_numbers: List[str], output: str) -> Dict:
+    """通过真实SAP连接读取工单（两个脚本的取数路径），把返回的行写入夹具文件"""
+    from sap_common import open_connection
+    from sap_rfc import get_order_details
+    from sap_rfc_extended import get_production_orders_data
+
+    with RecordingConnection(open_connection()) as conn:
+        for order_number in order_numbers:
+            get_order_details(order_number, conn)
+        get_production_orders_data(conn, order_numbers)
+        conn.fixture.save(output)
+        return {'success': True, 'file': output, 'rows': conn.fixture.row_count()}
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description='离线SAP后端夹具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    generate_parser = subparsers.add_parser('generate', help='生成构造数据夹具（small/medium/huge）')
+    generate_parser.add_argument('--output', required=True)
+    record_parser = subparsers.add_parser('record', help='从真实SAP录制工单数据')
+    record_parser.add_argument('order_numbers', nargs='+')
+    record_parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        fixture = generate_fixture()
+        fixture.save(args.output)
+        print(json.dumps({'success': True, 'file': args.output, 'orders': {k: v[0] for k, v in FIXTURE_SIZES.items()},
+                          'rows': fixture.row_count()}, ensure_ascii=False))
+    else:
+        try:
+            print(json.dumps(record_orders(args.order_numbers, args.output), ensure_ascii=False))
+        except Exception as e:
+            print(json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False))
+            sys.exit(1)
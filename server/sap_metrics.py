@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""RFC调用与渲染阶段的计时、计数和请求跟踪
+
+所有 RFC 调用都经过 call_rfc，渲染各阶段包在 phase() 中：
+  - 进程内累计计数：每张表的调用次数、出错次数、返回行数、字节数、耗时，每个阶段的次数和耗时，
+    以及 read_sap_table 等按“无数据”处理的错误次数。常驻进程以 Prometheus 文本格式输出（见 sap_worker.py）。
+  - 请求跟踪（可选）：start_trace() 之后同一请求内（包括 run_parallel 的线程）的调用逐条记录，
+    finish_trace() 返回 {"total_ms", "rfc_calls", "rfc_ms", "calls", "phases", "errors"}，附加到JSON结果的 trace 字段。
+    命令行设置 SAP_RFC_TRACE=1，常驻进程在请求参数中加 "trace": true。
+"""
+
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+_current_trace = contextvars.ContextVar('sap_request_trace', default=None)
+
+
+class Metrics:
+    """进程内累计计数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (函数, 表) -> [调用次数, 出错次数, 行数, 字节数, 耗时秒]
+        self.calls = {}
+        # 阶段 -> [次数, 耗时秒]
+        self.phases = {}
+        # (来源, 表) -> 按无数据处理的错误次数
+        self.handled_errors = {}
+
+    def record_call(self, function: str, table: str, seconds: float, rows: int, nbytes: int, failed: bool):
+        with self._lock:
+            entry = self.calls.setdefault((function, table), [0, 0, 0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += 1 if failed else 0
+            entry[2] += rows
+            entry[3] += nbytes
+            entry[4] += seconds
+
+    def record_phase(self, name: str, seconds: float):
+        with self._lock:
+            entry = self.phases.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def record_handled_error(self, source: str, table: str):
+        with self._lock:
+            key = (source, table)
+            self.handled_errors[key] = self.handled_errors.get(key, 0) + 1
+
+    def prometheus_lines(self) -> List[str]:
+        with self._lock:
+            calls = sorted(self.calls.items())
+            phases = sorted(self.phases.items())
+            handled = sorted(self.handled_errors.items())
+
+        lines = []
+        for name, help_text, index in (
+            ('sap_rfc_calls_total', 'RFC调用次数', 0),
+            ('sap_rfc_errors_total', 'RFC调用抛出异常的次数', 1),
+            ('sap_rfc_rows_total', 'RFC_READ_TABLE 返回的行数', 2),
+            ('sap_rfc_bytes_total', 'RFC_READ_TABLE 返回的数据字节数', 3),
+            ('sap_rfc_seconds_total', 'RFC调用累计耗时（秒）', 4),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (function, table), entry in calls:
+                lines.append(f'{name}{format_labels(function=function, table=table)} {entry[index]}')
+        lines.append('# HELP sap_handled_errors_total 被捕获并按无数据处理的错误次数')
+        lines.append('# TYPE sap_handled_errors_total counter')
+        for (source, table), count in handled:
+            lines.append(f'sap_handled_errors_total{format_labels(source=source, table=table)} {count}')
+        for name, help_text, index in (
+            ('sap_phase_total', '各阶段执行次数', 0),
+            ('sap_phase_seconds_total', '各阶段累计耗时（秒）', 1),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for phase_name, entry in phases:
+                lines.append(f'{name}{format_labels(phase=phase_name)} {entry[index]}')
+        return lines
+
+
+def format_labels(**labels) -> str:
+    """Prometheus 标签，值中的反斜杠、双引号和换行需要转义"""
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+
+class RequestTrace:
+    """一次请求内的调用明细"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.calls = []
+        self.phases = []
+        self.errors = []
+
+    def _offset_ms(self, started: float) -> float:
+        return round((started - self.started) * 1000, 2)
+
+    def add_call(self, function: str, table: str, started: float, seconds: float, rows: int, nbytes: int,
+                 error: Optional[str]):
+        entry = {'function': function, 'table': table, 'start_ms': self._offset_ms(started),
+                 'ms': round(seconds * 1000, 2), 'rows': rows, 'bytes': nbytes}
+        if error:
+            entry['error'] = error
+        with self._lock:
+            self.calls.append(entry)
+
+    def add_phase(self, name: str, started: float, seconds: float):
+        with self._lock:
+            self.phases.append({'phase': name, 'start_ms': self._offset_ms(started), 'ms': round(seconds * 1000, 2)})
+
+    def add_error(self, source: str, table: str, error: str):
+        with self._lock:
+            self.errors.append({'source': source, 'table': table, 'error': error})
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+                'rfc_calls': len(self.calls),
+                'rfc_ms': round(sum(c['ms'] for c in self.calls), 2),
+                'calls': list(self.calls),
+                'phases': list(self.phases),
+                'errors': list(self.errors),
+            }
+
+
+metrics = Metrics()
+
+
+def call_rfc(conn, function: str, **params) -> Dict:
+    """调用 conn.call 并记录表名、耗时、返回行数和字节数，异常计数后原样抛出"""
+    table = params.get('QUERY_TABLE', '')
+    trace = _current_trace.get()
+    started = time.perf_counter()
+    try:
+        result = conn.call(function, **params)
+    except Exception as e:
+        seconds = time.perf_counter() - started
+        metrics.record_call(function, table, seconds, 0, 0, True)
+        if trace is not None:
+            trace.add_call(function, table, started, seconds, 0, 0, str(e))
+        raise
+    seconds = time.perf_counter() - started
+    # 本地副本回答的调用（sap_replica.ReplicaConnection）单独计数，不算作SAP的RFC调用
+    function = result.get('_served_by', function)
+    data = result.get('DATA') or []
+    nbytes = sum(len(row.get('WA', '')) for row in data)
+    metrics.record_call(function, table, seconds, len(data), nbytes, False)
+    if trace is not None:
+        trace.add_call(function, table, started, seconds, len(data), nbytes, None)
+    return result
+
+
+@contextmanager
+def phase(name: str):
+    """记录一个阶段（例如 render.layout）的耗时"""
+    trace = _current_trace.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.record_phase(name, seconds)
+        if trace is not None:
+            trace.add_phase(name, started, seconds)
+
+
+def record_handled_error(source: str, table: str, error: BaseException):
+    """记录被捕获后按无数据处理的错误，使其不再完全不可见"""
+    metrics.record_handled_error(source, table)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_error(source, table, str(error))
+
+
+def start_trace() -> contextvars.Token:
+    return _current_trace.set(RequestTrace())
+
+
+def finish_trace(token: contextvars.Token) -> Dict:
+    trace = _current_trace.get()
+    _current_trace.reset(token)
+    return trace.to_dict()
+
+
+def trace_enabled_by_env() -> bool:
+    return os.getenv('SAP_RFC_TRACE') == '1'
+
+
+def call_traced(enabled: bool, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """执行 fn；enabled 时把本次调用的跟踪记录附加到返回的字典中（trace 字段）"""
+    if not enabled:
+        return fn(*args, **kwargs)
+    token = start_trace()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        trace = finish_trace(token)
+    if isinstance(result, dict):
+        result['trace'] = trace
+    return result
+
+
+def in_current_context(fn: Callable) -> Callable:
+    """让在其他线程中执行的 fn 使用当前请求的跟踪上下文"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""统一的工单读取：组件视图（sap_rfc.get_order_details）与报工单视图（sap_rfc_extended.get_production_order_data）共用
+
+两个接口原来各自读取 AFKO 和 MAKT（字段不同、解析方式不同），前端经常先后调用这两个接口，同一工单的 AFKO/MAKT 要读两遍。
+这里按两种视图所需字段的并集，每张表只读一次，结果按工单保存在 OrderBundle 中，再分别生成：
+  - components_view()：产成品与组件（AFKO、RESB、MAKT），与 get_order_details 的输出相同
+  - report_view()：基础信息、生产信息与工序（AUFK、AFKO、AFVC、AFVV、ZAFVC、CRHD、CRTX、MAKT、MARA），
+    与 get_production_order_data 的输出相同
+只需要一种视图时只读取该视图用到的表。常驻进程启用工单缓存（set_bundle_cache，见 sap_worker.py --bundle-ttl）后，
+两种视图分别缓存，只读取缓存中没有的视图；另外启用预读（--prefetch-views）时，单个工单的请求返回后在后台读取
+另一种视图，紧接着的另一个接口请求直接使用缓存，不再访问SAP。
+"""
+
+from __future__ import annotations
+
+import copy
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from sap_breaker import DEFAULT_REQUEST_DEADLINE, error_message, request_deadline
+from sap_common import (IN_QUERY_CHUNK_SIZE, SapTablePages, build_in_options, get_connection_pool, group_rows,
+                        pooled_connection, read_sap_table_in, run_parallel)
+from sap_decoder import get_decoder
+from sap_metrics import record_handled_error
+from sap_replica import replica_connection
+from result_cache import RESULT_FRESH, ResultCache
+
+if TYPE_CHECKING:
+    from pyrfc import Connection
+
+AUFK_FIELDS = ["AUFNR", "AUART", "KDAUF", "KDPOS", "ERNAM", "ERDAT", "OBJNR", "WERKS", "LOEKZ"]
+# 两种视图所需字段的并集（组件视图只用 PLNBEZ、GAMNG、GMEIN）
+AFKO_FIELDS = ["AUFNR", "GSTRP", "GLTRP", "GAMNG", "GMEIN", "PLNBEZ", "DISPO", "FEVOR", "AUFPL"]
+RESB_FIELDS = ["AUFNR", "RSNUM", "MATNR", "BDMNG", "MEINS", "ENMNG", "POSNR"]
+AFVC_FIELDS = ["AUFPL", "VORNR", "LTXA1", "ARBID", "OBJNR", "STEUS", "APLZL"]
+AFVV_FIELDS = ["AUFPL", "APLZL", "VGW01", "VGE01", "VGW02", "VGE02", "VGW03", "VGE03", "VGW04", "VGE04", "BMSCH"]
+ZAFVC_FIELDS = ["AUFNR", "VORNR", "PERNR", "PERNM", "ASENG", "PEROR", "REMAK"]
+MAKT_FIELDS = ["MATNR", "SPRAS", "MAKTX"]
+# 报工单视图的物料描述语言（组件视图不按语言过滤，取SAP返回的第一条）
+REPORT_SPRAS = "1"
+
+VIEW_COMPONENTS = 'components'
+VIEW_REPORT = 'report'
+# 各视图读取到的 OrderBundle 属性（合并两次读取的结果时使用）
+VIEW_ATTRIBUTES = {
+    VIEW_COMPONENTS: ('afko_legacy', 'components', 'descriptions'),
+    VIEW_REPORT: ('aufk', 'afko', 'report_descriptions', 'operations', 'afvv_by_key', 'zafvc_by_key',
+                  'crhd_by_objid', 'crtx_by_objid', 'mara_by_matnr'),
+}
+
+
+def remove_leading_zeros(value):
+    """去除数字字符串的前导零，但保留至少一位数字"""
+    if value and value.isdigit():
+        return str(int(value))
+    return value
+
+
+class OrderBundle:
+    """一个工单读取到的数据；has_components / has_report 表示是否已读取该视图需要的表"""
+
+    def __init__(self, order_number: str):
+        self.order_number = order_number
+        self.formatted_order_number = order_number.zfill(12)
+        self.has_components = False
+        self.has_report = False
+        self.aufk = None
+        # AFKO 行：原样字符串（报工单视图）与 legacy 解析（组件视图，P 类型为浮点数）
+        self.afko = None
+        self.afko_legacy = None
+        self.components = []
+        # 物料号(带前导零) -> 描述：不限语言的第一条（组件视图）/ REPORT_SPRAS 语言（报工单视图）
+        self.descriptions = {}
+        self.report_descriptions = {}
+        self.operations = []
+        # 以下按键分组的行由同一批读取的工单共享
+        self.afvv_by_key = {}
+        self.zafvc_by_key = {}
+        self.crhd_by_objid = {}
+        self.crtx_by_objid = {}
+        self.mara_by_matnr = {}
+
+    def views(self) -> List[str]:
+        return [view for view, present in ((VIEW_COMPONENTS, self.has_components), (VIEW_REPORT, self.has_report))
+                if present]
+
+    def merged(self, other: 'OrderBundle') -> 'OrderBundle':
+        """加上 other 中读取到而本对象没有的视图，返回新的 OrderBundle（缓存中的两个对象都不修改）"""
+        bundle = copy.copy(self)
+        for view in other.views():
+            if view not in self.views():
+                for name in VIEW_ATTRIBUTES[view]:
+                    setattr(bundle, name, getattr(other, name))
+        bundle.has_components = self.has_components or other.has_components
+        bundle.has_report = self.has_report or other.has_report
+        return bundle
+
+    def components_view(self) -> Dict:
+        """产成品与组件，与 sap_rfc.get_order_details 的返回相同"""
+        finished_product = {}
+        if self.afko_legacy is not None:
+            plnbez = self.afko_legacy["PLNBEZ"]
+            finished_product = {
+                'matnr': remove_leading_zeros(plnbez),
+                'quantity': self.afko_legacy.get('GAMNG', ''),
+                'unit': self.afko_legacy.get('GMEIN', '')
+            }
+            if finished_product['matnr'] and plnbez in self.descriptions:
+                finished_product['description'] = self.descriptions[plnbez]
+
+        components = []
+        for item in self.components:
+            components.append({
+                'matnr': remove_leading_zeros(item['MATNR']),
+                'description': self.descriptions.get(item['MATNR'], '无描述'),
+                'required_qty': item['BDMNG'],
+                'unit': item['MEINS'],
+            })
+        return {
+            'success': True,
+            'order_number': self.order_number,  # 返回原始订单号（不带前导零）
+            'finished_product': finished_product,
+            'components': components
+        }
+
+    def report_view(self) -> Optional[Dict]:
+        """报工单数据，与 sap_rfc_extended.get_production_order_data 的返回相同；找不到工单或没有工序时为 None"""
+        if self.aufk is None or self.afko is None or not self.operations:
+            return None
+        aufk = self.aufk
+        afko = self.afko
+        aufpl = afko["AUFPL"]
+
+        工序列表 = []
+        for afvc in self.operations:
+            # 工作中心
+            arbpl = ""
+            ktext = ""
+            if afvc.get("ARBID"):
+                crhd_rows = self.crhd_by_objid.get((afvc["ARBID"],))
+                arbpl = crhd_rows[0]["ARBPL"] if crhd_rows else ""
+                crtx_rows = self.crtx_by_objid.get((afvc["ARBID"],))
+                ktext = crtx_rows[0]["KTEXT"] if crtx_rows else ""
+
+            # 工时数据（AFVV）
+            afvv_rows = self.afvv_by_key.get((aufpl, afvc["APLZL"]))
+
+            工时数据 = {"准备工时": "", "人工工时": "", "机器工时": "", "加工工时": ""}
+            if afvv_rows:
+                afvv = afvv_rows[0]
+                bmsch = float(afvv["BMSCH"]) if afvv["BMSCH"] else 1
+                工时数据 = {
+                    "准备工时": f"{float(afvv['VGW01'])/bmsch:.3f} {afvv['VGE01']}" if afvv["VGW01"] else "",
+                    "人工工时": f"{float(afvv['VGW02'])/bmsch:.3f} {afvv['VGE02']}" if afvv["VGW02"] else "",
+                    "机器工时": f"{float(afvv['VGW03'])/bmsch:.3f} {afvv['VGE03']}" if afvv["VGW03"] else "",
+                    "加工工时": f"{float(afvv['VGW04'])/bmsch:.3f} {afvv['VGE04']}" if afvv["VGW04"] else ""
+                }
+
+            # 员工分配（ZAFVC）；复制一份，缓存中的行不会被调用方修改
+            zafvc_rows = [dict(row) for row in self.zafvc_by_key.get((self.formatted_order_number, afvc["VORNR"]), [])]
+
+            工序列表.append({
+                "工序号": afvc["VORNR"],
+                "工序描述": afvc["LTXA1"],
+                "控制码": afvc["STEUS"],
+                "工作中心编号": arbpl,
+                "工作中心描述": ktext,
+                "工时数据": 工时数据,
+                "下一道工序": None,
+                "员工分配": zafvc_rows
+            })
+
+        # 按工序号排序
+        工序列表.sort(key=lambda x: x["工序号"])
+
+        # 设置下一道工序
+        for i, 工序 in enumerate(工序列表):
+            if i < len(工序列表) - 1:
+                下一道工序 = 工序列表[i + 1]
+                工序["下一道工序"] = {
+                    "工序号": 下一道工序["工序号"],
+                    "工序描述": 下一道工序["工序描述"],
+                    "控制码": 下一道工序["控制码"],
+                    "工作中心编号": 下一道工序["工作中心编号"],
+                    "工作中心描述": 下一道工序["工作中心描述"]
+                }
+
+        matnr = afko["PLNBEZ"]
+        maktx = self.report_descriptions.get(matnr, "无物料描述") if matnr else "无物料描述"
+        mara_rows = self.mara_by_matnr.get((matnr,)) if matnr else None
+        zpictx = mara_rows[0]["ZPICTX"] if mara_rows else ""
+
+        return {
+            "基础信息": {
+                "工单号": aufk["AUFNR"],
+                "订单类型": aufk["AUART"],
+                "销售订单": aufk["KDAUF"],
+                "销售订单行项目": aufk["KDPOS"],
+                "工厂": aufk["WERKS"],
+                "创建人": aufk["ERNAM"],
+                "创建日期": aufk["ERDAT"],
+                "客户名称": ""
+            },
+            "生产信息": {
+                "物料号": matnr,
+                "物料描述": maktx,
+                "图号": zpictx,
+                "开始日期": afko["GSTRP"],
+                "结束日期": afko["GLTRP"],
+                "生产数量": afko["GAMNG"],
+                "单位": afko["GMEIN"],
+                "库存地点": "",
+                "库存地点描述": "",
+                "MRP控制者": afko["DISPO"],
+                "生产管理员": afko["FEVOR"]
+            },
+            "模具信息": [],
+            "工序与员工分配": 工序列表
+        }
+
+
+def _read_afko(conn: Connection, formatted_numbers: List[str]):
+    """读取 AFKO，每行同时按原样字符串和 legacy 方式解析，返回 ({AUFNR: 行}, {AUFNR: legacy 行})"""
+    raw_rows = {}
+    legacy_rows = {}
+    for start in range(0, len(formatted_numbers), IN_QUERY_CHUNK_SIZE):
+        where = build_in_options("AUFNR", formatted_numbers[start:start + IN_QUERY_CHUNK_SIZE])
+        for page in SapTablePages(conn, "AFKO", AFKO_FIELDS, where):
+            if not page["DATA"]:
+                continue
+            raw = get_decoder(page["FIELDS"]).decode_dicts(page["DATA"])
+            legacy = get_decoder(page["FIELDS"], 'legacy').decode_dicts(page["DATA"])
+            for row, legacy_row in zip(raw, legacy):
+                raw_rows.setdefault(row["AUFNR"], row)
+                legacy_rows.setdefault(row["AUFNR"], legacy_row)
+    return raw_rows, legacy_rows
+
+
+def _read_components(conn: Connection, formatted_numbers: List[str]) -> Dict[str, List[Dict]]:
+    """读取工单组件（RESB，legacy 解析：数量为浮点数），按工单分组并保持SAP返回的顺序"""
+    components = {}
+    for start in range(0, len(formatted_numbers), IN_QUERY_CHUNK_SIZE):
+        where = build_in_options("AUFNR", formatted_numbers[start:start + IN_QUERY_CHUNK_SIZE])
+        for page in SapTablePages(conn, "RESB", RESB_FIELDS, where, delimiter=''):
+            if page["DATA"]:
+                for row in get_decoder(page["FIELDS"], 'legacy').decode_dicts(page["DATA"]):
+                    components.setdefault(row["AUFNR"], []).append(row)
+    return components
+
+
+def _read_descriptions(conn: Connection, matnrs: List[str], all_languages: bool):
+    """读取物料描述（MAKT），返回 (不限语言的第一条描述, REPORT_SPRAS 语言的描述)；只需要后者时按语言过滤"""
+    extra_where = "" if all_languages else f"SPRAS = '{REPORT_SPRAS}'"
+    descriptions = {}
+    report_descriptions = {}
+    for row in read_sap_table_in(conn, "MAKT", MAKT_FIELDS, "MATNR", matnrs, extra_where):
+        descriptions.setdefault(row["MATNR"], row["MAKTX"])
+        if row["SPRAS"] == REPORT_SPRAS:
+            report_descriptions.setdefault(row["MATNR"], row["MAKTX"])
+    return descriptions, report_descriptions
+
+
+def fetch_order_bundles(conn: Connection, order_numbers: List[str], components: bool = True, report: bool = True,
+                        concurrency: Optional[int] = None) -> Dict[str, OrderBundle]:
+    """读取多个工单的数据，返回 {订单号: OrderBundle}；每张表按订单号合并查询，两种视图共用的表只读一次
+
+    components / report 指定需要的视图。concurrency 为读取AFKO之后并发执行的最大连接数（见 sap_common.run_parallel）。
+    """
+    bundles = {order_number: OrderBundle(order_number) for order_number in order_numbers}
+    for bundle in bundles.values():
+        bundle.has_components = components
+        bundle.has_report = report
+    formatted_numbers = list(dict.fromkeys(bundle.formatted_order_number for bundle in bundles.values()))
+
+    # 1. 订单抬头（AUFK，只有报工单视图需要）；只需报工单视图时没有有效订单就不再继续读取
+    aufk_by_aufnr = {}
+    if report:
+        aufk_data = read_sap_table_in(conn, "AUFK", AUFK_FIELDS, "AUFNR", formatted_numbers, extra_where="LOEKZ = ''")
+        aufk_by_aufnr = group_rows(aufk_data, "AUFNR")
+    afko_numbers = formatted_numbers if components else [key[0] for key in aufk_by_aufnr]
+    if not afko_numbers:
+        return bundles
+
+    # 2. AFKO 与组件（RESB）只依赖订单号
+    tasks = [lambda c: _read_afko(c, afko_numbers)]
+    if components:
+        tasks.append(lambda c: _read_components(c, formatted_numbers))
+    stage_results = run_parallel(conn, tasks, concurrency)
+    afko_rows, afko_legacy_rows = stage_results[0]
+    components_by_aufnr = stage_results[1] if components else {}
+
+    # 3. 以下读取只依赖AFKO和组件，互不依赖，可以并发执行
+    report_numbers = [aufnr for aufnr in afko_rows if (aufnr,) in aufk_by_aufnr] if report else []
+    aufpls = [afko_rows[aufnr]["AUFPL"] for aufnr in report_numbers]
+    report_matnrs = [afko_rows[aufnr]["PLNBEZ"] for aufnr in report_numbers if afko_rows[aufnr]["PLNBEZ"]]
+    matnrs = list(report_matnrs)
+    if components:
+        for aufnr in formatted_numbers:
+            if aufnr in afko_legacy_rows and afko_legacy_rows[aufnr]["PLNBEZ"]:
+                matnrs.append(afko_legacy_rows[aufnr]["PLNBEZ"])
+            matnrs.extend(item["MATNR"] for item in components_by_aufnr.get(aufnr, []) if item["MATNR"])
+
+    names = []
+    tasks = []
+    if report_numbers:
+        names += ["AFVC", "AFVV", "ZAFVC"]
+        tasks += [
+            # 工序数据（AFVC）
+            lambda c: read_sap_table_in(c, "AFVC", AFVC_FIELDS, "AUFPL", aufpls),
+            # 工时数据（AFVV）
+            lambda c: read_sap_table_in(c, "AFVV", AFVV_FIELDS, "AUFPL", aufpls),
+            # 员工分配（ZAFVC）
+            lambda c: read_sap_table_in(c, "ZAFVC", ZAFVC_FIELDS, "AUFNR", report_numbers),
+        ]
+    if matnrs:
+        # 物料描述（MAKT）
+        names.append("MAKT")
+        tasks.append(lambda c: _read_descriptions(c, matnrs, components))
+    if report_numbers:
+        # 图号（MARA）
+        names.append("MARA")
+        tasks.append(lambda c: read_sap_table_in(c, "MARA", ["MATNR", "ZPICTX"], "MATNR", report_matnrs))
+    stage_results = dict(zip(names, run_parallel(conn, tasks, concurrency)))
+    descriptions, report_descriptions = stage_results.get("MAKT", ({}, {}))
+
+    afvc_data = stage_results.get("AFVC", [])
+    afvc_by_aufpl = group_rows(afvc_data, "AUFPL")
+    afvv_by_key = group_rows(stage_results.get("AFVV", []), "AUFPL", "APLZL")
+    zafvc_by_key = group_rows(stage_results.get("ZAFVC", []), "AUFNR", "VORNR")
+    mara_by_matnr = group_rows(stage_results.get("MARA", []), "MATNR")
+
+    # 4. 一次性读取工作中心，在内存中按键关联，避免每道工序单独查询
+    crhd_by_objid = {}
+    crtx_by_objid = {}
+    if afvc_by_aufpl:
+        arbids = [afvc["ARBID"] for afvc in afvc_data if afvc.get("ARBID")]
+        crhd_data, crtx_data = run_parallel(conn, [
+            lambda c: read_sap_table_in(c, "CRHD", ["OBJID", "ARBPL"], "OBJID", arbids),
+            lambda c: read_sap_table_in(c, "CRTX", ["OBJID", "KTEXT"], "OBJID", arbids),
+        ], concurrency)
+        crhd_by_objid = group_rows(crhd_data, "OBJID")
+        crtx_by_objid = group_rows(crtx_data, "OBJID")
+
+    # 5. 按工单整合
+    for bundle in bundles.values():
+        aufnr = bundle.formatted_order_number
+        bundle.afko = afko_rows.get(aufnr)
+        bundle.afko_legacy = afko_legacy_rows.get(aufnr)
+        bundle.components = components_by_aufnr.get(aufnr, [])
+        bundle.descriptions = descriptions
+        bundle.report_descriptions = report_descriptions
+        aufk_rows = aufk_by_aufnr.get((aufnr,))
+        bundle.aufk = aufk_rows[0] if aufk_rows else None
+        if bundle.aufk is not None and bundle.afko is not None:
+            bundle.operations = afvc_by_aufpl.get((bundle.afko["AUFPL"],), [])
+        bundle.afvv_by_key = afvv_by_key
+        bundle.zafvc_by_key = zafvc_by_key
+        bundle.crhd_by_objid = crhd_by_objid
+        bundle.crtx_by_objid = crtx_by_objid
+        bundle.mara_by_matnr = mara_by_matnr
+    return bundles
+
+
+_bundle_cache = None
+_prefetch_enabled = False
+_prefetching = set()
+_prefetch_lock = threading.Lock()
+
+
+def set_bundle_cache(ttl: float, prefetch: bool = False) -> Optional[ResultCache]:
+    """启用（ttl > 0）或关闭进程内的工单缓存，常驻进程启动时调用
+
+    prefetch 为 True 时，单个工单只读取了一种视图后在后台读取另一种视图写入缓存（见 load_order_bundles）。
+    """
+    global _bundle_cache, _prefetch_enabled
+    _bundle_cache = ResultCache(ttl) if ttl > 0 else None
+    _prefetch_enabled = prefetch and _bundle_cache is not None
+    return _bundle_cache
+
+
+def get_bundle_cache() -> Optional[ResultCache]:
+    return _bundle_cache
+
+
+def _fetch(conn: Optional[Connection], order_numbers: List[str], components: bool, report: bool,
+           concurrency: Optional[int]) -> Dict[str, OrderBundle]:
+    """工单都在本地副本中且副本足够新时从副本读取订单相关的表（见 sap_replica.py），conn 为空时从连接池借用连接"""
+    replica_conn = replica_connection(order_numbers, conn)
+    if replica_conn is not None:
+        # 并发读取会从连接池借用SAP连接，绕过副本；副本查询本身很快，串行即可
+        with replica_conn:
+            return fetch_order_bundles(replica_conn, order_numbers, components, report, 1)
+    if conn is not None:
+        return fetch_order_bundles(conn, order_numbers, components, report, concurrency)
+    with pooled_connection() as conn:
+        return fetch_order_bundles(conn, order_numbers, components, report, concurrency)
+
+
+def load_order_bundles(conn: Optional[Connection], order_numbers: List[str], components: bool = True,
+                       report: bool = True, concurrency: Optional[int] = None) -> Dict[str, OrderBundle]:
+    """先查工单缓存，再读取缓存中没有的视图（fetch_order_bundles）
+
+    两种视图分别缓存，只读取请求需要而缓存中没有的视图。启用预读时，单个工单只读取了一种视图后
+    在后台读取另一种视图（_start_prefetch），前端紧接着调用另一个接口时不再访问SAP。
+    """
+    cache = _bundle_cache
+    views = [view for view, wanted in ((VIEW_COMPONENTS, components), (VIEW_REPORT, report)) if wanted]
+    bundles = {}
+    # 需要读取的视图 -> 工单
+    missing = {}
+    for order_number in dict.fromkeys(order_numbers):
+        missing_views = []
+        for view in views:
+            state, bundle = cache.lookup((order_number, view)) if cache is not None else (None, None)
+            if state != RESULT_FRESH:
+                missing_views.append(view)
+            elif order_number not in bundles:
+                bundles[order_number] = bundle
+            elif bundles[order_number] is not bundle:
+                bundles[order_number] = bundles[order_number].merged(bundle)
+        if missing_views:
+            missing.setdefault(tuple(missing_views), []).append(order_number)
+
+    for missing_views, numbers in missing.items():
+        fetched = _fetch(conn, numbers, VIEW_COMPONENTS in missing_views, VIEW_REPORT in missing_views, concurrency)
+        for order_number, bundle in fetched.items():
+            if cache is not None:
+                for view in missing_views:
+                    cache.put((order_number, view), bundle)
+            cached = bundles.get(order_number)
+            bundles[order_number] = bundle if cached is None else cached.merged(bundle)
+
+    if _prefetch_enabled and missing and len(bundles) == 1 and len(views) == 1:
+        order_number, bundle = next(iter(bundles.items()))
+        # 找不到的工单不预读
+        if bundle.afko is not None:
+            _start_prefetch(order_number, VIEW_REPORT if components else VIEW_COMPONENTS)
+    return {order_number: bundles[order_number] for order_number in order_numbers}
+
+
+def _start_prefetch(order_number: str, view: str):
+    """在后台线程中读取单个工单的另一种视图写入工单缓存（缓存中已有或正在读取时跳过）"""
+    cache = _bundle_cache
+    key = (order_number, view)
+    if cache is None or cache.is_fresh(key):
+        return
+    with _prefetch_lock:
+        if key in _prefetching:
+            return
+        _prefetching.add(key)
+    threading.Thread(target=_prefetch, args=(cache, order_number, view), name='sap-order-prefetch',
+                     daemon=True).start()
+
+
+def _prefetch(cache: ResultCache, order_number: str, view: str):
+    """连接池中没有可用的连接时不等待，直接放弃预读，不与请求争用连接；出错时同样放弃"""
+    try:
+        conns = get_connection_pool().try_acquire(1)
+        if not conns:
+            return
+        with request_deadline(DEFAULT_REQUEST_DEADLINE), conns[0] as conn:
+            bundle = _fetch(conn, [order_number], view == VIEW_COMPONENTS, view == VIEW_REPORT, 1)[order_number]
+        cache.put((order_number, view), bundle)
+    except Exception as e:
+        record_handled_error('order_prefetch', view, e)
+    finally:
+        with _prefetch_lock:
+            _prefetching.discard((order_number, view))
+
+
+def get_order_views(order_number: str, conn: Optional[Connection] = None) -> Dict:
+    """一次读取工单的组件视图和报工单数据（常驻进程方法 get_order_views）
+
+    返回 {"success": true, "order_details": 与 get_order_details 相同, "order_data": 与 get_work_order_data 的 order_data 相同}，
+    找不到报工单数据时 order_data 为 null。
+    """
+    try:
+        with request_deadline(DEFAULT_REQUEST_DEADLINE if conn is None else None):
+            bundle = load_order_bundles(conn, [order_number])[order_number]
+        return {'success': True, 'order_details': bundle.components_view(), 'order_data': bundle.report_view()}
+    except Exception as e:
+        return {
+            'success': False,
+            'error': error_message(e)
+        }
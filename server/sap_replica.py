@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""生产订单表的本地SQLite副本（AUFK / AFKO / AFVC / AFVV / RESB / ZAFVC）
+
+看板和统计会反复逐个工单读取同一工厂的订单数据。sync 命令按 工厂 + 计划开始日期（AFKO.GSTRP）窗口
+批量读取这些表写入本地SQLite（带索引），之后定时增量同步：
+  - AFKO：每次读取窗口内的全部工单。改期进入窗口的工单按新工单读取，移出窗口的从副本中删除；
+    AFKO 有变化（数量、日期、工艺路线号）的工单重新读取全部表
+  - AUFK/AFVC/AFVV：重新读取 AUFK.AEDAT（修改日期）或 ERDAT（创建日期）不早于上次同步的工单
+  - RESB/ZAFVC：没有修改日期且日常频繁变化（领料数量、员工分配），每次按窗口内全部工单重新读取
+  - AFVC/AFVV 的修改（工序描述、标准值）不一定更新 AUFK.AEDAT，增量同步发现不了：距上次全量同步超过
+    SAP_REPLICA_FULL_INTERVAL 秒（默认3600）时，sync 自动改为全量同步
+  - --full：重新读取整个窗口
+
+副本存在、上次同步距今不超过 SAP_REPLICA_MAX_AGE 秒（默认900）且上次全量同步距今不超过
+SAP_REPLICA_FULL_INTERVAL + SAP_REPLICA_MAX_AGE 秒时，get_order_details 和 get_production_order_data
+对副本中的工单直接从本地读取这些表（不经过SAP），其余表（MAKT/MARA/CRHD/CRTX）仍经过主数据缓存和SAP；
+工单不在副本中或副本过期时按原方式读取SAP。
+
+命令行：
+  python sap_replica.py sync --werks 1000 --from 20250101 --to 20250131 [--full]
+  python sap_replica.py sync-all        # 对已同步过的所有窗口执行增量同步（适合定时任务）
+  python sap_replica.py status
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import datetime
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sap_common import SapTablePages, build_in_options, open_connection, pooled_connection, IN_QUERY_CHUNK_SIZE
+from sap_decoder import get_decoder
+from sap_metrics import phase
+from sap_where import NUMERIC_TYPES, WhereSyntaxError, format_value, parse_where
+
+if TYPE_CHECKING:
+    from pyrfc import Connection
+
+# 副本中保存的字段（两个脚本读取的字段的并集及同步所需的日期字段）
+REPLICA_FIELDS = {
+    'AUFK': ['AUFNR', 'AUART', 'KDAUF', 'KDPOS', 'ERNAM', 'ERDAT', 'AENAM', 'AEDAT', 'OBJNR', 'WERKS', 'LOEKZ'],
+    'AFKO': ['AUFNR', 'GSTRP', 'GLTRP', 'GAMNG', 'GMEIN', 'PLNBEZ', 'DISPO', 'FEVOR', 'AUFPL'],
+    'AFVC': ['AUFPL', 'APLZL', 'VORNR', 'LTXA1', 'ARBID', 'OBJNR', 'STEUS'],
+    'AFVV': ['AUFPL', 'APLZL', 'VGW01', 'VGE01', 'VGW02', 'VGE02', 'VGW03', 'VGE03', 'VGW04', 'VGE04', 'BMSCH'],
+    'RESB': ['RSNUM', 'RSPOS', 'AUFNR', 'WERKS', 'MATNR', 'BDMNG', 'MEINS', 'ENMNG', 'POSNR', 'BDTER', 'XLOEK'],
+    'ZAFVC': ['AUFNR', 'VORNR', 'PERNR', 'PERNM', 'ASENG', 'PEROR', 'REMAK'],
+}
+REPLICA_KEYS = {
+    'AUFK': ('AUFNR',), 'AFKO': ('AUFNR',), 'AFVC': ('AUFPL', 'APLZL'), 'AFVV': ('AUFPL', 'APLZL'),
+    'RESB': ('RSNUM', 'RSPOS'), 'ZAFVC': None,
+}
+REPLICA_INDEXES = {
+    'AUFK': [('WERKS', 'AEDAT')],
+    'AFKO': [('GSTRP',), ('AUFPL',)],
+    'RESB': [('AUFNR',), ('MATNR', 'MEINS')],
+    'ZAFVC': [('AUFNR', 'VORNR')],
+}
+# 没有修改日期的表，每次增量同步按窗口内全部工单重新读取
+VOLATILE_TABLES = ('RESB', 'ZAFVC')
+# 副本可用于回答请求的最长时间（距上次同步开始，秒）
+REPLICA_MAX_AGE = float(os.getenv('SAP_REPLICA_MAX_AGE', '900'))
+# 距上次全量同步超过该时间（秒）时，增量同步改为全量同步
+REPLICA_FULL_INTERVAL = float(os.getenv('SAP_REPLICA_FULL_INTERVAL', '3600'))
+# SQLite 一次 IN 查询的最多参数个数
+SQL_IN_CHUNK = 500
+
+DEFAULT_REPLICA_PATH = os.getenv(
+    'SAP_REPLICA_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'sap_replica.sqlite3')
+)
+
+
+def _sap_number(value):
+    """SAP数值文本（负号在末尾，如 "12.500-"）转浮点数，供SQL比较使用"""
+    value = (value or '').replace(' ', '')
+    if not value:
+        return 0.0
+    try:
+        return -float(value[:-1]) if value.endswith('-') else float(value)
+    except ValueError:
+        return None
+
+
+def _chunks(values: List, size: int) -> Iterable[List]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class ReplicaUnsupported(Exception):
+    """副本无法回答的查询（字段未同步或条件无法转换），应改为读取SAP"""
+
+
+class SapReplica:
+    """本地副本：同步、按SAP表查询及新鲜度检查"""
+
+    def __init__(self, path: str = DEFAULT_REPLICA_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.create_function('sap_number', 1, _sap_number, deterministic=True)
+        self._lock = threading.Lock()
+        self._field_meta = {}
+        self._create_schema()
+
+    def _create_schema(self):
+        statements = [
+            "CREATE TABLE IF NOT EXISTS replica_scopes ("
+            " scope TEXT PRIMARY KEY, werks TEXT NOT NULL, date_from TEXT NOT NULL, date_to TEXT NOT NULL,"
+            " last_sync REAL NOT NULL, last_full_sync REAL NOT NULL, change_date TEXT NOT NULL)",
+            "CREATE TABLE IF NOT EXISTS replica_orders (AUFNR TEXT PRIMARY KEY, scope TEXT NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS replica_orders_scope ON replica_orders (scope)",
+            "CREATE TABLE IF NOT EXISTS replica_fields ("
+            " tbl TEXT NOT NULL, field TEXT NOT NULL, type TEXT NOT NULL, length INTEGER NOT NULL,"
+            " PRIMARY KEY (tbl, field))",
+        ]
+        for table, fields in REPLICA_FIELDS.items():
+            columns = ', '.join(f'"{f}" TEXT NOT NULL' for f in fields)
+            keys = REPLICA_KEYS[table]
+            primary = f', PRIMARY KEY ({", ".join(keys)})' if keys else ''
+            statements.append(f'CREATE TABLE IF NOT EXISTS {table.lower()} ({columns}{primary})')
+            for columns_ in REPLICA_INDEXES.get(table, []):
+                name = f'{table.lower()}_{"_".join(c.lower() for c in columns_)}'
+                statements.append(f'CREATE INDEX IF NOT EXISTS {name} ON {table.lower()} ({", ".join(columns_)})')
+        with self._lock:
+            for statement in statements:
+                self._db.execute(statement)
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def field_meta(self, table: str) -> Dict[str, Tuple[str, int]]:
+        """同步时记录的 RFC_READ_TABLE 字段类型与长度"""
+        meta = self._field_meta.get(table)
+        if meta is None:
+            with self._lock:
+                rows = self._db.execute("SELECT field, type, length FROM replica_fields WHERE tbl = ?",
+                                        (table,)).fetchall()
+            meta = {field: (field_type, length) for field, field_type, length in rows}
+            if meta:
+                self._field_meta[table] = meta
+        return meta
+
+    def covers(self, order_numbers: Iterable[str], max_age: float = REPLICA_MAX_AGE) -> bool:
+        """所有工单都在副本中，且所在窗口的上次同步距今不超过 max_age 秒、上次全量同步不超过
+        REPLICA_FULL_INTERVAL + max_age 秒（增量同步发现不了的修改最多延迟这么久）"""
+        aufnrs = sorted({str(n).zfill(12) for n in order_numbers})
+        if not aufnrs or max_age <= 0:
+            return False
+        now = time.time()
+        found = 0
+        with self._lock:
+            for chunk in _chunks(aufnrs, SQL_IN_CHUNK):
+                found += self._db.execute(
+                    f"SELECT COUNT(*) FROM replica_orders o JOIN replica_scopes s ON o.scope = s.scope"
+                    f" WHERE o.AUFNR IN ({', '.join('?' * len(chunk))}) AND s.last_sync >= ? AND s.last_full_sync >= ?",
+                    chunk + [now - max_age, now - REPLICA_FULL_INTERVAL - max_age]).fetchone()[0]
+        return found == len(aufnrs)
+
+    def covers_window(self, werks: str, date_from: str, date_to: str, max_age: float = REPLICA_MAX_AGE) -> bool:
+        """某个同步窗口包含该工厂的整个计划开始日期范围，且同步时间满足 covers() 的条件"""
+        if max_age <= 0:
+            return False
+        now = time.time()
+        with self._lock:
+            found = self._db.execute(
+                "SELECT COUNT(*) FROM replica_scopes WHERE werks = ? AND date_from <= ? AND date_to >= ?"
+                " AND last_sync >= ? AND last_full_sync >= ?",
+                (werks, date_from, date_to, now - max_age, now - REPLICA_FULL_INTERVAL - max_age)).fetchone()[0]
+        return found > 0
+
+    def read_table(self, QUERY_TABLE: str, FIELDS=(), OPTIONS=(), DELIMITER: str = '', ROWSKIPS: int = 0,
+                   ROWCOUNT: int = 0, **_) -> Dict:
+        """按 RFC_READ_TABLE 的参数从副本查询，返回相同格式的 {"DATA", "FIELDS"}
+
+        请求了未同步的字段或条件无法转换为SQL时抛出 ReplicaUnsupported。
+        """
+        meta = self.field_meta(QUERY_TABLE)
+        names = [f['FIELDNAME'] if isinstance(f, dict) else f for f in FIELDS or []] or REPLICA_FIELDS[QUERY_TABLE]
+        if not meta or any(name not in meta for name in names):
+            raise ReplicaUnsupported(f'{QUERY_TABLE} 字段未同步')
+        try:
+            where_sql, params = _to_sql(parse_where(' '.join(o['TEXT'] for o in OPTIONS or [])),
+                                        {k: v[0] for k, v in meta.items()})
+        except WhereSyntaxError as e:
+            raise ReplicaUnsupported(str(e))
+
+        sql = f'SELECT {", ".join(names)} FROM {QUERY_TABLE.lower()}'
+        if where_sql:
+            sql += f' WHERE {where_sql}'
+        sql += ' ORDER BY rowid LIMIT ? OFFSET ?'
+        with self._lock:
+            rows = self._db.execute(sql, params + [ROWCOUNT or -1, ROWSKIPS or 0]).fetchall()
+
+        fields = []
+        offset = 0
+        for i, name in enumerate(names):
+            field_type, length = meta[name]
+            fields.append({'FIELDNAME': name, 'OFFSET': str(offset).zfill(6), 'LENGTH': str(length).zfill(6),
+                           'TYPE': field_type, 'FIELDTEXT': name})
+            offset += length + (len(DELIMITER) if i < len(names) - 1 else 0)
+        layout = [meta[name] for name in names]
+        data = [{'WA': DELIMITER.join(format_value(value, *spec) for value, spec in zip(row, layout))}
+                for row in rows]
+        return {'DATA': data, 'FIELDS': fields}
+
+    # ------------------------------------------------------------------
+    # 同步
+    # ------------------------------------------------------------------
+
+    def sync(self, conn: Connection, werks: str, date_from: str, date_to: str, full: bool = False) -> Dict:
+        """同步一个 工厂 + 计划开始日期 窗口；该窗口从未同步过或上次全量同步已超过 REPLICA_FULL_INTERVAL 秒时
+        执行全量同步"""
+        scope = f'{werks}|{date_from}|{date_to}'
+        with self._lock:
+            state = self._db.execute("SELECT change_date, last_full_sync FROM replica_scopes WHERE scope = ?",
+                                     (scope,)).fetchone()
+        started = time.time()
+        with phase('replica.sync'):
+            if full or state is None or started - state[1] >= REPLICA_FULL_INTERVAL:
+                stats = self._full_sync(conn, scope, werks, date_from, date_to)
+                last_full_sync = started
+            else:
+                stats = self._incremental_sync(conn, scope, werks, date_from, date_to, state[0])
+                last_full_sync = state[1]
+        # 记录同步开始的时间和日期：同步期间发生的修改在下一次增量同步时会再次读取
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO replica_scopes"
+                " (scope, werks, date_from, date_to, last_sync, last_full_sync, change_date)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (scope, werks, date_from, date_to, started, last_full_sync,
+                 datetime.date.fromtimestamp(started).strftime('%Y%m%d')))
+        stats.update({'scope': scope, 'mode': 'full' if last_full_sync == started else 'incremental',
+                      'seconds': round(time.time() - started, 3)})
+        return stats
+
+    def sync_all(self, conn: Connection) -> List[Dict]:
+        """对已同步过的所有窗口执行增量同步（距上次全量同步超过 REPLICA_FULL_INTERVAL 秒的窗口执行全量同步）"""
+        with self._lock:
+            scopes = self._db.execute("SELECT werks, date_from, date_to FROM replica_scopes ORDER BY scope").fetchall()
+        return [self.sync(conn, *scope) for scope in scopes]
+
+    def _full_sync(self, conn: Connection, scope: str, werks: str, date_from: str, date_to: str) -> Dict:
+        afko = self._fetch(conn, 'AFKO', [f"GSTRP >= '{date_from}' AND GSTRP <= '{date_to}'"])
+        aufk = self._fetch_in(conn, 'AUFK', 'AUFNR', [row['AUFNR'] for row in afko], f"WERKS = '{werks}'")
+        orders = {row['AUFNR'] for row in aufk}
+        afko = [row for row in afko if row['AUFNR'] in orders]
+        tables = self._fetch_details(conn, aufk, afko, REPLICA_FIELDS)
+        with self._lock:
+            previous = {r[0] for r in self._db.execute("SELECT AUFNR FROM replica_orders WHERE scope = ?", (scope,))}
+        removed = sorted(previous - orders)
+        self._store(scope, sorted(orders), tables, removed)
+        return {'orders': len(orders), 'orders_reloaded': len(orders), 'orders_removed': len(removed),
+                'rows': {table: len(rows) for table, rows in tables.items()}}
+
+    def _incremental_sync(self, conn: Connection, scope: str, werks: str, date_from: str, date_to: str,
+                          change_date: str) -> Dict:
+        # 按SAP服务器与本机的时区差留出一天重叠
+        since = (datetime.datetime.strptime(change_date, '%Y%m%d') - datetime.timedelta(days=1)).strftime('%Y%m%d')
+        # AFKO 没有修改日期：每次读取窗口内的全部工单，改期进出窗口和 AFKO 本身的修改都由此发现
+        window_afko = {row['AUFNR']: row for row in
+                       self._fetch(conn, 'AFKO', [f"GSTRP >= '{date_from}' AND GSTRP <= '{date_to}'"])}
+        changed_aufk = self._fetch(conn, 'AUFK', [f"WERKS = '{werks}' AND ( AEDAT >= '{since}'",
+                                                  f"OR ERDAT >= '{since}' )"])
+        changed = {row['AUFNR'] for row in changed_aufk}
+        with self._lock:
+            previous = {r[0] for r in self._db.execute("SELECT AUFNR FROM replica_orders WHERE scope = ?", (scope,))}
+        stored_afko = self._stored_rows('AFKO', sorted(previous & set(window_afko)))
+
+        # 副本中 AFKO 有变化的工单，以及改期进入窗口的工单（需要读取 AUFK 确认工厂）重新读取全部表
+        afko_changed = [aufnr for aufnr, row in stored_afko.items() if aufnr not in changed
+                        and tuple(row) != tuple(window_afko[aufnr].get(f, '') for f in REPLICA_FIELDS['AFKO'])]
+        unknown = [aufnr for aufnr in window_afko if aufnr not in previous and aufnr not in changed]
+        aufk = [row for row in changed_aufk if row['AUFNR'] in window_afko]
+        aufk += self._fetch_in(conn, 'AUFK', 'AUFNR', afko_changed + unknown, f"WERKS = '{werks}'")
+        reloaded = {row['AUFNR'] for row in aufk}
+        afko = [window_afko[aufnr] for aufnr in window_afko if aufnr in reloaded]
+        tables = self._fetch_details(conn, aufk, afko, REPLICA_FIELDS)
+
+        # 计划开始日期移出窗口，或重新读取时已不属于该工厂的工单
+        removed = sorted((previous - set(window_afko)) | (set(afko_changed) - reloaded))
+        # 其余工单只重新读取没有修改日期的表
+        unchanged = sorted(previous - reloaded - set(removed))
+        volatile = self._fetch_details(conn, [], [], {t: REPLICA_FIELDS[t] for t in VOLATILE_TABLES}, unchanged)
+        self._store(scope, sorted(reloaded), tables, removed, unchanged, volatile)
+        return {'orders': len(unchanged) + len(reloaded), 'orders_reloaded': len(reloaded),
+                'orders_removed': len(removed),
+                'rows': {table: len(tables.get(table, [])) + len(volatile.get(table, [])) for table in REPLICA_FIELDS}}
+
+    def _stored_rows(self, table: str, aufnrs: List[str]) -> Dict[str, Tuple]:
+        """副本中工单的行（按 REPLICA_FIELDS 的字段顺序），表以 AUFNR 为键"""
+        rows = {}
+        fields = REPLICA_FIELDS[table]
+        with self._lock:
+            for chunk in _chunks(aufnrs, SQL_IN_CHUNK):
+                for row in self._db.execute(f'SELECT {", ".join(fields)} FROM {table.lower()}'
+                                            f' WHERE AUFNR IN ({", ".join("?" * len(chunk))})', chunk):
+                    rows[row[fields.index('AUFNR')]] = row
+        return rows
+
+    def _fetch_details(self, conn: Connection, aufk: List[Dict], afko: List[Dict], tables: Dict[str, List[str]],
+                       volatile_orders: Optional[List[str]] = None) -> Dict[str, List[Dict]]:
+        """读取工单的工序、工时、组件和员工分配；volatile_orders 不为空时只读取这些工单的 RESB/ZAFVC"""
+        aufnrs = volatile_orders if volatile_orders is not None else [row['AUFNR'] for row in afko]
+        aufpls = [row['AUFPL'] for row in afko]
+        result = {}
+        if 'AUFK' in tables:
+            result['AUFK'] = aufk
+        if 'AFKO' in tables:
+            result['AFKO'] = afko
+        if 'AFVC' in tables:
+            result['AFVC'] = self._fetch_in(conn, 'AFVC', 'AUFPL', aufpls)
+        if 'AFVV' in tables:
+            result['AFVV'] = self._fetch_in(conn, 'AFVV', 'AUFPL', aufpls)
+        if 'RESB' in tables:
+            result['RESB'] = self._fetch_in(conn, 'RESB', 'AUFNR', aufnrs)
+        if 'ZAFVC' in tables:
+            result['ZAFVC'] = self._fetch_in(conn, 'ZAFVC', 'AUFNR', aufnrs)
+        return result
+
+    def _fetch(self, conn: Connection, table: str, where_lines: List[str]) -> List[Dict]:
+        """分页读取全部匹配的行（出错时抛出异常，同步不接受部分数据），并记录字段元数据"""
+        rows = []
+        pages = SapTablePages(conn, table, REPLICA_FIELDS[table], where_lines)
+        for page in pages:
+            if page['DATA']:
+                rows.extend(get_decoder(page['FIELDS']).decode_dicts(page['DATA']))
+            self._remember_fields(table, page['FIELDS'])
+        return rows
+
+    def _fetch_in(self, conn: Connection, table: str, key_field: str, values: List[str],
+                  extra_where: str = '') -> List[Dict]:
+        rows = []
+        unique_values = list(dict.fromkeys(v for v in values if v))
+        for chunk in _chunks(unique_values, IN_QUERY_CHUNK_SIZE):
+            rows.extend(self._fetch(conn, table, build_in_options(key_field, chunk, extra_where)))
+        return rows
+
+    def _remember_fields(self, table: str, fields: List[Dict]):
+        if not fields or self._field_meta.get(table):
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO replica_fields (tbl, field, type, length) VALUES (?, ?, ?, ?)",
+                [(table, f['FIELDNAME'], f.get('TYPE', 'C'), int(f['LENGTH'])) for f in fields])
+        self._field_meta.pop(table, None)
+
+    def _store(self, scope: str, orders: List[str], tables: Dict[str, List[Dict]], removed: List[str],
+               volatile_orders: Iterable[str] = (), volatile: Optional[Dict[str, List[Dict]]] = None):
+        """在一个事务中替换 orders（全部表）与 volatile_orders（RESB/ZAFVC）的数据，删除 removed 的数据"""
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete_orders(list(orders) + list(removed), REPLICA_FIELDS)
+                self._delete_orders(list(volatile_orders), VOLATILE_TABLES)
+                for table, rows in list(tables.items()) + list((volatile or {}).items()):
+                    fields = REPLICA_FIELDS[table]
+                    db.executemany(
+                        f'INSERT OR REPLACE INTO {table.lower()} ({", ".join(fields)})'
+                        f' VALUES ({", ".join("?" * len(fields))})',
+                        [tuple(row.get(f, '') for f in fields) for row in rows])
+                for chunk in _chunks(removed, SQL_IN_CHUNK):
+                    db.execute(f"DELETE FROM replica_orders WHERE scope = ? AND AUFNR IN ({', '.join('?' * len(chunk))})",
+                               [scope] + chunk)
+                db.executemany("INSERT OR REPLACE INTO replica_orders (AUFNR, scope) VALUES (?, ?)",
+                               [(aufnr, scope) for aufnr in orders])
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _delete_orders(self, aufnrs: List[str], tables: Iterable[str]):
+        for chunk in _chunks(aufnrs, SQL_IN_CHUNK):
+            marks = ', '.join('?' * len(chunk))
+            for table in tables:
+                if table in ('AFVC', 'AFVV'):
+                    self._db.execute(f"DELETE FROM {table.lower()} WHERE AUFPL IN"
+                                     f" (SELECT AUFPL FROM afko WHERE AUFNR IN ({marks}))", chunk)
+            for table in tables:
+                if table not in ('AFVC', 'AFVV'):
+                    self._db.execute(f"DELETE FROM {table.lower()} WHERE AUFNR IN ({marks})", chunk)
+
+    def status(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            scopes = self._db.execute(
+                "SELECT s.scope, s.werks, s.date_from, s.date_to, s.last_sync, s.last_full_sync,"
+                " (SELECT COUNT(*) FROM replica_orders o WHERE o.scope = s.scope)"
+                " FROM replica_scopes s ORDER BY s.scope").fetchall()
+            counts = {table: self._db.execute(f"SELECT COUNT(*) FROM {table.lower()}").fetchone()[0]
+                      for table in REPLICA_FIELDS}
+        return {
+            'path': self.path,
+            'max_age': REPLICA_MAX_AGE,
+            'full_interval': REPLICA_FULL_INTERVAL,
+            'scopes': [{'werks': werks, 'date_from': date_from, 'date_to': date_to, 'orders': orders,
+                        'age_seconds': round(now - last_sync, 1), 'full_sync_age_seconds': round(now - last_full, 1),
+                        'fresh': now - last_sync <= REPLICA_MAX_AGE
+                                 and now - last_full <= REPLICA_FULL_INTERVAL + REPLICA_MAX_AGE}
+                       for _, werks, date_from, date_to, last_sync, last_full, orders in scopes],
+            'rows': counts,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_SQL_OPERATORS = {'=': '=', '<>': '<>', '>': '>', '<': '<', '>=': '>=', '<=': '<='}
+
+
+def _to_sql(node, field_types: Dict[str, str]) -> Tuple[str, List]:
+    """把 WHERE 语法树（sap_where.parse_where）转换为SQL条件和参数"""
+    if node is None:
+        return '', []
+    kind = node[0]
+    if kind in ('and', 'or'):
+        parts = [_to_sql(child, field_types) for child in node[1]]
+        return '(' + f' {kind.upper()} '.join(sql for sql, _ in parts) + ')', [p for _, params in parts for p in params]
+    if kind == 'not':
+        sql, params = _to_sql(node[1], field_types)
+        return f'NOT ({sql})', params
+
+    field = node[1]
+    if field not in field_types:
+        raise WhereSyntaxError(f'字段 {field} 不存在')
+    numeric = field_types[field] in NUMERIC_TYPES
+    column = f'sap_number("{field}")' if numeric else f'"{field}"'
+
+    def value(text):
+        return _sap_number(text) if numeric else text.rstrip()
+
+    if kind == 'cmp':
+        return f'{column} {_SQL_OPERATORS[node[2]]} ?', [value(node[3])]
+    if kind == 'in':
+        return f'{column} IN ({", ".join("?" * len(node[2]))})', [value(v) for v in node[2]]
+    if kind == 'between':
+        return f'{column} BETWEEN ? AND ?', [value(node[2]), value(node[3])]
+    if kind == 'like':
+        # ABAP 的 LIKE 区分大小写，使用 GLOB；GLOB 的特殊字符按字面匹配
+        pattern = ''.join('*' if c == '%' else '?' if c == '_' else f'[{c}]' if c in '*?[' else c
+                          for c in node[2].rstrip())
+        return f'"{field}" GLOB ?', [pattern]
+    if kind == 'initial':
+        if numeric:
+            return f'{column} = 0', []
+        if field_types[field] in ('N', 'D', 'T'):
+            return f"ltrim(\"{field}\", '0') = ''", []
+        return f'"{field}" = \'\'', []
+    raise WhereSyntaxError(kind)
+
+
+class ReplicaConnection:
+    """对副本中的表从本地回答 RFC_READ_TABLE，其余调用转给SAP连接
+
+    conn 为空时在第一次需要SAP时才通过 connect 取得连接（默认从连接池借用），并在 close() 时关闭（归还）；
+    传入的 conn 由调用方负责关闭。
+    """
+
+    def __init__(self, replica: SapReplica, conn: Optional[Connection] = None,
+                 connect: Callable[[], Connection] = pooled_connection):
+        self.replica = replica
+        self._conn = conn
+        self._connect = connect
+        self._owns_conn = False
+        self.alive = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _sap(self) -> Connection:
+        if self._conn is None:
+            self._conn = self._connect()
+            self._owns_conn = True
+        return self._conn
+
+    def call(self, func_name: str, **params) -> Dict:
+        if func_name == 'RFC_READ_TABLE' and params.get('QUERY_TABLE') in REPLICA_FIELDS:
+            try:
+                result = self.replica.read_table(**params)
+            except ReplicaUnsupported:
+                pass
+            else:
+                # 调用计数中与真实的RFC调用区分开（见 sap_metrics.call_rfc）
+                result['_served_by'] = 'REPLICA_READ_TABLE'
+                return result
+        return self._sap().call(func_name, **params)
+
+    def ping(self):
+        return self._sap().ping()
+
+    def close(self):
+        if self._owns_conn and self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._conn = None
+        self._owns_conn = False
+
+
+_replicas = {}
+_replicas_lock = threading.Lock()
+
+
+def get_replica(path: str = DEFAULT_REPLICA_PATH) -> Optional[SapReplica]:
+    """进程内共享的副本；副本文件不存在（从未同步）或设置 SAP_REPLICA_DISABLED=1 时返回 None"""
+    if os.getenv('SAP_REPLICA_DISABLED') == '1':
+        return None
+    with _replicas_lock:
+        replica = _replicas.get(path)
+        if replica is None:
+            if not os.path.exists(path):
+                return None
+            try:
+                replica = _replicas[path] = SapReplica(path)
+            except sqlite3.Error:
+                return None
+        return replica
+
+
+def replica_connection(order_numbers: Iterable[str], conn: Optional[Connection] = None,
+                       max_age: Optional[float] = None,
+                       connect: Callable[[], Connection] = pooled_connection) -> Optional[ReplicaConnection]:
+    """工单都在副本中且副本足够新时返回从副本读取的连接，否则返回 None（调用方按原方式读取SAP）"""
+    replica = get_replica()
+    if replica is None:
+        return None
+    try:
+        if not replica.covers(order_numbers, REPLICA_MAX_AGE if max_age is None else max_age):
+            return None
+    except sqlite3.Error:
+        return None
+    return ReplicaConnection(replica, conn, connect)
+
+
+def replica_window_connection(werks: str, date_from: str, date_to: str, conn: Optional[Connection] = None,
+                              max_age: Optional[float] = None,
+                              connect: Callable[[], Connection] = pooled_connection) -> Optional[ReplicaConnection]:
+    """该工厂的计划开始日期范围在副本的同步窗口内且副本足够新时返回从副本读取的连接，否则返回 None"""
+    replica = get_replica()
+    if replica is None:
+        return None
+    try:
+        if not replica.covers_window(werks, date_from, date_to, REPLICA_MAX_AGE if max_age is None else max_age):
+            return None
+    except sqlite3.Error:
+        return None
+    return ReplicaConnection(replica, conn, connect)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description='生产订单表的本地SQLite副本')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    sync_parser = subparsers.add_parser('sync', help='同步一个 工厂 + 计划开始日期 窗口')
+    sync_parser.add_argument('--werks', required=True, help='工厂')
+    sync_parser.add_argument('--from', dest='date_from', required=True, help='计划开始日期起（YYYYMMDD）')
+    sync_parser.add_argument('--to', dest='date_to', required=True, help='计划开始日期止（YYYYMMDD）')
+    sync_parser.add_argument('--full', action='store_true', help='重新读取整个窗口')
+    subparsers.add_parser('sync-all', help='对已同步过的所有窗口执行增量同步（到期时全量）')
+    subparsers.add_parser('status', help='各窗口的工单数和上次同步时间')
+    args = parser.parse_args()
+
+    try:
+        replica = SapReplica()
+        if args.command == 'status':
+            print(json.dumps({'success': True, **replica.status()}, ensure_ascii=False))
+            sys.exit(0)
+        with open_connection() as conn:
+            if args.command == 'sync':
+                result = replica.sync(conn, args.werks, args.date_from, args.date_to, args.full)
+            else:
+                result = {'scopes': replica.sync_all(conn)}
+        print(json.dumps({'success': True, **result}, ensure_ascii=False))
+    except Exception as e:
+        print(json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False))
+        sys.exit(1)
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""多工单组件需求汇总：按 物料 + 单位 汇总 RESB 的需求数量（BDMNG）与已领数量（ENMNG）
+
+缺料分析需要几百个工单的组件需求合计：
+  - 按工单号（或 工厂 + 计划开始日期范围）分批、分页读取 RESB，只读取汇总需要的字段，已删除的预留行（XLOEK）不读取
+  - 每页用 sap_decoder 解析为元组后追加到列式数组（工单序号、物料序号、需求数量、已领数量），不为每行构建字典，
+    内存中不保留原始数据
+  - 最后一次性按 物料 + 单位 以及 工单 + 物料 + 单位 汇总；安装了 NumPy 时用 bincount 向量化计算，
+    否则用纯Python逐行累加（结果相同）
+未领数量按行计算（需求 - 已领，超领的行计为0）后再合计，一个工单超领不会抵消另一个工单的缺口。
+工单都在本地副本中（见 sap_replica.py）时从副本读取。
+
+用法：
+  python sap_requirements.py 1000001,1000002 1000003
+  python sap_requirements.py --werks 1000 --from 20250101 --to 20250131 [--totals-only]
+  python sap_requirements.py --bench 100000        # 使用构造数据测量汇总耗时，无需SAP
+"""
+
+from __future__ import annotations
+
+import sys
+import json
+import time
+import argparse
+from array import array
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from sap_breaker import BATCH_REQUEST_DEADLINE, error_message, request_deadline
+from sap_common import SapTablePages, IN_QUERY_CHUNK_SIZE, build_in_options, orders_in_window, pooled_connection
+from sap_decoder import get_decoder
+from sap_metrics import phase
+from sap_replica import replica_connection, replica_window_connection
+
+if TYPE_CHECKING:
+    from pyrfc import Connection
+
+RESB_FIELDS = ['AUFNR', 'MATNR', 'MEINS', 'BDMNG', 'ENMNG']
+# 数量保留的小数位数（与SAP数量字段一致）
+QUANTITY_DECIMALS = 3
+
+
+def _numpy():
+    """NumPy 为可选依赖，未安装时返回 None"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _display_number(value: str) -> str:
+    """去除工单号、物料码的前导零（非纯数字保持原样）"""
+    return str(int(value)) if value.isdigit() else value
+
+
+def _quantity(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    value = value.replace(' ', '')
+    if not value:
+        return 0.0
+    # 负号在末尾，例如联产品的 "12.500-"
+    return -float(value[:-1]) if value.endswith('-') else float(value)
+
+
+def _quantities(values: List[str]) -> array:
+    """数量文本批量转浮点数；一页中有负数或空值时改为逐个转换"""
+    try:
+        return array('d', map(float, values))
+    except ValueError:
+        return array('d', map(_quantity, values))
+
+
+class RequirementRollup:
+    """按页累积 RESB 行（列式存储），最后一次性汇总
+
+    每页的行由 sap_decoder 按该页 FIELDS 编译（并缓存）的解析器切片，不依赖字段顺序和 DELIMITER。
+    """
+
+    def __init__(self):
+        # 工单号 -> 序号；(物料码, 单位) -> 序号
+        self.orders = {}
+        self.materials = {}
+        self._order_index = array('q')
+        self._material_index = array('q')
+        self._required = array('d')
+        self._withdrawn = array('d')
+
+    @property
+    def lines(self) -> int:
+        return len(self._required)
+
+    def add_order(self, aufnr: str):
+        """登记没有组件的工单，使其出现在按工单的结果中"""
+        self.orders.setdefault(aufnr, len(self.orders))
+
+    def add_page(self, page: Dict):
+        """追加一页 RFC_READ_TABLE 结果（字段为 RESB_FIELDS）"""
+        data = page['DATA']
+        if not data:
+            return
+        decoder = get_decoder(page['FIELDS'], 'raw')
+        positions = [decoder.names.index(name) for name in RESB_FIELDS]
+        # 转置为各字段的列，工单号和 物料+单位 查找序号，数量整列转换
+        columns = list(zip(*decoder.decode_tuples(data)))
+        aufnrs, matnrs, units, required, withdrawn = (columns[i] for i in positions)
+        orders = self.orders
+        materials = self.materials
+        self._order_index.extend(orders.setdefault(aufnr, len(orders)) for aufnr in aufnrs)
+        self._material_index.extend(materials.setdefault(key, len(materials)) for key in zip(matnrs, units))
+        self._required.extend(_quantities(required))
+        self._withdrawn.extend(_quantities(withdrawn))
+
+    def result(self, include_orders: bool = True, use_numpy: Optional[bool] = None) -> Dict:
+        """返回按物料汇总的结果，include_orders 时附带每个工单按物料汇总的明细，均按物料码、单位排序
+
+        use_numpy 为空时安装了 NumPy 就使用。
+        """
+        np = _numpy() if use_numpy is not False else None
+        if use_numpy and np is None:
+            raise RuntimeError('未安装 NumPy')
+        # 物料按 (物料码, 单位) 排序后的名次，汇总结果按名次排列
+        keys = sorted(self.materials)
+        rank = [0] * len(keys)
+        for position, key in enumerate(keys):
+            rank[self.materials[key]] = position
+        with phase('requirements.aggregate'):
+            if np is not None:
+                totals, pairs = self._aggregate_numpy(np, rank)
+            else:
+                totals, pairs = self._aggregate_python(rank)
+
+        display_keys = [(_display_number(matnr), unit) for matnr, unit in keys]
+        materials = [
+            {'matnr': matnr, 'unit': unit, 'required_qty': required, 'withdrawn_qty': withdrawn,
+             'open_qty': open_qty, 'orders': order_count, 'lines': lines}
+            for (matnr, unit), required, withdrawn, open_qty, lines, order_count in zip(display_keys, *totals)
+        ]
+        result = {
+            'success': True,
+            'orders': len(self.orders),
+            'lines': self.lines,
+            'materials': materials,
+        }
+        if include_orders:
+            by_order = [[] for _ in self.orders]
+            for order, position, required, withdrawn, open_qty in zip(*pairs):
+                matnr, unit = display_keys[position]
+                by_order[order].append({'matnr': matnr, 'unit': unit, 'required_qty': required,
+                                        'withdrawn_qty': withdrawn, 'open_qty': open_qty})
+            result['by_order'] = {_display_number(aufnr): components
+                                  for aufnr, components in zip(self.orders, by_order)}
+        return result
+
+    def _aggregate_numpy(self, np, rank: List[int]):
+        count = len(rank)
+        if self.lines:
+            order_index = np.frombuffer(self._order_index, dtype=np.int64)
+            material_rank = np.asarray(rank, dtype=np.int64)[np.frombuffer(self._material_index, dtype=np.int64)]
+            required = np.frombuffer(self._required, dtype=np.float64)
+            withdrawn = np.frombuffer(self._withdrawn, dtype=np.float64)
+        else:
+            order_index = material_rank = np.zeros(0, np.int64)
+            required = withdrawn = np.zeros(0)
+        quantities = (required, withdrawn, np.maximum(required - withdrawn, 0.0))
+
+        # 工单 + 物料 组合为一个整数键，unique 后按组合汇总（组合按工单序号、物料名次排序）
+        pair_keys, pair_inverse = np.unique(order_index * max(count, 1) + material_rank, return_inverse=True)
+        pair_ranks = pair_keys % max(count, 1)
+
+        def rounded(values):
+            return np.round(values, QUANTITY_DECIMALS).tolist()
+
+        totals = tuple(rounded(np.bincount(material_rank, weights=values, minlength=count)) for values in quantities)
+        totals += (np.bincount(material_rank, minlength=count).tolist(),
+                   np.bincount(pair_ranks, minlength=count).tolist())
+        pairs = (
+            (pair_keys // max(count, 1)).tolist(),
+            pair_ranks.tolist(),
+        ) + tuple(rounded(np.bincount(pair_inverse, weights=values, minlength=len(pair_keys)))
+                  for values in quantities)
+        return totals, pairs
+
+    def _aggregate_python(self, rank: List[int]):
+        count = len(rank)
+        totals = ([0.0] * count, [0.0] * count, [0.0] * count)
+        required_totals, withdrawn_totals, open_totals = totals
+        lines = [0] * count
+        pair_sums = {}
+        for order, material, required, withdrawn in zip(
+                self._order_index, self._material_index, self._required, self._withdrawn):
+            position = rank[material]
+            open_qty = required - withdrawn if required > withdrawn else 0.0
+            required_totals[position] += required
+            withdrawn_totals[position] += withdrawn
+            open_totals[position] += open_qty
+            lines[position] += 1
+            sums = pair_sums.get((order, position))
+            if sums is None:
+                pair_sums[(order, position)] = [required, withdrawn, open_qty]
+            else:
+                sums[0] += required
+                sums[1] += withdrawn
+                sums[2] += open_qty
+
+        order_counts = [0] * count
+        for _, position in pair_sums:
+            order_counts[position] += 1
+        ordered = sorted(pair_sums.items())
+
+        def rounded(values):
+            return [round(v, QUANTITY_DECIMALS) for v in values]
+
+        pairs = (
+            [key[0] for key, _ in ordered],
+            [key[1] for key, _ in ordered],
+        ) + tuple(rounded(sums[i] for _, sums in ordered) for i in range(3))
+        return tuple(rounded(t) for t in totals) + (lines, order_counts), pairs
+
+
+def read_requirements(conn: Connection, aufnrs: Iterable[str], rollup: Optional[RequirementRollup] = None) -> RequirementRollup:
+    """按工单号分批分页读取 RESB 并追加到 rollup（出错时抛出异常，不返回部分结果）"""
+    rollup = rollup or RequirementRollup()
+    formatted = list(dict.fromkeys(str(a).strip().zfill(12) for a in aufnrs if str(a).strip()))
+    for aufnr in formatted:
+        rollup.add_order(aufnr)
+    with phase('requirements.read'):
+        for start in range(0, len(formatted), IN_QUERY_CHUNK_SIZE):
+            where = build_in_options('AUFNR', formatted[start:start + IN_QUERY_CHUNK_SIZE], "XLOEK = ''")
+            for page in SapTablePages(conn, 'RESB', RESB_FIELDS, where, delimiter=''):
+                rollup.add_page(page)
+    return rollup
+
+
+def _run(conn: Optional[Connection], build) -> Dict:
+    try:
+        if conn is not None:
+            return build(conn)
+        with request_deadline(BATCH_REQUEST_DEADLINE), pooled_connection() as conn:
+            return build(conn)
+    except Exception as e:
+        return {
+            'success': False,
+            'error': error_message(e)
+        }
+
+
+def get_material_requirements(order_numbers: List[str], conn: Optional[Connection] = None,
+                              include_orders: bool = True) -> Dict:
+    """多个工单的组件需求按物料汇总，include_orders 时附带每个工单的明细
+
+    conn 为空时从连接池借用连接（受批量请求时限 SAP_BATCH_DEADLINE 限制）并在结束后归还；常驻进程（sap_worker.py）会传入已建立的连接复用。
+    """
+    order_numbers = [str(n).strip() for n in order_numbers if str(n).strip()]
+    if not order_numbers:
+        return {'success': False, 'error': '请提供工单号参数'}
+
+    def build(c):
+        replica_conn = replica_connection(order_numbers, c)
+        if replica_conn is not None:
+            with replica_conn:
+                return read_requirements(replica_conn, order_numbers).result(include_orders)
+        return read_requirements(c, order_numbers).result(include_orders)
+    return _run(conn, build)
+
+
+def get_window_requirements(werks: Optional[str], date_from: str, date_to: str, conn: Optional[Connection] = None,
+                            include_orders: bool = True) -> Dict:
+    """计划开始日期在 [date_from, date_to]（YYYYMMDD）内的工单（可按工厂过滤）的组件需求按物料汇总"""
+
+    def build(c):
+        replica_conn = replica_window_connection(werks, date_from, date_to, c) if werks else None
+        source = replica_conn or c
+        try:
+            aufnrs = orders_in_window(source, werks, date_from, date_to)
+            result = read_requirements(source, aufnrs).result(include_orders)
+        finally:
+            if replica_conn is not None:
+                replica_conn.close()
+        return {**result, 'werks': werks, 'date_from': date_from, 'date_to': date_to}
+    return _run(conn, build)
+
+
+def _synthetic_pages(lines: int, orders: int, materials: int) -> List[Dict]:
+    """构造 lines 行 RESB 数据，按 SAP_RFC_PAGE_SIZE 分页（DELIMITER 为空）"""
+    from sap_common import PAGE_SIZE
+    from sap_where import format_value
+
+    layout = [('AUFNR', 'C', 12), ('MATNR', 'C', 18), ('MEINS', 'C', 3), ('BDMNG', 'P', 17), ('ENMNG', 'P', 17)]
+    fields = []
+    offset = 0
+    for name, field_type, length in layout:
+        fields.append({'FIELDNAME': name, 'OFFSET': str(offset).zfill(6), 'LENGTH': str(length).zfill(6),
+                       'TYPE': field_type})
+        offset += length
+    # 每个工单的组件连续排列，物料分散；每200行有一个负需求（联产品）
+    data = [{'WA': ''.join(format_value(value, field_type, length) for value, (_, field_type, length) in zip(
+                (str(1000000 + i * orders // lines).zfill(12), str(300000 + i * 7919 % materials).zfill(18),
+                 'EA' if i % 5 else 'KG', f'{(i % 97) * 1.5:.3f}' + ('-' if i % 200 == 0 else ''),
+                 f'{(i % 13) * 0.5:.3f}'), layout))}
+            for i in range(lines)]
+    return [{'DATA': data[start:start + PAGE_SIZE], 'FIELDS': fields} for start in range(0, lines, PAGE_SIZE)]
+
+
+def _benchmark(lines: int, orders: int, materials: int) -> Dict:
+    """使用构造数据测量解析与汇总耗时"""
+    pages = _synthetic_pages(lines, orders, materials)
+    report = {'lines': lines, 'orders': orders, 'materials': materials, 'numpy': _numpy() is not None, 'seconds': {}}
+    for label, use_numpy in (('numpy', True), ('python', False)):
+        if use_numpy and _numpy() is None:
+            continue
+        started = time.perf_counter()
+        rollup = RequirementRollup()
+        for page in pages:
+            rollup.add_page(page)
+        parsed = time.perf_counter()
+        rollup.result(use_numpy=use_numpy)
+        finished = time.perf_counter()
+        report['seconds'][label] = {'parse': round(parsed - started, 3), 'aggregate': round(finished - parsed, 3),
+                                    'total': round(finished - started, 3)}
+    return report
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description='多工单组件需求汇总（RESB 需求/已领数量按物料汇总）')
+    parser.add_argument('order_numbers', nargs='*', help='工单号，可用逗号分隔')
+    parser.add_argument('--werks', help='工厂（按计划开始日期范围汇总时过滤）')
+    parser.add_argument('--from', dest='date_from', help='计划开始日期起（YYYYMMDD）')
+    parser.add_argument('--to', dest='date_to', help='计划开始日期止（YYYYMMDD）')
+    parser.add_argument('--totals-only', action='store_true', help='只输出按物料的合计，不输出每个工单的明细')
+    parser.add_argument('--bench', type=int, metavar='N', help='使用N行构造数据测量汇总耗时，无需SAP')
+    parser.add_argument('--bench-orders', type=int, default=500, help='基准测试中的工单数')
+    parser.add_argument('--bench-materials', type=int, default=5000, help='基准测试中的物料数')
+    args = parser.parse_args()
+
+    if args.bench:
+        print(json.dumps(_benchmark(args.bench, args.bench_orders, args.bench_materials), ensure_ascii=False, indent=2))
+        sys.exit(0)
+
+    if args.date_from or args.date_to:
+        if not (args.date_from and args.date_to):
+            print(json.dumps({'success': False, 'error': '请同时提供 --from 和 --to'}, ensure_ascii=False))
+            sys.exit(1)
+        result = get_window_requirements(args.werks, args.date_from, args.date_to,
+                                         include_orders=not args.totals_only)
+    else:
+        numbers = [n for arg in args.order_numbers for n in arg.split(',')]
+        result = get_material_requirements(numbers, include_orders=not args.totals_only)
+    print(json.dumps(result, ensure_ascii=False))
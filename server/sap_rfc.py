@@ -1,160 +1,140 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os
 import sys
 import json
-from pyrfc import Connection
-from dotenv import load_dotenv
-
-# 加载环境变量
-load_dotenv()
+from sap_breaker import DEFAULT_REQUEST_DEADLINE, error_message, request_deadline
+from sap_common import SapTablePages, pooled_connection, read_material_descriptions
+from sap_decoder import get_decoder
+from sap_metrics import call_rfc, call_traced, trace_enabled_by_env
+from sap_order import load_order_bundles, remove_leading_zeros
 
 # 设置输出编码为UTF-8
 sys.stdout.reconfigure(encoding='utf-8')
 sys.stderr.reconfigure(encoding='utf-8')
 
-def remove_leading_zeros(value):
-    """去除数字字符串的前导零，但保留至少一位数字"""
-    if value and value.isdigit():
-        return str(int(value))
-    return value
-
 def parse_table_data(data, fields):
-    """解析 SAP RFC_READ_TABLE 返回的数据"""
-    parsed_data = []
-    for row in data:
-        item = {}
-        raw_data = row['WA']
-        
-        for field in fields:
-            offset = int(field['OFFSET'])
-            length = int(field['LENGTH'])
-            value = raw_data[offset:offset+length].strip()
-            
-            # 处理数字类型
-            if field['TYPE'] == 'P' and value:  # 压缩数字
-                try:
-                    value = float(value.replace(' ', ''))
-                except:
-                    value = 0.0
-            elif field['TYPE'] == 'N' and value:  # 数字字符串
-                try:
-                    value = str(int(value))
-                except:
-                    pass  # 保持原样
-            
-            item[field['FIELDNAME']] = value
-        
-        parsed_data.append(item)
+    """解析 SAP RFC_READ_TABLE 返回的数据（P 类型转为浮点数，N 类型去除前导零）"""
+    return get_decoder(fields, 'legacy').decode_dicts(data)
+
+def _read_finished_product(conn, formatted_order_number):
+    """读取产成品信息，返回 (产成品信息, 带前导零的完整物料码)"""
+    afko_result = call_rfc(conn, 'RFC_READ_TABLE',
+                           QUERY_TABLE='AFKO',
+                           OPTIONS=[{"TEXT": f"AUFNR = '{formatted_order_number}'"}],
+                           FIELDS=['PLNBEZ', 'GAMNG', 'GMEIN'])
     
-    return parsed_data
+    finished_product = {}
+    plnbez = ''
+    if afko_result['DATA']:
+        afko_data = parse_table_data(afko_result['DATA'], afko_result['FIELDS'])
+        if afko_data and 'PLNBEZ' in afko_data[0]:
+            # 去除产成品物料码的前导零
+            finished_product_matnr = remove_leading_zeros(afko_data[0]['PLNBEZ'])
+            
+            finished_product = {
+                'matnr': finished_product_matnr,
+                'quantity': afko_data[0].get('GAMNG', ''),
+                'unit': afko_data[0].get('GMEIN', '')
+            }
+            plnbez = afko_data[0]['PLNBEZ']
+    return finished_product, plnbez
 
-def get_order_details(order_number):
-    """获取工单详情"""
-    try:
-        # SAP连接参数从环境变量获取
-        conn_params = {
-            'ashost': '192.168.202.40',
-            'sysnr': '00',
-            'client': '100',
-            'user': os.getenv('SAP_RFC_USERNAME'),
-            'passwd': os.getenv('SAP_RFC_PASSWORD'),
-            'lang': 'ZH'
-        }
+def iter_component_pages(conn, formatted_order_number, finished_product, plnbez):
+    """分页读取工单组件（RESB），每页批量查询物料描述后产出该页的组件列表
+
+    内存中只保留一页数据。第一页（可能为空）同时查询产成品描述并写入 finished_product。
+    """
+    pages = SapTablePages(conn, 'RESB', ['RSNUM', 'MATNR', 'BDMNG', 'MEINS', 'ENMNG', 'POSNR'],
+                          f"AUFNR = '{formatted_order_number}'", delimiter='')
+    for page_number, page in enumerate(pages):
+        resb_data = parse_table_data(page['DATA'], page['FIELDS']) if page['DATA'] else []
         
-        # 确保订单号有正确的格式（添加前导零到12位）
-        formatted_order_number = order_number.zfill(12)
+        # 批量查询本页组件（第一页还包括产成品）的物料描述（查询时需要完整的物料码，带前导零）
+        matnr_list = [item['MATNR'] for item in resb_data if item['MATNR']]
+        if page_number == 0 and finished_product.get('matnr'):
+            matnr_list.insert(0, plnbez)
+        descriptions = read_material_descriptions(conn, matnr_list)
         
-        with Connection(**conn_params) as conn:
-            # 1. 获取产成品信息
-            afko_result = conn.call('RFC_READ_TABLE',
-                                   QUERY_TABLE='AFKO',
-                                   OPTIONS=[{"TEXT": f"AUFNR = '{formatted_order_number}'"}],
-                                   FIELDS=['PLNBEZ', 'GAMNG', 'GMEIN'])
-            
-            finished_product = {}
-            if afko_result['DATA']:
-                afko_data = parse_table_data(afko_result['DATA'], afko_result['FIELDS'])
-                if afko_data and 'PLNBEZ' in afko_data[0]:
-                    # 去除产成品物料码的前导零
-                    finished_product_matnr = remove_leading_zeros(afko_data[0]['PLNBEZ'])
-                    
-                    finished_product = {
-                        'matnr': finished_product_matnr,
-                        'quantity': afko_data[0].get('GAMNG', ''),
-                        'unit': afko_data[0].get('GMEIN', '')
-                    }
-            
-            # 获取产成品描述
-            if finished_product.get('matnr'):
-                # 查询描述时需要完整的物料码（带前导零）
-                makt_result = conn.call('RFC_READ_TABLE',
-                                       QUERY_TABLE='MAKT',
-                                       OPTIONS=[{"TEXT": f"MATNR = '{afko_data[0]['PLNBEZ']}'"}],
-                                       FIELDS=['MAKTX'])
-                
-                if makt_result['DATA']:
-                    makt_data = parse_table_data(makt_result['DATA'], makt_result['FIELDS'])
-                    if makt_data and 'MAKTX' in makt_data[0]:
-                        finished_product['description'] = makt_data[0]['MAKTX']
-            
-            # 2. 获取组件信息
-            resb_result = conn.call('RFC_READ_TABLE',
-                                   QUERY_TABLE='RESB',
-                                   OPTIONS=[{"TEXT": f"AUFNR = '{formatted_order_number}'"}],
-                                   FIELDS=['RSNUM', 'MATNR', 'BDMNG', 'MEINS', 'ENMNG', 'POSNR'])
-            
-            components = []
-            if resb_result['DATA']:
-                resb_data = parse_table_data(resb_result['DATA'], resb_result['FIELDS'])
-                
-                # 获取所有组件物料描述
-                matnr_list = list(set([item['MATNR'] for item in resb_data if item['MATNR']]))
-                descriptions = {}
-                
-                for matnr in matnr_list:
-                    makt_result = conn.call('RFC_READ_TABLE',
-                                           QUERY_TABLE='MAKT',
-                                           OPTIONS=[{"TEXT": f"MATNR = '{matnr}'"}],
-                                           FIELDS=['MAKTX'])
-                    
-                    if makt_result['DATA']:
-                        makt_data = parse_table_data(makt_result['DATA'], makt_result['FIELDS'])
-                        if makt_data and 'MAKTX' in makt_data[0]:
-                            descriptions[matnr] = makt_data[0]['MAKTX']
-                
-                # 构建组件列表
-                for item in resb_data:
-                    # 去除组件物料码的前导零
-                    clean_matnr = remove_leading_zeros(item['MATNR'])
-                    
-                    components.append({
-                        'matnr': clean_matnr,
-                        'description': descriptions.get(item['MATNR'], '无描述'),
-                        'required_qty': item['BDMNG'],
-                        'unit': item['MEINS'],
-                    })
+        if page_number == 0 and finished_product.get('matnr') and plnbez in descriptions:
+            finished_product['description'] = descriptions[plnbez]
+        
+        # 构建组件列表
+        components = []
+        for item in resb_data:
+            # 去除组件物料码的前导零
+            clean_matnr = remove_leading_zeros(item['MATNR'])
             
-            # 3. 返回结构化数据
-            return {
-                'success': True,
-                'order_number': order_number,  # 返回原始订单号（不带前导零）
-                'finished_product': finished_product,
-                'components': components
-            }
+            components.append({
+                'matnr': clean_matnr,
+                'description': descriptions.get(item['MATNR'], '无描述'),
+                'required_qty': item['BDMNG'],
+                'unit': item['MEINS'],
+            })
+        yield components
+
+def stream_order_details(order_number, conn, out=None):
+    """以NDJSON逐行输出工单详情：header、每个组件一行、最后一行 end，读取一页输出一页"""
+    out = out or sys.stdout
+    
+    def emit(record):
+        out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        out.flush()
+    
+    formatted_order_number = order_number.zfill(12)
+    count = 0
+    try:
+        finished_product, plnbez = _read_finished_product(conn, formatted_order_number)
+        for page_number, page_components in enumerate(iter_component_pages(conn, formatted_order_number, finished_product, plnbez)):
+            if page_number == 0:
+                emit({'type': 'header', 'order_number': order_number, 'finished_product': finished_product})
+            for component in page_components:
+                emit({'type': 'component', **component})
+            count += len(page_components)
+        emit({'type': 'end', 'success': True, 'components': count})
+    except Exception as e:
+        emit({'type': 'end', 'success': False, 'components': count, 'error': error_message(e)})
+
+def get_order_details(order_number, conn=None):
+    """获取工单详情
+
+    conn 为空时从连接池借用连接（受请求时限 SAP_REQUEST_DEADLINE 限制），结束后归还；
+    常驻进程（sap_worker.py）会传入已建立的连接复用。
+    与报工单共用 sap_order.py 的读取（AFKO/MAKT 按两者字段的并集读取），常驻进程启用工单预读时
+    紧接着的报工单请求不再访问SAP。工单在本地副本中且副本足够新时从副本读取，只有物料描述仍需要SAP（见 sap_replica.py）。
+    """
+    try:
+        with request_deadline(DEFAULT_REQUEST_DEADLINE if conn is None else None):
+            bundles = load_order_bundles(conn, [order_number], components=True, report=False)
+        return bundles[order_number].components_view()
             
     except Exception as e:
         return {
             'success': False,
-            'error': str(e)
+            'error': error_message(e)
         }
 
 if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == '--serve':
+        # 常驻模式：python sap_rfc.py --serve [--socket PATH]
+        from sap_worker import main as worker_main
+        sys.exit(worker_main(sys.argv[2:], ['get_order_details']))
+
+    if len(sys.argv) == 3 and sys.argv[1] == '--stream':
+        # 流式模式：python sap_rfc.py --stream 工单号，输出NDJSON，Node端可边读边转发
+        try:
+            with request_deadline(DEFAULT_REQUEST_DEADLINE), pooled_connection() as conn:
+                stream_order_details(sys.argv[2].strip(), conn)
+        except Exception as e:
+            print(json.dumps({'type': 'end', 'success': False, 'components': 0, 'error': error_message(e)},
+                             ensure_ascii=False))
+        sys.exit(0)
+
     if len(sys.argv) != 2:
         print(json.dumps({'success': False, 'error': '请提供工单号参数'}))
         sys.exit(1)
     
     order_number = sys.argv[1].strip()
-    result = get_order_details(order_number)
+    # SAP_RFC_TRACE=1 时在结果中附加每次RFC调用的耗时明细（trace 字段）
+    result = call_traced(trace_enabled_by_env(), get_order_details, order_number)
     print(json.dumps(result, ensure_ascii=False))
\ No newline at end of file
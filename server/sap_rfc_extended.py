@@ -1,238 +1,260 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from __future__ import annotations
+
 import os
 import sys
 import json
-from typing import List, Dict, Optional
-from pyrfc import Connection
-from dotenv import load_dotenv
-from work_order_image import generate_work_order_image
+import base64
+import hashlib
+from typing import TYPE_CHECKING, Callable, List, Dict, Optional
+from sap_metrics import phase, call_traced, trace_enabled_by_env
+from sap_breaker import BATCH_REQUEST_DEADLINE, DEFAULT_REQUEST_DEADLINE, error_message, request_deadline
+from sap_cache import get_warm_order_cache
+from sap_common import pooled_connection
+from sap_order import load_order_bundles
 
-# 加载环境变量
-load_dotenv()
+# pyrfc 与图片相关模块（PIL、python-barcode）在第一次使用时才导入：
+# 只取数据（--data-only）时不加载图片库，只生成图片（--render）时不加载pyrfc
+if TYPE_CHECKING:
+    from pyrfc import Connection
 
 # 设置输出编码为UTF-8
 sys.stdout.reconfigure(encoding='utf-8')
 sys.stderr.reconfigure(encoding='utf-8')
 
-# SAP连接配置
-SAP_CONFIG = {
-    "ashost": "192.168.202.40",
-    "sysnr": "00",
-    "client": "100",
-    "user": os.getenv('SAP_RFC_USERNAME'),
-    "passwd": os.getenv('SAP_RFC_PASSWORD'),
-    "lang": "ZH"
-}
-
-def connect_sap() -> Optional[Connection]:
-    """建立SAP RFC连接"""
-    try:
-        conn = Connection(**SAP_CONFIG)
-        return conn
-    except Exception as e:
-        return None
+# 图片交付方式：base64 内嵌在JSON中（原方式）；file 写入按内容哈希命名的文件，JSON中只返回路径；
+# frame 在常驻进程中紧跟JSON行之后以原始字节发送，JSON中只返回长度和哈希
+IMAGE_DELIVERIES = ('base64', 'file', 'frame')
+DEFAULT_IMAGE_DELIVERY = os.getenv('SAP_IMAGE_DELIVERY', 'base64')
 
-def read_sap_table(conn: Connection, table_name: str, fields: List[str], where_clause: str, max_rows: int = 100) -> List[Dict]:
-    """读取SAP表数据"""
-    try:
-        result = conn.call(
-            "RFC_READ_TABLE",
-            QUERY_TABLE=table_name,
-            DELIMITER="|",
-            FIELDS=[{"FIELDNAME": f} for f in fields],
-            OPTIONS=[{"TEXT": where_clause}] if where_clause else [],
-            ROWCOUNT=max_rows
-        )
-        
-        data = []
-        if not result["DATA"]:
-            return data
-        
-        field_index = {f["FIELDNAME"]: i for i, f in enumerate(result["FIELDS"])}
-        for row in result["DATA"]:
-            row_data = row["WA"].split("|")
-            if len(row_data) < len(field_index):
-                continue
-            row_dict = {field: row_data[field_index[field]].strip() for field in fields}
-            data.append(row_dict)
-        
-        return data
-    except Exception as e:
-        return []
-
-def get_production_order_data(conn: Connection, aufnr: str) -> Optional[Dict]:
+def get_production_order_data(conn: Connection, aufnr: str, concurrency: Optional[int] = None) -> Optional[Dict]:
     """获取生产订单全量数据"""
-    formatted_order_number = aufnr.zfill(12)
+    return get_production_orders_data(conn, [aufnr], concurrency)[aufnr]
+
+def get_production_orders_data(conn: Connection, aufnrs: List[str], concurrency: Optional[int] = None,
+                               use_warm_cache: bool = True) -> Dict[str, Optional[Dict]]:
+    """批量获取多个生产订单的全量数据，返回 {订单号: 订单数据}，找不到的订单为 None
+
+    每张表按订单号/工艺路线号合并查询，查询次数与订单数量基本无关（见 sap_order.py，与 get_order_details 共用读取）。
+    concurrency 为读取AFKO之后并发执行的最大连接数，默认取环境变量 SAP_RFC_CONCURRENCY（1 表示串行）。
+    班次预热保存过数据的订单（sap_cache.WarmOrderCache，use_warm_cache 为 False 时不使用）不再读取SAP；
+    订单都在本地副本中且副本足够新时，订单相关的表从副本读取（见 sap_replica.py）。
+    """
+    warm_cache = get_warm_order_cache() if use_warm_cache else None
+    orders_data = warm_cache.get_many(aufnrs) if warm_cache is not None else {}
+    missing = [aufnr for aufnr in aufnrs if aufnr not in orders_data]
+    if missing:
+        bundles = load_order_bundles(conn, missing, components=False, report=True, concurrency=concurrency)
+        orders_data.update((aufnr, bundle.report_view()) for aufnr, bundle in bundles.items())
+    return {aufnr: orders_data[aufnr] for aufnr in aufnrs}
+
+def _build_work_order_report(conn: Connection, order_number: str, image_options: Optional[Dict] = None) -> Dict:
+    """在给定连接上读取工单数据并生成图片"""
+    with phase('sap.fetch'):
+        order_data = get_production_order_data(conn, order_number)
+    return _render_work_order_report(order_data, image_options)
+
+def _render_work_order_report(order_data: Optional[Dict], image_options: Optional[Dict] = None) -> Dict:
+    """为已读取的工单数据生成图片
+
+    image_options: {"format": "rgb|gray|1bit", "compress_level": 0-9, "delivery": "base64|file|frame"}，
+    未提供的项使用环境变量 SAP_IMAGE_FORMAT / SAP_IMAGE_COMPRESS_LEVEL / SAP_IMAGE_DELIVERY 的默认值。
+    """
+    if not order_data:
+        return {'success': False, 'error': '未找到工单数据'}
     
-    # 1. 读取订单抬头（AUFK）
-    aufk_fields = ["AUFNR", "AUART", "KDAUF", "KDPOS", "ERNAM", "ERDAT", "OBJNR", "WERKS", "LOEKZ"]
-    aufk_where = f"AUFNR = '{formatted_order_number}' AND LOEKZ = ''"
-    aufk_data = read_sap_table(conn, "AUFK", aufk_fields, aufk_where)
-    if not aufk_data:
-        return None
-    aufk = aufk_data[0]
-
-    # 2. 读取生产订单主数据（AFKO）
-    afko_fields = ["AUFNR", "GSTRP", "GLTRP", "GAMNG", "GMEIN", "PLNBEZ", "DISPO", "FEVOR", "AUFPL"]
-    afko_where = f"AUFNR = '{formatted_order_number}'"
-    afko_data = read_sap_table(conn, "AFKO", afko_fields, afko_where)
-    if not afko_data:
-        return None
-    afko = afko_data[0]
-
-    # 3. 读取工序数据（AFVC）
-    aufpl = afko["AUFPL"]
-    afvc_fields = ["AUFPL", "VORNR", "LTXA1", "ARBID", "OBJNR", "STEUS", "APLZL"]
-    afvc_where = f"AUFPL = '{aufpl}'"
-    afvc_data = read_sap_table(conn, "AFVC", afvc_fields, afvc_where)
-    if not afvc_data:
-        return None
-
-    # 4. 处理工序信息
-    工序列表 = []
-    for afvc in afvc_data:
-        # 读取工作中心
-        arbpl = ""
-        ktext = ""
-        if afvc.get("ARBID"):
-            crhd_fields = ["OBJID", "ARBPL"]
-            crhd_where = f"OBJID = '{afvc['ARBID']}'"
-            crhd_data = read_sap_table(conn, "CRHD", crhd_fields, crhd_where, max_rows=1)
-            arbpl = crhd_data[0]["ARBPL"] if crhd_data else ""
-            
-            crtx_fields = ["OBJID", "KTEXT"]
-            crtx_where = f"OBJID = '{afvc['ARBID']}'"
-            crtx_data = read_sap_table(conn, "CRTX", crtx_fields, crtx_where, max_rows=1)
-            ktext = crtx_data[0]["KTEXT"] if crtx_data else ""
-
-        # 读取工时数据（AFVV）
-        afvv_fields = ["VGW01", "VGE01", "VGW02", "VGE02", "VGW03", "VGE03", "VGW04", "VGE04", "BMSCH"]
-        afvv_where = f"AUFPL = '{aufpl}' AND APLZL = '{afvc['APLZL']}'"
-        afvv_data = read_sap_table(conn, "AFVV", afvv_fields, afvv_where, max_rows=1)
-        
-        工时数据 = {"准备工时": "", "人工工时": "", "机器工时": "", "加工工时": ""}
-        if afvv_data:
-            afvv = afvv_data[0]
-            bmsch = float(afvv["BMSCH"]) if afvv["BMSCH"] else 1
-            工时数据 = {
-                "准备工时": f"{float(afvv['VGW01'])/bmsch:.3f} {afvv['VGE01']}" if afvv["VGW01"] else "",
-                "人工工时": f"{float(afvv['VGW02'])/bmsch:.3f} {afvv['VGE02']}" if afvv["VGW02"] else "",
-                "机器工时": f"{float(afvv['VGW03'])/bmsch:.3f} {afvv['VGE03']}" if afvv["VGW03"] else "",
-                "加工工时": f"{float(afvv['VGW04'])/bmsch:.3f} {afvv['VGE04']}" if afvv["VGW04"] else ""
-            }
-
-        # 读取员工分配（ZAFVC）
-        zafvc_fields = ["AUFNR", "VORNR", "PERNR", "PERNM", "ASENG", "PEROR", "REMAK"]
-        zafvc_where = f"AUFNR = '{formatted_order_number}' AND VORNR = '{afvc['VORNR']}'"
-        zafvc_data = read_sap_table(conn, "ZAFVC", zafvc_fields, zafvc_where)
-
-        工序列表.append({
-            "工序号": afvc["VORNR"],
-            "工序描述": afvc["LTXA1"],
-            "控制码": afvc["STEUS"],
-            "工作中心编号": arbpl,
-            "工作中心描述": ktext,
-            "工时数据": 工时数据,
-            "下一道工序": None,
-            "员工分配": zafvc_data if zafvc_data else []
-        })
-
-    # 按工序号排序
-    工序列表.sort(key=lambda x: x["工序号"])
+    image_options = image_options or {}
+    delivery = image_options.get('delivery') or DEFAULT_IMAGE_DELIVERY
+    if delivery not in IMAGE_DELIVERIES:
+        raise ValueError(f'不支持的图片交付方式: {delivery}')
+    
+    # 生成图片
+    from work_order_image import generate_work_order_png, save_png
+    png = generate_work_order_png(order_data, image_options.get('format'), image_options.get('compress_level'))
     
-    # 设置下一道工序
-    for i, 工序 in enumerate(工序列表):
-        if i < len(工序列表) - 1:
-            下一道工序 = 工序列表[i + 1]
-            工序["下一道工序"] = {
-                "工序号": 下一道工序["工序号"],
-                "工序描述": 下一道工序["工序描述"],
-                "控制码": 下一道工序["控制码"],
-                "工作中心编号": 下一道工序["工作中心编号"],
-                "工作中心描述": 下一道工序["工作中心描述"]
-            }
-
-    # 5. 读取物料描述（MAKT）和图号（MARA）
-    maktx = "无物料描述"
-    zpictx = ""
-    matnr = afko["PLNBEZ"]
-    if matnr:
-        makt_fields = ["MATNR", "MAKTX"]
-        makt_where = f"MATNR = '{matnr}' AND SPRAS = '1'"
-        makt_data = read_sap_table(conn, "MAKT", makt_fields, makt_where, max_rows=1)
-        maktx = makt_data[0]["MAKTX"] if makt_data else "无物料描述"
-        
-        # 读取图号信息（MARA）
-        mara_fields = ["ZPICTX"]
-        mara_where = f"MATNR = '{matnr}'"
-        mara_data = read_sap_table(conn, "MARA", mara_fields, mara_where, max_rows=1)
-        zpictx = mara_data[0]["ZPICTX"] if mara_data else ""
-
-    # 整合结果
+    report = {
+        'success': True,
+        'order_data': order_data
+    }
+    if delivery == 'file':
+        path, digest = save_png(png)
+        report.update({'image_file': path, 'image_sha256': digest, 'image_size': len(png)})
+    elif delivery == 'frame':
+        # _image_bytes 由 sap_worker 取出并在JSON行之后发送，不会出现在输出的JSON中
+        report.update({'image_frame': {'length': len(png), 'sha256': hashlib.sha256(png).hexdigest()},
+                       '_image_bytes': png})
+    else:
+        report['image'] = base64.b64encode(png).decode('utf-8')
+    return report
+
+def _build_work_order_reports(conn: Connection, order_numbers: List[str], image_options: Optional[Dict] = None) -> Dict:
+    """在给定连接上批量读取工单数据并逐个生成图片，单个工单出错不影响其他工单"""
+    with phase('sap.fetch'):
+        orders_data = get_production_orders_data(conn, order_numbers)
+    results = []
+    for order_number, order_data in orders_data.items():
+        try:
+            report = _render_work_order_report(order_data, image_options)
+        except Exception as e:
+            report = {'success': False, 'error': str(e)}
+        results.append({'order_number': order_number, **report})
     return {
-        "基础信息": {
-            "工单号": aufk["AUFNR"],
-            "订单类型": aufk["AUART"],
-            "销售订单": aufk["KDAUF"],
-            "销售订单行项目": aufk["KDPOS"],
-            "工厂": aufk["WERKS"],
-            "创建人": aufk["ERNAM"],
-            "创建日期": aufk["ERDAT"],
-            "客户名称": ""
-        },
-        "生产信息": {
-            "物料号": matnr,
-            "物料描述": maktx,
-            "图号": zpictx,
-            "开始日期": afko["GSTRP"],
-            "结束日期": afko["GLTRP"],
-            "生产数量": afko["GAMNG"],
-            "单位": afko["GMEIN"],
-            "库存地点": "",
-            "库存地点描述": "",
-            "MRP控制者": afko["DISPO"],
-            "生产管理员": afko["FEVOR"]
-        },
-        "模具信息": [],
-        "工序与员工分配": 工序列表
+        'success': True,
+        'results': results
     }
 
-def get_work_order_report(order_number):
-    """获取工序报工单数据并生成图片"""
+def _run_with_connection(conn: Optional[Connection], build: Callable[[Connection], Dict],
+                         deadline: Optional[float] = None) -> Dict:
+    """在给定连接上执行 build；conn 为空时从连接池借用连接（SAP访问总耗时不超过 deadline 秒，
+    默认 DEFAULT_REQUEST_DEADLINE），结束后归还。出错时返回错误信息
+
+    SAP不可达、超时或熔断时返回"SAP连接失败/SAP暂时不可用/SAP请求超过时限"，不会当作"未找到工单数据"。
+    """
     try:
-        conn = connect_sap()
-        if not conn:
-            return {'success': False, 'error': 'SAP连接失败'}
-        
-        try:
-            order_data = get_production_order_data(conn, order_number)
-            if not order_data:
-                return {'success': False, 'error': '未找到工单数据'}
-            
-            # 生成图片
-            image_base64 = generate_work_order_image(order_data)
-            
-            return {
-                'success': True,
-                'order_data': order_data,
-                'image': image_base64
-            }
-        finally:
-            conn.close()
+        if conn is not None:
+            return build(conn)
+
+        with request_deadline(DEFAULT_REQUEST_DEADLINE if deadline is None else deadline), pooled_connection() as conn:
+            return build(conn)
             
+    except Exception as e:
+        return {
+            'success': False,
+            'error': error_message(e)
+        }
+
+def _clean_order_numbers(order_numbers: List[str]) -> List[str]:
+    return [str(n).strip() for n in order_numbers if str(n).strip()]
+
+def get_work_order_report(order_number, conn: Optional[Connection] = None, image_options: Optional[Dict] = None):
+    """获取工序报工单数据并生成图片
+
+    conn 为空时从连接池借用连接（受请求时限 SAP_REQUEST_DEADLINE 限制）并在结束后归还；
+    常驻进程（sap_worker.py）会传入已建立的连接复用。
+    """
+    return _run_with_connection(conn, lambda c: _build_work_order_report(c, order_number, image_options))
+
+def get_work_order_reports(order_numbers: List[str], conn: Optional[Connection] = None,
+                           image_options: Optional[Dict] = None) -> Dict:
+    """批量获取多个工单的报工单数据和图片（例如整班打印），每个工单单独返回成功或错误信息
+
+    conn 为空时借用的连接受批量请求时限 SAP_BATCH_DEADLINE 限制。
+    """
+    order_numbers = _clean_order_numbers(order_numbers)
+    if not order_numbers:
+        return {'success': False, 'error': '请提供工单号参数'}
+    return _run_with_connection(conn, lambda c: _build_work_order_reports(c, order_numbers, image_options),
+                                BATCH_REQUEST_DEADLINE)
+
+def _order_data_result(order_data: Optional[Dict]) -> Dict:
+    if not order_data:
+        return {'success': False, 'error': '未找到工单数据'}
+    return {'success': True, 'order_data': order_data}
+
+def get_work_order_data(order_number, conn: Optional[Connection] = None) -> Dict:
+    """只读取工单数据，不生成图片（不导入 PIL / python-barcode）
+
+    返回 {"success": true, "order_data": {...}}，order_data 与 get_work_order_report 中的相同，
+    需要图片时再把它交给 render_work_order。
+    """
+    return _run_with_connection(conn, lambda c: _order_data_result(get_production_order_data(c, order_number)))
+
+def get_work_orders_data(order_numbers: List[str], conn: Optional[Connection] = None) -> Dict:
+    """批量只读取工单数据，每个工单单独返回成功或错误信息（受批量请求时限 SAP_BATCH_DEADLINE 限制）"""
+    order_numbers = _clean_order_numbers(order_numbers)
+    if not order_numbers:
+        return {'success': False, 'error': '请提供工单号参数'}
+
+    def build(c):
+        orders_data = get_production_orders_data(c, order_numbers)
+        return {
+            'success': True,
+            'results': [{'order_number': n, **_order_data_result(d)} for n, d in orders_data.items()]
+        }
+    return _run_with_connection(conn, build, BATCH_REQUEST_DEADLINE)
+
+def render_work_order(order_data: Dict, image_options: Optional[Dict] = None) -> Dict:
+    """按已读取的工单数据生成报工单图片（不连接SAP），返回结构与 get_work_order_report 相同"""
+    try:
+        return _render_work_order_report(order_data, image_options)
     except Exception as e:
         return {
             'success': False,
             'error': str(e)
         }
 
+def order_data_from_payload(payload) -> Dict:
+    """从 --render 的输入中取出工单数据：可以是工单数据本身，也可以是 --data-only 的成功结果
+
+    输入是失败的结果（success 为 false）或不是工单数据（没有“基础信息”）时抛出 ValueError。
+    """
+    if not isinstance(payload, dict):
+        raise ValueError('工单数据格式错误: 需要JSON对象')
+    if payload.get('success') is False:
+        raise ValueError(payload.get('error') or '取数失败')
+    order_data = payload.get('order_data', payload)
+    if not isinstance(order_data, dict) or not isinstance(order_data.get('基础信息'), dict):
+        raise ValueError('工单数据格式错误: 缺少基础信息')
+    return order_data
+
+def _print_result(result: Dict):
+    """输出命令行结果；SAP_IMAGE_DELIVERY=frame 时图片帧紧跟在JSON行之后"""
+    from sap_worker import encode_output
+    sys.stdout.flush()
+    sys.stdout.buffer.write(encode_output(result))
+    sys.stdout.buffer.flush()
+
 if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == '--serve':
+        # 常驻模式：python sap_rfc_extended.py --serve [--socket PATH]
+        from sap_worker import main as worker_main
+        sys.exit(worker_main(sys.argv[2:], ['get_work_order_report', 'get_work_order_reports', 'get_work_order_data',
+                                            'get_work_orders_data', 'render_work_order']))
+
+    # SAP_RFC_TRACE=1 时在结果中附加每次RFC调用及各渲染阶段的耗时明细（trace 字段）
+    # SAP访问的总耗时上限：单个工单 SAP_REQUEST_DEADLINE（默认60秒），--batch 和多个工单的 --data-only
+    # SAP_BATCH_DEADLINE（默认600秒），设为0不限制
+    trace = trace_enabled_by_env()
+
+    if len(sys.argv) >= 3 and sys.argv[1] == '--data-only':
+        # 只取数据：python sap_rfc_extended.py --data-only 工单号[,工单号 ...]
+        order_numbers = [n for arg in sys.argv[2:] for n in arg.split(',')]
+        if len(order_numbers) == 1:
+            result = call_traced(trace, get_work_order_data, order_numbers[0].strip())
+        else:
+            result = call_traced(trace, get_work_orders_data, order_numbers)
+        print(json.dumps(result, ensure_ascii=False))
+        sys.exit(0)
+
+    if len(sys.argv) == 2 and sys.argv[1] == '--render':
+        # 只生成图片：从stdin读取工单数据（或 --data-only 的输出），python sap_rfc_extended.py --render < data.json
+        try:
+            payload = json.load(sys.stdin)
+        except ValueError as e:
+            print(json.dumps({'success': False, 'error': f'工单数据格式错误: {e}'}, ensure_ascii=False))
+            sys.exit(1)
+        # 输入不是工单数据（包括 --data-only 失败的结果）时输出错误并返回1，不生成空白的报工单
+        try:
+            order_data = order_data_from_payload(payload)
+        except ValueError as e:
+            print(json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False))
+            sys.exit(1)
+        _print_result(call_traced(trace, render_work_order, order_data))
+        sys.exit(0)
+
+    if len(sys.argv) >= 3 and sys.argv[1] == '--batch':
+        # 批量模式：python sap_rfc_extended.py --batch 工单号1,工单号2 [工单号3 ...]
+        order_numbers = [n for arg in sys.argv[2:] for n in arg.split(',')]
+        result = call_traced(trace, get_work_order_reports, order_numbers)
+        _print_result(result)
+        sys.exit(0)
+
     if len(sys.argv) != 2:
         print(json.dumps({'success': False, 'error': '请提供工单号参数'}))
         sys.exit(1)
     
     order_number = sys.argv[1].strip()
-    result = get_work_order_report(order_number)
-    print(json.dumps(result, ensure_ascii=False))
\ No newline at end of file
+    result = call_traced(trace, get_work_order_report, order_number)
+    _print_result(result)
\ No newline at end of file
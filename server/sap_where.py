@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""RFC_READ_TABLE 的 WHERE 条件（OPTIONS）解析
+
+把 OPTIONS 各行拼成的ABAP条件解析为语法树，供离线后端（sap_fake.py）按条件筛选夹具中的行、
+本地副本（sap_replica.py）转换为SQL查询使用。另提供按 FIELDS 元数据拼接定宽行（WA）的 format_value。
+"""
+
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+NUMERIC_TYPES = {'P', 'F', 'I', 'b', 's', '8', 'a', 'e'}
+
+
+class WhereSyntaxError(ValueError):
+    """无法解析的条件，或条件中引用了不存在的字段"""
+
+
+_TOKEN_PATTERN = re.compile(r"\s*(?:('(?:[^']|'')*')|(<>|>=|<=|=|<|>)|([(),])|([A-Za-z_][A-Za-z0-9_]*)|(-?\d+(?:\.\d+)?))")
+_WORD_OPERATORS = {'EQ': '=', 'NE': '<>', 'GT': '>', 'LT': '<', 'GE': '>=', 'LE': '<='}
+
+
+def _tokenize(where: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    where = where.rstrip()
+    while position < len(where):
+        match = _TOKEN_PATTERN.match(where, position)
+        if not match or match.end() == position:
+            raise WhereSyntaxError(where[position:position + 20])
+        literal, operator, punct, word, number = match.groups()
+        if literal is not None:
+            tokens.append(('value', literal[1:-1].replace("''", "'")))
+        elif operator:
+            tokens.append(('op', operator))
+        elif punct:
+            tokens.append((punct, punct))
+        elif word:
+            upper = word.upper()
+            tokens.append(('op', _WORD_OPERATORS[upper]) if upper in _WORD_OPERATORS else ('word', upper))
+        else:
+            tokens.append(('value', number))
+        position = match.end()
+    return tokens
+
+
+class _WhereParser:
+    """把 OPTIONS 拼成的 WHERE 条件解析为语法树
+
+    支持 = <> > < >= <=（及 EQ/NE/...）、[NOT] LIKE、[NOT] IN (...)、[NOT] BETWEEN、IS [NOT] INITIAL、
+    AND/OR/NOT 与括号，足够覆盖本项目及常见的 RFC_READ_TABLE 查询。
+    """
+
+    def __init__(self, where: str):
+        self.tokens = _tokenize(where)
+        self.position = 0
+
+    def parse(self):
+        if not self.tokens:
+            return None
+        node = self._or()
+        if self.position != len(self.tokens):
+            raise WhereSyntaxError(f'无法解析: {self.tokens[self.position][1]}')
+        return node
+
+    def _peek(self, kind=None, value=None):
+        if self.position >= len(self.tokens):
+            return False
+        token = self.tokens[self.position]
+        return (kind is None or token[0] == kind) and (value is None or token[1] == value)
+
+    def _take(self, kind=None, value=None) -> str:
+        if not self._peek(kind, value):
+            found = self.tokens[self.position][1] if self.position < len(self.tokens) else '结尾'
+            raise WhereSyntaxError(f'应为 {value or kind}，实际为 {found}')
+        self.position += 1
+        return self.tokens[self.position - 1][1]
+
+    def _or(self):
+        nodes = [self._and()]
+        while self._peek('word', 'OR'):
+            self.position += 1
+            nodes.append(self._and())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+    def _and(self):
+        nodes = [self._not()]
+        while self._peek('word', 'AND'):
+            self.position += 1
+            nodes.append(self._not())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def _not(self):
+        if self._peek('word', 'NOT'):
+            self.position += 1
+            return ('not', self._not())
+        if self._peek('('):
+            self.position += 1
+            node = self._or()
+            self._take(')')
+            return node
+        return self._condition()
+
+    def _condition(self):
+        field = self._take('word')
+        if self._peek('op'):
+            return ('cmp', field, self._take('op'), self._take('value'))
+        negate = False
+        if self._peek('word', 'IS'):
+            self.position += 1
+            if self._peek('word', 'NOT'):
+                self.position += 1
+                negate = True
+            self._take('word', 'INITIAL')
+            return self._negated(negate, ('initial', field))
+        if self._peek('word', 'NOT'):
+            self.position += 1
+            negate = True
+        keyword = self._take('word')
+        if keyword == 'LIKE':
+            return self._negated(negate, ('like', field, self._take('value')))
+        if keyword == 'IN':
+            self._take('(')
+            values = [self._take('value')]
+            while self._peek(','):
+                self.position += 1
+                values.append(self._take('value'))
+            self._take(')')
+            return self._negated(negate, ('in', field, values))
+        if keyword == 'BETWEEN':
+            low = self._take('value')
+            self._take('word', 'AND')
+            return self._negated(negate, ('between', field, low, self._take('value')))
+        raise WhereSyntaxError(f'不支持的条件: {keyword}')
+
+    @staticmethod
+    def _negated(negate: bool, node):
+        return ('not', node) if negate else node
+
+
+def parse_where(where: str):
+    """解析 WHERE 条件，空条件返回 None"""
+    return _WhereParser(where).parse()
+
+
+_COMPARATORS = {
+    '=': lambda a, b: a == b, '<>': lambda a, b: a != b, '>': lambda a, b: a > b,
+    '<': lambda a, b: a < b, '>=': lambda a, b: a >= b, '<=': lambda a, b: a <= b,
+}
+
+
+def _comparable(value: str, field_type: str):
+    """按ABAP规则比较：数值字段按数值，字符字段忽略尾部空格"""
+    if field_type in NUMERIC_TYPES:
+        value = (value or '').strip()
+        if value.endswith('-'):
+            value = '-' + value[:-1]
+        return float(value) if value else 0.0
+    return (value or '').rstrip()
+
+
+def compile_where(node, field_types: Dict[str, str]) -> Callable[[Dict], bool]:
+    """把语法树编译为 row -> bool 的筛选函数；无法解析或引用了表中不存在的字段时抛出 WhereSyntaxError"""
+    if node is None:
+        return lambda row: True
+    kind = node[0]
+    if kind in ('and', 'or'):
+        parts = [compile_where(child, field_types) for child in node[1]]
+        if kind == 'and':
+            return lambda row: all(part(row) for part in parts)
+        return lambda row: any(part(row) for part in parts)
+    if kind == 'not':
+        inner = compile_where(node[1], field_types)
+        return lambda row: not inner(row)
+
+    field = node[1]
+    if field not in field_types:
+        raise WhereSyntaxError(f'字段 {field} 不存在')
+    field_type = field_types[field]
+
+    def value_of(row):
+        return _comparable(row.get(field, ''), field_type)
+
+    if kind == 'cmp':
+        compare, expected = _COMPARATORS[node[2]], _comparable(node[3], field_type)
+        return lambda row: compare(value_of(row), expected)
+    if kind == 'in':
+        expected = {_comparable(v, field_type) for v in node[2]}
+        return lambda row: value_of(row) in expected
+    if kind == 'between':
+        low, high = _comparable(node[2], field_type), _comparable(node[3], field_type)
+        return lambda row: low <= value_of(row) <= high
+    if kind == 'like':
+        pattern = re.compile(''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c)
+                                     for c in node[2].rstrip()), re.DOTALL)
+        return lambda row: pattern.fullmatch(value_of(row)) is not None
+    if kind == 'initial':
+        return lambda row: _is_initial(row.get(field, ''), field_type)
+    raise WhereSyntaxError(kind)
+
+
+def _is_initial(value: str, field_type: str) -> bool:
+    value = (value or '').strip()
+    if field_type in NUMERIC_TYPES:
+        return _comparable(value, field_type) == 0
+    if field_type in ('N', 'D', 'T'):
+        return value.strip('0') == ''
+    return value == ''
+
+
+def candidate_values(node) -> Optional[Tuple[str, set]]:
+    """条件把某个字段限定在有限个取值内时返回 (字段, 取值集合)，用于按索引取候选行而不扫描整张表"""
+    if node is None:
+        return None
+    if node[0] == 'cmp' and node[2] == '=':
+        return node[1], {node[3]}
+    if node[0] == 'in':
+        return node[1], set(node[2])
+    if node[0] == 'or':
+        parts = [candidate_values(child) for child in node[1]]
+        if all(parts) and len({field for field, _ in parts}) == 1:
+            return parts[0][0], set().union(*(values for _, values in parts))
+        return None
+    if node[0] == 'and':
+        for child in node[1]:
+            part = candidate_values(child)
+            if part:
+                return part
+    return None
+
+
+def fixed_equalities(node) -> Dict[str, str]:
+    """顶层 AND 中的“字段 = 常量”条件，录制时用来补全返回行中没有选择的字段"""
+    if node is None:
+        return {}
+    if node[0] == 'cmp' and node[2] == '=':
+        return {node[1]: node[3]}
+    if node[0] == 'and':
+        result = {}
+        for child in node[1]:
+            result.update(fixed_equalities(child))
+        return result
+    return {}
+
+
+def format_value(value, field_type: str, length: int) -> str:
+    """按 RFC_READ_TABLE 的格式输出一个字段：数值右对齐，其余左对齐，超长截断"""
+    text = '' if value is None else str(value)
+    if field_type in NUMERIC_TYPES:
+        return text[-length:].rjust(length)
+    return text[:length].ljust(length)
@@ -0,0 +1,568 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""SAP RFC 常驻工作进程
+
+避免每次请求都重新启动Python解释器、导入pyrfc/Pillow并重新建立SAP连接。
+
+协议（每行一个JSON）：
+  请求: {"id": 1, "method": "get_work_order_report", "params": {"order_number": "123456"}}
+  响应: {"id": 1, "result": {...与命令行输出相同的结构...}}
+  params 可带 "deadline_ms" 指定本次请求的SAP总耗时上限（默认 SAP_REQUEST_DEADLINE 秒，
+  多个工单的方法默认 SAP_BATCH_DEADLINE 秒，见 sap_breaker.py）；
+  {"method": "ping"} 的结果中附带连接池与熔断器状态。
+
+二进制帧：报工单请求带 "image_options": {"delivery": "frame"} 时，结果中每张图片只返回
+  "image_frame": {"index": 0, "length": 12345, "sha256": "..."}，
+响应行之后按 index 顺序紧跟各图片的原始PNG字节（长度见 length），然后才是下一行响应。
+
+用法：
+  python sap_worker.py                              # 通过 stdin/stdout 收发JSON行
+  python sap_worker.py --socket /tmp/sap_rfc.sock   # 监听本地Unix套接字
+  python sap_worker.py --bench 500                  # 使用桩连接测量吞吐量（无需SAP）
+  python sap_worker.py --bench-startup              # 检查各脚本冷启动的导入耗时
+  python sap_worker.py --metrics-port 9464          # 同时通过HTTP提供Prometheus指标（/metrics）
+  python sap_worker.py --result-ttl 5               # 工单结果缓存5秒，过期后30秒内先返回旧结果并后台刷新
+  python sap_worker.py --warm 2                     # 启动后在后台预先建立2个SAP连接
+  python sap_worker.py --bundle-ttl 5               # 工单数据缓存5秒：组件与报工单接口先后请求同一工单时只读取一次SAP
+  python sap_worker.py --prefetch-views             # 单个工单的请求返回后在后台读取另一种视图（组件/报工单）
+  python sap_rfc.py --serve / python sap_rfc_extended.py --serve  # 只提供该脚本的方法
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import importlib
+import threading
+import subprocess
+import socketserver
+from typing import Callable, Dict, List, Optional
+
+from sap_breaker import (BATCH_REQUEST_DEADLINE, BREAKER_CLOSED, BREAKER_HALF_OPEN, BREAKER_OPEN, DEFAULT_REQUEST_DEADLINE,
+                         error_message, request_deadline)
+from sap_common import ConnectionPool, DEFAULT_POOL_SIZE, get_connection_pool, set_connection_pool
+from sap_cache import get_master_data_cache
+from image_cache import get_render_cache
+from sap_metrics import call_traced, format_labels, metrics
+from result_cache import RESULT_MISS, RESULT_STALE, ResultCache, SingleFlight, estimate_size
+
+# 方法名 -> (模块, 函数, 参数名, 可选参数)，函数签名统一为 fn(order_number 或 order_numbers, conn=None, **可选参数)；
+# 参数为 order_data 的方法只处理已读取的数据，签名为 fn(order_data, **可选参数)，不占用SAP连接
+METHODS = {
+    'get_order_details': ('sap_rfc', 'get_order_details', 'order_number', ()),
+    'get_work_order_report': ('sap_rfc_extended', 'get_work_order_report', 'order_number', ('image_options',)),
+    'get_work_order_reports': ('sap_rfc_extended', 'get_work_order_reports', 'order_numbers', ('image_options',)),
+    'get_work_order_data': ('sap_rfc_extended', 'get_work_order_data', 'order_number', ()),
+    'get_work_orders_data': ('sap_rfc_extended', 'get_work_orders_data', 'order_numbers', ()),
+    'render_work_order': ('sap_rfc_extended', 'render_work_order', 'order_data', ('image_options',)),
+    'print_work_orders': ('print_job', 'print_work_orders', 'order_numbers', ('output_format',)),
+    'get_material_requirements': ('sap_requirements', 'get_material_requirements', 'order_numbers',
+                                  ('include_orders',)),
+    'get_order_views': ('sap_order', 'get_order_views', 'order_number', ()),
+}
+
+# 同时到达的相同请求只读取一次SAP（见 result_cache.py），启用结果缓存时也只缓存这些方法的结果
+COALESCED_METHODS = ('get_order_details', 'get_work_order_report')
+# 结果缓存有效期（秒，0 表示不缓存）及过期后仍可先返回旧结果、同时后台刷新的时间
+RESULT_CACHE_TTL = float(os.getenv('SAP_RESULT_CACHE_TTL', '0'))
+RESULT_CACHE_STALE = float(os.getenv('SAP_RESULT_CACHE_STALE', '30'))
+# 工单数据缓存有效期（秒，0为不缓存），见 sap_order.py
+ORDER_BUNDLE_TTL = float(os.getenv('SAP_ORDER_BUNDLE_TTL', '5'))
+# 单个工单只请求一种视图时，是否在后台预读另一种视图
+ORDER_PREFETCH = os.getenv('SAP_ORDER_PREFETCH') == '1'
+
+# 冷启动检查：这些脚本在导入时不应加载 HEAVY_IMPORTS，导入耗时不应超过 STARTUP_BUDGET_MS
+STARTUP_MODULES = ('sap_rfc', 'sap_rfc_extended', 'sap_worker')
+HEAVY_IMPORTS = ('PIL', 'barcode', 'pyrfc')
+STARTUP_BUDGET_MS = float(os.getenv('SAP_STARTUP_BUDGET_MS', '150'))
+# 启动后在后台预先建立的SAP连接数
+DEFAULT_WARM_CONNECTIONS = int(os.getenv('SAP_RFC_POOL_WARM', '1'))
+
+
+def load_methods(names: Optional[List[str]] = None) -> Dict[str, Callable]:
+    """按需导入脚本模块，返回 方法名 -> 函数"""
+    methods = {}
+    for name in names or METHODS:
+        module_name, func_name = METHODS[name][:2]
+        methods[name] = getattr(importlib.import_module(module_name), func_name)
+    return methods
+
+
+class SapWorker:
+    """处理JSON请求，所有请求共享同一个连接池"""
+
+    def __init__(self, methods: Dict[str, Callable], pool: Optional[ConnectionPool] = None,
+                 result_cache: Optional[ResultCache] = None, bundle_cache: Optional[ResultCache] = None):
+        self.methods = methods
+        self.pool = pool or get_connection_pool()
+        self.result_cache = result_cache
+        self.bundle_cache = bundle_cache
+        self.flights = SingleFlight()
+        self.served = 0
+        # (方法, success/error) -> 请求数
+        self.request_counts = {}
+        # 方法 -> 与同时到达的相同请求共享结果的请求数
+        self.coalesced_counts = {}
+        # success/error -> 后台刷新次数
+        self.refresh_counts = {}
+        self._counts_lock = threading.Lock()
+        # 正在后台刷新的键：同一个过期结果只启动一个刷新线程
+        self._refreshing = set()
+
+    def handle(self, request: Dict) -> Dict:
+        req_id = request.get('id')
+        method_name = request.get('method')
+        if method_name == 'ping':
+            return {'id': req_id, 'result': {'success': True, 'served': self.served, 'pool': self.pool.stats()}}
+        if method_name == 'metrics':
+            return {'id': req_id, 'result': {'success': True, 'metrics': prometheus_metrics(self)}}
+        if method_name in ('cache_stats', 'cache_invalidate'):
+            return {'id': req_id, 'result': self._handle_cache(method_name, request.get('params') or {})}
+
+        method = self.methods.get(method_name)
+        if method is None:
+            return {'id': req_id, 'result': {'success': False, 'error': f'未知方法: {method_name}'}}
+
+        params = request.get('params') or {}
+        param_name = METHODS[method_name][2]
+        options = {key: params[key] for key in METHODS[method_name][3] if params.get(key) is not None}
+        # "trace": true 时在结果中附加本次请求每次RFC调用及各阶段的耗时明细
+        trace = bool(params.get('trace'))
+        if param_name == 'order_data':
+            order_data = params.get('order_data')
+            if not isinstance(order_data, dict) or not order_data:
+                return {'id': req_id, 'result': {'success': False, 'error': '请提供工单数据参数'}}
+            result = call_traced(trace, method, order_data, **options)
+            self._count(method_name, result)
+            return {'id': req_id, 'result': result}
+
+        if param_name == 'order_numbers':
+            argument = [str(n).strip() for n in params.get('order_numbers') or [] if str(n).strip()]
+        else:
+            argument = str(params.get('order_number', '')).strip()
+        if not argument:
+            return {'id': req_id, 'result': {'success': False, 'error': '请提供工单号参数'}}
+
+        # 未指定 deadline_ms 时，多个工单的方法使用批量请求时限
+        default_deadline = BATCH_REQUEST_DEADLINE if param_name == 'order_numbers' else DEFAULT_REQUEST_DEADLINE
+        try:
+            deadline = float(params['deadline_ms']) / 1000 if params.get('deadline_ms') else default_deadline
+        except (TypeError, ValueError):
+            return {'id': req_id, 'result': {'success': False, 'error': f'deadline_ms 参数无效: {params["deadline_ms"]}'}}
+
+        def run():
+            # 时限从取连接开始计算，包括等待空闲连接的时间
+            try:
+                with request_deadline(deadline), self.pool.connection() as conn:
+                    return method(argument, conn=conn, **options)
+            except Exception as e:
+                return {'success': False, 'error': error_message(e)}
+
+        if method_name in COALESCED_METHODS:
+            key = (method_name, json.dumps(argument), json.dumps(options, sort_keys=True, default=str))
+            result = call_traced(trace, self._run_coalesced, method_name, key, run)
+        else:
+            result = call_traced(trace, run)
+        self._count(method_name, result)
+        return {'id': req_id, 'result': result}
+
+    def _run_coalesced(self, method_name: str, key, fetch: Callable[[], Dict]) -> Dict:
+        """先查结果缓存，未命中时与同时到达的相同请求合并为一次读取
+
+        缓存及共享的结果每次都复制一份返回，调用方附加 trace 或取出图片帧不会影响其他请求。
+        """
+        if self.result_cache is not None:
+            state, cached = self.result_cache.lookup(key)
+            if state == RESULT_STALE and self._start_refresh(key):
+                threading.Thread(target=self._refresh, args=(key, fetch), daemon=True).start()
+            if state != RESULT_MISS:
+                return copy.deepcopy(cached)
+
+        result, shared = self.flights.do(key, lambda: self._fetch_and_store(key, fetch))
+        if shared:
+            with self._counts_lock:
+                self.coalesced_counts[method_name] = self.coalesced_counts.get(method_name, 0) + 1
+        return copy.deepcopy(result)
+
+    def _fetch_and_store(self, key, fetch: Callable[[], Dict]) -> Dict:
+        result = fetch()
+        if self.result_cache is not None and isinstance(result, dict) and result.get('success'):
+            self.result_cache.put(key, result)
+        return result
+
+    def _start_refresh(self, key) -> bool:
+        """登记后台刷新；已有刷新线程或相同请求正在读取时返回 False"""
+        with self._counts_lock:
+            if key in self._refreshing or self.flights.in_flight(key):
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _refresh(self, key, fetch: Callable[[], Dict]):
+        """后台刷新已过期的缓存结果；失败时保留旧结果，直到超过可返回旧结果的时间"""
+        try:
+            result, _ = self.flights.do(key, lambda: self._fetch_and_store(key, fetch))
+        finally:
+            with self._counts_lock:
+                self._refreshing.discard(key)
+        outcome = 'success' if isinstance(result, dict) and result.get('success') else 'error'
+        with self._counts_lock:
+            self.refresh_counts[outcome] = self.refresh_counts.get(outcome, 0) + 1
+
+    def _count(self, method_name: str, result):
+        outcome = 'success' if isinstance(result, dict) and result.get('success') else 'error'
+        with self._counts_lock:
+            self.served += 1
+            key = (method_name, outcome)
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+    def _handle_cache(self, method_name: str, params: Dict) -> Dict:
+        cache = get_master_data_cache()
+        if method_name == 'cache_stats':
+            render_cache = get_render_cache()
+            if cache is None and render_cache is None and self.result_cache is None and self.bundle_cache is None:
+                return {'success': False, 'error': '缓存未启用'}
+            result = {'success': True}
+            if cache is not None:
+                result['cache'] = cache.stats()
+            if render_cache is not None:
+                result['render_cache'] = render_cache.stats()
+            if self.result_cache is not None:
+                result['result_cache'] = self.result_cache.stats()
+            if self.bundle_cache is not None:
+                result['order_cache'] = self.bundle_cache.stats()
+            with self._counts_lock:
+                result['coalesced'] = dict(self.coalesced_counts)
+            return result
+        if cache is None:
+            return {'success': False, 'error': '主数据缓存未启用'}
+        table = str(params.get('table', '')).upper()
+        if not table:
+            return {'success': False, 'error': '请提供表名参数'}
+        removed = cache.invalidate(table, params.get('key'))
+        return {'success': True, 'removed': removed}
+
+    def handle_line(self, line: str) -> bytes:
+        """处理一行请求，返回要写出的字节：响应JSON行及其后的图片帧"""
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('请求必须是JSON对象')
+        except ValueError as e:
+            response = {'id': None, 'result': {'success': False, 'error': f'请求格式错误: {e}'}}
+        else:
+            response = self.handle(request)
+        return encode_output(response)
+
+
+def pop_image_frames(result: Dict) -> List[bytes]:
+    """取出结果（含批量结果）中待发送的图片字节，并为每个 image_frame 编号"""
+    frames = []
+    for item in [result] + list(result.get('results') or []):
+        png = item.pop('_image_bytes', None)
+        if png is not None:
+            item['image_frame']['index'] = len(frames)
+            frames.append(png)
+    return frames
+
+
+def encode_output(payload: Dict) -> bytes:
+    """把响应（或命令行结果）编码为一行JSON，需要时在其后附加图片帧"""
+    result = payload.get('result', payload)
+    frames = pop_image_frames(result) if isinstance(result, dict) else []
+    return b''.join([(json.dumps(payload, ensure_ascii=False) + '\n').encode('utf-8')] + frames)
+
+
+def serve_stdio(worker: SapWorker, stdin=None, stdout=None):
+    """逐行读取stdin中的请求，逐个写出响应（图片帧为二进制，直接写入字节流）"""
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout.buffer
+    for line in stdin:
+        if not line.strip():
+            continue
+        stdout.write(worker.handle_line(line))
+        stdout.flush()
+
+
+def serve_unix(worker: SapWorker, socket_path: str):
+    """在本地Unix套接字上提供服务，每个客户端连接一个线程"""
+    if not hasattr(socketserver, 'UnixStreamServer'):
+        raise RuntimeError('当前平台不支持Unix套接字，请使用stdin/stdout模式')
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for raw in self.rfile:
+                line = raw.decode('utf-8').strip()
+                if not line:
+                    continue
+                self.wfile.write(worker.handle_line(line))
+                self.wfile.flush()
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    with Server(socket_path, Handler) as server:
+        os.chmod(socket_path, 0o600)
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
+
+def prometheus_metrics(worker: SapWorker) -> str:
+    """Prometheus 文本格式的累计指标：RFC调用、各阶段耗时、请求数、缓存命中、连接池与熔断器状态"""
+    lines = metrics.prometheus_lines()
+    lines.append('# HELP sap_worker_requests_total 工作进程处理的请求数')
+    lines.append('# TYPE sap_worker_requests_total counter')
+    with worker._counts_lock:
+        request_counts = sorted(worker.request_counts.items())
+    for (method_name, outcome), count in request_counts:
+        lines.append(f'sap_worker_requests_total{format_labels(method=method_name, outcome=outcome)} {count}')
+    with worker._counts_lock:
+        coalesced_counts = sorted(worker.coalesced_counts.items())
+        refresh_counts = sorted(worker.refresh_counts.items())
+    lines.append('# HELP sap_worker_coalesced_requests_total 与同时到达的相同请求共享一次SAP读取的请求数')
+    lines.append('# TYPE sap_worker_coalesced_requests_total counter')
+    for method_name, count in coalesced_counts:
+        lines.append(f'sap_worker_coalesced_requests_total{format_labels(method=method_name)} {count}')
+    if worker.result_cache is not None:
+        stats = worker.result_cache.stats()
+        lines.append('# HELP sap_worker_result_cache_lookups_total 结果缓存查询次数（fresh/stale/miss）')
+        lines.append('# TYPE sap_worker_result_cache_lookups_total counter')
+        for state in ('fresh', 'stale'):
+            lines.append(f'sap_worker_result_cache_lookups_total{format_labels(state=state)} {stats[state + "_hits"]}')
+        lines.append(f'sap_worker_result_cache_lookups_total{format_labels(state="miss")} {stats["misses"]}')
+        lines.append('# HELP sap_worker_result_cache_refreshes_total 过期结果的后台刷新次数')
+        lines.append('# TYPE sap_worker_result_cache_refreshes_total counter')
+        for outcome, count in refresh_counts:
+            lines.append(f'sap_worker_result_cache_refreshes_total{format_labels(outcome=outcome)} {count}')
+        lines.append('# HELP sap_worker_result_cache_bytes 结果缓存中结果的估算总大小')
+        lines.append('# TYPE sap_worker_result_cache_bytes gauge')
+        lines.append(f'sap_worker_result_cache_bytes {stats["size_bytes"]}')
+
+    pool_stats = worker.pool.stats()
+    breaker = pool_stats['breaker']
+    lines.append('# HELP sap_pool_connections 连接池中的SAP连接数（idle 空闲 / in_use 使用中）')
+    lines.append('# TYPE sap_pool_connections gauge')
+    for state in ('idle', 'in_use'):
+        lines.append(f'sap_pool_connections{format_labels(state=state)} {pool_stats[state]}')
+    lines.append('# HELP sap_circuit_breaker_state 熔断器当前状态（取值为1的一项）')
+    lines.append('# TYPE sap_circuit_breaker_state gauge')
+    for state in (BREAKER_CLOSED, BREAKER_OPEN, BREAKER_HALF_OPEN):
+        lines.append(f'sap_circuit_breaker_state{format_labels(state=state)} {int(breaker["state"] == state)}')
+
+    counters = [('sap_connections_opened_total', '连接池累计打开的SAP连接数', pool_stats['created']),
+                ('sap_connections_discarded_total', '因出错、断开或 ping 失败而关闭的SAP连接数', pool_stats['discarded']),
+                ('sap_connection_ping_failures_total', '复用前 ping 失败的空闲连接数', pool_stats['ping_failures']),
+                ('sap_request_deadline_exceeded_total', '超过请求时限的SAP访问次数', pool_stats['deadline_exceeded']),
+                ('sap_circuit_breaker_trips_total', '熔断器断开次数', breaker['trips']),
+                ('sap_circuit_breaker_rejected_total', '熔断期间直接拒绝的SAP访问次数', breaker['rejected'])]
+    cache = get_master_data_cache()
+    if cache is not None:
+        stats = cache.stats()
+        counters += [('sap_master_data_cache_hits_total', '主数据缓存命中次数', stats['hits']),
+                     ('sap_master_data_cache_misses_total', '主数据缓存未命中次数', stats['misses']),
+                     ('sap_master_data_cache_evictions_total', '主数据缓存淘汰条目数', stats['evictions'])]
+    render_cache = get_render_cache()
+    if render_cache is not None:
+        stats = render_cache.stats()
+        counters += [('sap_render_cache_hits_total', '渲染缓存命中次数', stats['hits']),
+                     ('sap_render_cache_misses_total', '渲染缓存未命中次数', stats['misses']),
+                     ('sap_render_cache_bytes_saved_total', '渲染缓存命中时省去渲染的图片字节数', stats['bytes_saved']),
+                     ('sap_render_cache_evictions_total', '渲染缓存淘汰的文件数', stats['evictions'])]
+    for name, help_text, value in counters:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+def serve_metrics(worker: SapWorker, port: int, host: str = '127.0.0.1'):
+    """在后台线程中通过HTTP提供 /metrics，供 Prometheus 抓取"""
+    # http.server 只在启用时导入，不增加工作进程的启动耗时
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_metrics(worker).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # stdout 用于JSON响应，不输出访问日志
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class StubConnection:
+    """不连接SAP的桩连接，所有表均返回空结果，用于测量工作进程本身的开销"""
+
+    def __init__(self, call_latency: float = 0.0):
+        self.call_latency = call_latency
+        self.alive = True
+        self.calls = 0
+
+    def call(self, func_name, **params):
+        self.calls += 1
+        if self.call_latency:
+            time.sleep(self.call_latency)
+        return {'DATA': [], 'FIELDS': []}
+
+    def ping(self):
+        pass
+
+    def close(self):
+        self.alive = False
+
+
+def run_benchmark(methods: Dict[str, Callable], requests: int, connect_latency: float, call_latency: float) -> Dict:
+    """对比“每次请求新建连接”与“常驻进程复用连接”的吞吐量"""
+
+    def stub_connect():
+        time.sleep(connect_latency)
+        return StubConnection(call_latency)
+
+    def params_for(name, i):
+        if METHODS[name][2] == 'order_numbers':
+            return {'order_numbers': [str(100000 + i * 10 + j) for j in range(10)]}
+        return {'order_number': str(100000 + i)}
+
+    report = {}
+    for name in methods:
+        if METHODS[name][2] == 'order_data':
+            # 只生成图片的方法不使用SAP连接
+            continue
+        fresh_worker = SapWorker(methods, ConnectionPool(stub_connect, max_size=1))
+        started = time.perf_counter()
+        for i in range(requests):
+            fresh_worker.pool.close()
+            fresh_worker.handle({'id': i, 'method': name, 'params': params_for(name, i)})
+        fresh_elapsed = time.perf_counter() - started
+
+        warm_worker = SapWorker(methods, ConnectionPool(stub_connect, max_size=1))
+        started = time.perf_counter()
+        for i in range(requests):
+            warm_worker.handle({'id': i, 'method': name, 'params': params_for(name, i)})
+        warm_elapsed = time.perf_counter() - started
+
+        report[name] = {
+            'requests': requests,
+            'per_request_connection_rps': round(requests / fresh_elapsed, 1),
+            'resident_worker_rps': round(requests / warm_elapsed, 1),
+            'connections_opened': warm_worker.pool.created,
+        }
+    return report
+
+
+def measure_import_time(module_name: str) -> Dict:
+    """用 python -X importtime 在新进程中测量导入一个模块的耗时（毫秒），并列出导入的重量级模块"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+                               cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or '[us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        entries.append((name.strip(), int(cumulative), (len(name) - len(name.lstrip()) - 1) // 2))
+
+    index = next((i for i, entry in enumerate(entries) if entry[0] == module_name and entry[2] == 0), None)
+    if completed.returncode != 0 or index is None:
+        return {'module': module_name, 'error': completed.stderr.strip().splitlines()[-1:] or ['导入失败']}
+    total_us = entries[index][1]
+    imported = {name.split('.')[0] for name, _, _ in entries}
+    # 输出按导入完成的顺序排列，被测模块的依赖紧挨在它前面；取其中直接依赖耗时最多的几个
+    first = index
+    while first > 0 and entries[first - 1][2] > 0:
+        first -= 1
+    children = [(name, us) for name, us, level in entries[first:index] if level == 1]
+    slowest = sorted(children, key=lambda e: -e[1])[:5]
+    return {
+        'module': module_name,
+        'import_ms': round(total_us / 1000, 1),
+        'heavy_imports': sorted(imported & set(HEAVY_IMPORTS)),
+        'slowest_dependencies_ms': {name: round(us / 1000, 1) for name, us in slowest},
+    }
+
+
+def run_startup_benchmark(budget_ms: float = STARTUP_BUDGET_MS) -> Dict:
+    """冷启动检查：各脚本导入耗时不超过预算，且导入时不加载 HEAVY_IMPORTS（均应在第一次使用时才导入）"""
+    modules = [measure_import_time(name) for name in STARTUP_MODULES]
+    ok = all('error' not in m and not m['heavy_imports'] and m['import_ms'] <= budget_ms for m in modules)
+    return {'success': ok, 'budget_ms': budget_ms, 'modules': modules}
+
+
+def main(argv=None, method_names: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='SAP RFC 常驻工作进程')
+    parser.add_argument('--socket', help='监听的Unix套接字路径（默认使用stdin/stdout）')
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help='最多同时打开的SAP连接数（需不小于 SAP_RFC_CONCURRENCY × 同时处理的请求数）')
+    parser.add_argument('--bench', type=int, metavar='N', help='使用桩连接执行N次请求并输出吞吐量')
+    parser.add_argument('--connect-latency', type=float, default=0.2, help='桩连接建立耗时（秒）')
+    parser.add_argument('--call-latency', type=float, default=0.0, help='桩连接每次RFC调用耗时（秒）')
+    parser.add_argument('--result-ttl', type=float, default=RESULT_CACHE_TTL,
+                        help='get_order_details / get_work_order_report 结果缓存有效期（秒，默认0不缓存）')
+    parser.add_argument('--result-stale', type=float, default=RESULT_CACHE_STALE,
+                        help='结果过期后仍先返回旧结果、同时后台刷新的时间（秒）')
+    parser.add_argument('--bundle-ttl', type=float, default=ORDER_BUNDLE_TTL,
+                        help=f'工单数据缓存有效期（秒，默认 {ORDER_BUNDLE_TTL:g}，0为不缓存）：组件和报工单数据分别缓存')
+    parser.add_argument('--prefetch-views', action='store_true', default=ORDER_PREFETCH,
+                        help='单个工单的请求返回后，用空闲连接在后台读取另一种视图写入工单缓存（SAP_ORDER_PREFETCH=1）')
+    parser.add_argument('--warm', type=int, default=DEFAULT_WARM_CONNECTIONS,
+                        help=f'启动后在后台预先建立的SAP连接数（默认 {DEFAULT_WARM_CONNECTIONS}，0为不预先建立）')
+    parser.add_argument('--metrics-port', type=int, help='在 127.0.0.1 的该端口通过HTTP提供 /metrics（Prometheus 文本格式）')
+    parser.add_argument('--bench-startup', action='store_true',
+                        help='用 python -X importtime 检查各脚本的导入耗时，超出预算或导入了重量级模块时返回1')
+    args = parser.parse_args(argv)
+
+    if args.bench_startup:
+        report = run_startup_benchmark()
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0 if report['success'] else 1
+
+    methods = load_methods(method_names)
+
+    if args.bench:
+        report = run_benchmark(methods, args.bench, args.connect_latency, args.call_latency)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    # 请求连接与并发读取借用的额外连接共用同一个连接池
+    pool = ConnectionPool(max_size=args.pool_size)
+    set_connection_pool(pool)
+    # 报工单结果带有图片，按估算的字节数限制总大小（SAP_RESULT_CACHE_MAX_BYTES）
+    result_cache = (ResultCache(args.result_ttl, args.result_stale, sizeof=estimate_size)
+                    if args.result_ttl > 0 else None)
+    # sap_order 在此处才导入，不增加 --bench-startup 测量的导入耗时
+    from sap_order import set_bundle_cache
+    worker = SapWorker(methods, pool, result_cache, set_bundle_cache(args.bundle_ttl, args.prefetch_views))
+    if args.warm > 0:
+        # 后台建立连接，不推迟开始接收请求；连接失败计入熔断器，由之后的请求重试
+        threading.Thread(target=pool.warm_up, args=(args.warm,), daemon=True).start()
+    if args.metrics_port:
+        serve_metrics(worker, args.metrics_port)
+    try:
+        if args.socket:
+            serve_unix(worker, args.socket)
+        else:
+            serve_stdio(worker)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.exit(main())
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""班次预热：提前读取并渲染下一班次计划开始的工单
+
+报工单请求大多针对计划开始日期（AFKO.GSTRP）在即将开始的班次内的工单，每个工单第一次打印都要完整读取SAP并渲染。
+预热任务在班次开始前（例如由定时任务启动）：
+  - 查询计划开始日期在范围内的工单（可按工厂过滤）
+  - 以有限的并发数（默认2个SAP连接）分批读取工单数据，同时填充主数据缓存（物料描述、图号、工作中心）
+  - 读取到的报工单数据保存到预热数据缓存（sap_cache.WarmOrderCache，有效期 SAP_WARM_ORDER_TTL 秒，默认1800）
+  - 为每个工单生成报工单图片写入渲染缓存，已缓存的跳过
+  - 指定 --sync-replica 时先同步本地工单副本（见 sap_replica.py），预热数据过期后读取工单数据也不经过SAP
+预热后操作员第一次打印时工单数据来自预热数据缓存、图片来自渲染缓存，不访问SAP。预热应在班次开始前
+SAP_WARM_ORDER_TTL 秒之内运行；之后修改的工单（例如员工分配）要等预热数据过期才会打印出来，
+可用 python sap_cache.py invalidate ORDER_DATA [工单号] 提前清除。
+同步副本和查询工单、以及每批工单的读取各自受批量请求时限 SAP_BATCH_DEADLINE 限制（默认600秒，0为不限制）。
+GSTRP 为日期字段，班次范围按日期指定。
+
+用法：
+  python shift_prewarm.py --from 20250102 [--to 20250102] [--werks 1000] [--concurrency 2] [--sync-replica]
+  python shift_prewarm.py --from 20250102 --format 1bit --progress     # 逐个工单输出进度（NDJSON）
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from sap_breaker import BATCH_REQUEST_DEADLINE, request_deadline
+from sap_cache import get_warm_order_cache
+from sap_common import ConnectionPool, get_connection_pool, orders_in_window
+from sap_metrics import phase
+
+# 默认同时使用的SAP连接数
+DEFAULT_PREWARM_CONCURRENCY = int(os.getenv('SAP_PREWARM_CONCURRENCY', '2'))
+# 每批一起读取的工单数（每张表按订单号合并查询）
+PREWARM_BATCH_SIZE = 20
+
+WARM_RENDERED = 'rendered'
+WARM_CACHED = 'cached'
+WARM_NOT_FOUND = 'not_found'
+WARM_ERROR = 'error'
+
+
+def _warm_render(order_data: Dict, image_options: Dict) -> str:
+    """为工单生成图片写入渲染缓存，已缓存时返回 cached"""
+    from image_cache import get_render_cache
+    from work_order_image import get_renderer, render_cache_key
+
+    cache = get_render_cache()
+    image_format = image_options.get('format')
+    compress_level = image_options.get('compress_level')
+    key = render_cache_key(order_data, image_format, compress_level)
+    if cache.contains(key):
+        return WARM_CACHED
+    cache.put(key, get_renderer().render_png(order_data, image_format, compress_level))
+    return WARM_RENDERED
+
+
+class _Progress:
+    """汇总各线程的结果，每完成一个工单调用一次回调"""
+
+    def __init__(self, total: int, callback: Optional[Callable[[Dict], None]]):
+        self.total = total
+        self.callback = callback
+        self.started = time.perf_counter()
+        self.counts = {WARM_RENDERED: 0, WARM_CACHED: 0, WARM_NOT_FOUND: 0, WARM_ERROR: 0}
+        self.failed = []
+        self.fetch_seconds = 0.0
+        self.render_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def done(self, order_number: str, status: str, error: Optional[str] = None):
+        with self._lock:
+            self.counts[status] += 1
+            if error is not None:
+                self.failed.append({'order_number': order_number, 'error': error})
+            finished = sum(self.counts.values())
+            event = {'type': 'progress', 'order_number': order_number, 'status': status, 'done': finished,
+                     'total': self.total, 'elapsed_ms': round((time.perf_counter() - self.started) * 1000, 1)}
+            if error is not None:
+                event['error'] = error
+            if self.callback is not None:
+                self.callback(event)
+
+    def add_time(self, fetch: float = 0.0, render: float = 0.0):
+        with self._lock:
+            self.fetch_seconds += fetch
+            self.render_seconds += render
+
+
+def _warm_batch(pool: ConnectionPool, order_numbers: List[str], image_options: Dict, progress: _Progress):
+    """在一个连接上读取一批工单的数据，再逐个渲染；读取失败时整批记为失败"""
+    from sap_rfc_extended import get_production_orders_data
+
+    started = time.perf_counter()
+    try:
+        with request_deadline(BATCH_REQUEST_DEADLINE), pool.connection() as conn, phase('sap.fetch'):
+            # 预热总是重新读取SAP，不使用上一次预热保存的数据
+            orders_data = get_production_orders_data(conn, order_numbers, concurrency=1, use_warm_cache=False)
+    except Exception as e:
+        progress.add_time(fetch=time.perf_counter() - started)
+        for order_number in order_numbers:
+            progress.done(order_number, WARM_ERROR, f'SAP读取失败: {e}')
+        return
+    progress.add_time(fetch=time.perf_counter() - started)
+    warm_cache = get_warm_order_cache()
+    if warm_cache is not None:
+        warm_cache.put_many(orders_data)
+
+    for order_number, order_data in orders_data.items():
+        if not order_data:
+            progress.done(order_number, WARM_NOT_FOUND)
+            continue
+        started = time.perf_counter()
+        try:
+            status = _warm_render(order_data, image_options)
+        except Exception as e:
+            progress.done(order_number, WARM_ERROR, f'生成图片失败: {e}')
+        else:
+            progress.done(order_number, status)
+        finally:
+            progress.add_time(render=time.perf_counter() - started)
+
+
+def prewarm_shift(date_from: str, date_to: Optional[str] = None, werks: Optional[str] = None,
+                  concurrency: int = DEFAULT_PREWARM_CONCURRENCY, image_options: Optional[Dict] = None,
+                  sync_replica: bool = False, progress: Optional[Callable[[Dict], None]] = None,
+                  pool: Optional[ConnectionPool] = None) -> Dict:
+    """预热计划开始日期在 [date_from, date_to]（YYYYMMDD）内的工单，返回各阶段耗时及每种结果的工单数
+
+    image_options 与打印请求的 {"format", "compress_level"} 一致时才能命中渲染缓存（未提供时都使用环境变量的默认值）。
+    progress 在每个工单完成时被调用（可能来自不同线程）。
+    """
+    from image_cache import get_render_cache
+
+    if get_render_cache() is None:
+        return {'success': False, 'error': '渲染缓存未启用（SAP_RENDER_CACHE_DISABLED=1），预热没有意义'}
+    date_to = date_to or date_from
+    image_options = image_options or {}
+    pool = pool or get_connection_pool()
+    started = time.perf_counter()
+    report = {'date_from': date_from, 'date_to': date_to, 'werks': werks, 'concurrency': concurrency}
+    try:
+        with request_deadline(BATCH_REQUEST_DEADLINE), pool.connection() as conn:
+            if sync_replica:
+                if not werks:
+                    raise ValueError('同步本地副本需要指定工厂（--werks）')
+                from sap_replica import DEFAULT_REPLICA_PATH, SapReplica, get_replica
+                replica = get_replica() or SapReplica(DEFAULT_REPLICA_PATH)
+                report['replica_sync'] = replica.sync(conn, werks, date_from, date_to)
+            query_started = time.perf_counter()
+            with phase('prewarm.query'):
+                aufnrs = orders_in_window(conn, werks, date_from, date_to)
+            report['query_seconds'] = round(time.perf_counter() - query_started, 3)
+    except Exception as e:
+        return {'success': False, 'error': str(e), **report}
+
+    # 与操作员请求一致，使用不带前导零的工单号
+    order_numbers = [str(int(a)) if a.isdigit() else a for a in aufnrs]
+    tracker = _Progress(len(order_numbers), progress)
+    batches = [order_numbers[i:i + PREWARM_BATCH_SIZE] for i in range(0, len(order_numbers), PREWARM_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(_warm_batch, pool, batch, image_options, tracker) for batch in batches]
+        for future in as_completed(futures):
+            future.result()
+
+    report.update({
+        'success': True,
+        'orders': len(order_numbers),
+        'rendered': tracker.counts[WARM_RENDERED],
+        'already_cached': tracker.counts[WARM_CACHED],
+        'not_found': tracker.counts[WARM_NOT_FOUND],
+        'failed': tracker.failed,
+        # 预热总耗时（墙钟），以及各线程读取和渲染耗时之和
+        'seconds': round(time.perf_counter() - started, 3),
+        'fetch_seconds': round(tracker.fetch_seconds, 3),
+        'render_seconds': round(tracker.render_seconds, 3),
+    })
+    return report
+
+
+if __name__ == "__main__":
+    from work_order_image import IMAGE_FORMATS
+
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description='班次预热：提前读取并渲染计划开始日期在范围内的工单')
+    parser.add_argument('--from', dest='date_from', required=True, help='计划开始日期起（YYYYMMDD）')
+    parser.add_argument('--to', dest='date_to', help='计划开始日期止（YYYYMMDD，默认与起始日期相同）')
+    parser.add_argument('--werks', help='工厂')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_PREWARM_CONCURRENCY,
+                        help=f'同时使用的SAP连接数（默认 {DEFAULT_PREWARM_CONCURRENCY}）')
+    parser.add_argument('--format', choices=IMAGE_FORMATS, help='图片格式（与打印请求一致）')
+    parser.add_argument('--compress-level', type=int, help='PNG压缩级别（与打印请求一致）')
+    parser.add_argument('--sync-replica', action='store_true', help='先同步本地工单副本（需要 --werks）')
+    parser.add_argument('--progress', action='store_true', help='逐个工单输出进度（NDJSON），最后一行为汇总')
+    parser.add_argument('--nice', type=int, default=10, help='降低进程优先级，避免影响在线请求（默认10，0为不调整）')
+    args = parser.parse_args()
+
+    if args.nice and hasattr(os, 'nice'):
+        os.nice(args.nice)
+
+    def print_progress(event):
+        print(json.dumps(event, ensure_ascii=False), flush=True)
+
+    options = {key: value for key, value in (('format', args.format), ('compress_level', args.compress_level))
+               if value is not None}
+    result = prewarm_shift(args.date_from, args.date_to, args.werks, args.concurrency, options, args.sync_replica,
+                           print_progress if args.progress else None)
+    if args.progress:
+        result = {'type': 'end', **result}
+    print(json.dumps(result, ensure_ascii=False))
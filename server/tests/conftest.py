@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""测试共用的夹具：所有测试都在离线SAP后端（sap_fake.py）上运行，不连接SAP
+
+在 server 目录下运行：python -m pytest -q tests
+"""
+
+import os
+import sys
+import json
+import hashlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sap_common  # noqa: E402
+from sap_fake import FIXTURE_SIZES, FakeConnection, Fixture, generate_fixture  # noqa: E402
+
+# 影响取数路径的环境变量，每个测试开始时清除，避免开发机上的设置影响结果
+SAP_ENV_VARS = ('SAP_FAKE_LATENCY', 'SAP_FAKE_LATENCY_PER_ROW', 'SAP_FAKE_FAIL_RATE', 'SAP_FAKE_CONNECT_FAIL_RATE',
+                'SAP_FAKE_DOWN', 'SAP_RFC_CONCURRENCY', 'SAP_RFC_TRACE')
+
+
+def canonical_digest(value) -> str:
+    """结果的规范JSON（键排序）的 SHA-256，用于与改动前的输出比较"""
+    text = json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def order_number(size: str) -> str:
+    """夹具中 small/medium/huge 工单的订单号"""
+    return FIXTURE_SIZES[size][0]
+
+
+@pytest.fixture(scope='session')
+def generated_tables():
+    """generate_fixture() 构造的表数据（只读，需要修改数据的测试用 fake_fixture 取得副本）"""
+    return generate_fixture().tables
+
+
+@pytest.fixture
+def fake_fixture(generated_tables) -> Fixture:
+    """每个测试独立的夹具副本，测试可以修改其中的行"""
+    return Fixture({name: {'fields': dict(table['fields']), 'rows': [dict(row) for row in table['rows']]}
+                    for name, table in generated_tables.items()})
+
+
+@pytest.fixture(scope='session')
+def fixture_file(tmp_path_factory, generated_tables) -> str:
+    path = str(tmp_path_factory.mktemp('sap_fake') / 'fixture.json')
+    Fixture(generated_tables).save(path)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def offline_sap(monkeypatch, fixture_file):
+    """open_connection 返回夹具连接；关闭主数据缓存、渲染缓存和本地副本，每个测试使用新的连接池"""
+    for name in SAP_ENV_VARS:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('SAP_FAKE_FIXTURE', fixture_file)
+    monkeypatch.setenv('SAP_CACHE_DISABLED', '1')
+    monkeypatch.setenv('SAP_RENDER_CACHE_DISABLED', '1')
+    monkeypatch.setenv('SAP_REPLICA_DISABLED', '1')
+    pool = sap_common.ConnectionPool()
+    monkeypatch.setattr(sap_common, '_connection_pool', pool)
+    yield
+    pool.close()
+
+
+@pytest.fixture
+def fake_conn(fake_fixture) -> FakeConnection:
+    return FakeConnection(fake_fixture)
+
+
+def table_calls(conn: FakeConnection, table: str) -> int:
+    """连接上读取某张表的 RFC_READ_TABLE 次数"""
+    return sum(1 for name, _, _ in conn.history if name == table)
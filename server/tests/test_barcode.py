@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""报工单条形码：编码与 python-barcode 相同，绘制的条纹可按模块宽度还原，且不超出 BARCODE_WIDTH"""
+
+import pytest
+from barcode import Code128
+from PIL import Image, ImageDraw
+
+from work_order_image import BARCODE_QUIET_MODULES, BARCODE_WIDTH, code128_modules, draw_code128_modules
+
+MARGIN = 100
+
+
+def _barcode_texts(tables):
+    """与渲染器相同方式组合的 工单号 + 第一个员工的人员号 + 工序号"""
+    texts = set()
+    for row in tables['ZAFVC']['rows']:
+        texts.add(f"{row['AUFNR'].replace('000000', '')}{row['PERNR']}{row['VORNR'].zfill(4)}")
+    for row in tables['AFKO']['rows']:
+        texts.add(f"{row['AUFNR'].replace('000000', '')}0010")
+    return sorted(texts)
+
+
+def _draw(modules):
+    """在左右各留 MARGIN 的白色画布上绘制，返回第一行像素"""
+    image = Image.new('L', (BARCODE_WIDTH + 2 * MARGIN, 1), 255)
+    draw_code128_modules(ImageDraw.Draw(image), modules, MARGIN, 0, height=1)
+    return list(image.getdata())
+
+
+def _black_columns(row):
+    return [x for x, value in enumerate(row) if value == 0]
+
+
+def test_modules_match_python_barcode(generated_tables):
+    texts = _barcode_texts(generated_tables)
+    assert len(texts) > 100
+    for text in texts:
+        assert code128_modules(text) == Code128(text).build()[0]
+
+
+def test_drawn_bars_match_modules(generated_tables):
+    for text in _barcode_texts(generated_tables)[:50]:
+        modules = code128_modules(text)
+        module_px = BARCODE_WIDTH // (len(modules) + 2 * BARCODE_QUIET_MODULES)
+        assert module_px >= 2
+        row = _draw(modules)
+        left = _black_columns(row)[0]
+        decoded = ''.join('1' if row[left + i * module_px] == 0 else '0' for i in range(len(modules)))
+        assert decoded == modules
+        # 条形码在区域内居中
+        assert left - MARGIN == (BARCODE_WIDTH - len(modules) * module_px) // 2
+
+
+@pytest.mark.parametrize('text', ['1234567' + 'EMPLOYEE-A' * 3 + '0010', 'ABCDEFGHIJKLMNOPQRSTUVWXYZ' * 2])
+def test_long_barcode_stays_within_width(text):
+    modules = code128_modules(text)
+    assert len(modules) + 2 * BARCODE_QUIET_MODULES > BARCODE_WIDTH
+
+    black = _black_columns(_draw(modules))
+    assert MARGIN <= black[0] and black[-1] < MARGIN + BARCODE_WIDTH
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""熔断器、连接池的空闲连接检查与请求时限：用 sap_fake 的 FaultInjector 和模拟延迟制造故障"""
+
+import time
+
+import pytest
+
+import print_job
+import sap_breaker
+import sap_common
+import sap_rfc
+import sap_rfc_extended
+from conftest import order_number
+from sap_breaker import (BREAKER_CLOSED, BREAKER_HALF_OPEN, BREAKER_OPEN, CircuitBreaker, SapDeadlineExceeded,
+                         SapUnavailable, request_deadline)
+from sap_common import ConnectionPool
+from sap_fake import CommunicationError, FakeConnection, FakeRfcError, FaultInjector
+
+AUFK_QUERY = {'QUERY_TABLE': 'AUFK', 'FIELDS': [{'FIELDNAME': 'AUFNR'}],
+              'OPTIONS': [{'TEXT': f"AUFNR = '{order_number('small').zfill(12)}'"}]}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _pool(fixture, faults=None, latency=0.0, **kwargs) -> ConnectionPool:
+    def connect():
+        if faults is not None:
+            faults.on_connect()
+        return FakeConnection(fixture, latency=latency, faults=faults)
+    return ConnectionPool(connect, **kwargs)
+
+
+def _use_pool(monkeypatch, pool: ConnectionPool):
+    """替换进程内的连接池（conn 为空的请求从这里借用连接）"""
+    monkeypatch.setattr(sap_common, '_connection_pool', pool)
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=FakeClock())
+    for _ in range(2):
+        breaker.record_failure(CommunicationError('RFC_COMMUNICATION_FAILURE'))
+    assert breaker.state == BREAKER_CLOSED
+    breaker.record_success()
+    for _ in range(3):
+        breaker.record_failure(CommunicationError('RFC_COMMUNICATION_FAILURE'))
+
+    assert breaker.state == BREAKER_OPEN
+    with pytest.raises(SapUnavailable):
+        breaker.before_request()
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_breaker_half_open_trial_closes_on_success():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure(CommunicationError('RFC_COMMUNICATION_FAILURE'))
+    clock.now += 30
+
+    assert breaker.before_request() is True
+    assert breaker.state == BREAKER_HALF_OPEN
+    # 同一时间只放行一个试探
+    with pytest.raises(SapUnavailable):
+        breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == BREAKER_CLOSED
+    assert breaker.before_request() is False
+
+
+def test_breaker_failed_trial_reopens():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure(CommunicationError('RFC_COMMUNICATION_FAILURE'))
+    clock.now += 30
+    assert breaker.before_request()
+    breaker.record_failure(CommunicationError('RFC_COMMUNICATION_FAILURE'))
+
+    assert (breaker.state, breaker.trips) == (BREAKER_OPEN, 2)
+    with pytest.raises(SapUnavailable):
+        breaker.before_request()
+
+
+def test_pool_fails_fast_while_sap_down_and_recovers(fake_fixture):
+    clock = FakeClock()
+    faults = FaultInjector(down=True)
+    pool = _pool(fake_fixture, faults, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock))
+    for _ in range(2):
+        with pytest.raises(CommunicationError):
+            pool.acquire()
+    # 断开后不再尝试连接SAP
+    with pytest.raises(SapUnavailable):
+        pool.acquire()
+    assert faults.injected == 2
+
+    faults.down = False
+    clock.now += 30
+    with pool.connection() as conn:
+        assert len(conn.call('RFC_READ_TABLE', **AUFK_QUERY)['DATA']) == 1
+    assert pool.stats()['breaker']['state'] == BREAKER_CLOSED
+
+
+def test_call_failure_trips_breaker_and_discards_connection(fake_fixture):
+    faults = FaultInjector()
+    pool = _pool(fake_fixture, faults, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=30))
+    with pytest.raises(CommunicationError):
+        with pool.connection() as conn:
+            faults.fail_rate = 1.0
+            conn.call('RFC_READ_TABLE', **AUFK_QUERY)
+
+    stats = pool.stats()
+    assert (stats['idle'], stats['discarded'], stats['breaker']['state']) == (0, 1, BREAKER_OPEN)
+
+
+def test_business_error_does_not_trip_breaker(fake_fixture):
+    pool = _pool(fake_fixture, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=30))
+    with pytest.raises(FakeRfcError):
+        with pool.connection() as conn:
+            conn.call('RFC_READ_TABLE', QUERY_TABLE='ZMISSING', FIELDS=[], OPTIONS=[])
+
+    assert pool.stats()['breaker']['state'] == BREAKER_CLOSED
+
+
+def test_idle_connection_is_pinged_and_evicted(fake_fixture):
+    pool = _pool(fake_fixture, ping_after=0)
+    with pool.connection() as conn:
+        first = conn.conn
+    # 空闲期间连接被SAP断开
+    first.alive = False
+
+    with pool.connection() as conn:
+        assert conn.conn is not first
+        conn.call('RFC_READ_TABLE', **AUFK_QUERY)
+    stats = pool.stats()
+    assert (stats['created'], stats['ping_failures'], stats['discarded']) == (2, 1, 1)
+    assert stats['breaker']['state'] == BREAKER_CLOSED
+
+
+def test_recently_used_connection_is_not_pinged(fake_fixture):
+    pool = _pool(fake_fixture, ping_after=60)
+    with pool.connection() as conn:
+        first = conn.conn
+    first.alive = False
+
+    # 空闲时间未超过 ping_after，直接复用（断开的连接在调用时才发现）
+    with pool.connection() as conn:
+        assert conn.conn is first
+    assert pool.stats()['ping_failures'] == 0
+
+
+def test_deadline_cancels_slow_call(fake_fixture):
+    pool = _pool(fake_fixture, latency=1.0)
+    started = time.monotonic()
+    with pytest.raises(SapDeadlineExceeded):
+        with request_deadline(0.1), pool.connection() as conn:
+            conn.call('RFC_READ_TABLE', **AUFK_QUERY)
+
+    assert time.monotonic() - started < 1.0
+    stats = pool.stats()
+    assert (stats['deadline_exceeded'], stats['idle'], stats['discarded']) == (1, 0, 1)
+
+
+def test_waiting_for_busy_pool_respects_deadline(fake_fixture):
+    pool = _pool(fake_fixture, max_size=1)
+    with pool.connection():
+        with pytest.raises(SapDeadlineExceeded):
+            with request_deadline(0.05):
+                pool.acquire()
+    assert pool.stats()['deadline_exceeded'] == 1
+
+
+def test_request_deadline_reported_as_error(fake_fixture, monkeypatch):
+    _use_pool(monkeypatch, _pool(fake_fixture, latency=0.5))
+    monkeypatch.setattr(sap_rfc, 'DEFAULT_REQUEST_DEADLINE', 0.1)
+    result = sap_rfc.get_order_details(order_number('small'))
+
+    assert result['success'] is False
+    assert 'SAP请求超过时限' in result['error']
+
+
+def test_batch_requests_use_batch_deadline(fake_fixture, monkeypatch):
+    _use_pool(monkeypatch, _pool(fake_fixture, latency=0.02))
+    monkeypatch.setattr(sap_rfc_extended, 'DEFAULT_REQUEST_DEADLINE', 0.01)
+    monkeypatch.setattr(sap_rfc_extended, 'BATCH_REQUEST_DEADLINE', 0)
+
+    assert sap_rfc_extended.get_work_orders_data([order_number('small'), order_number('medium')])['success']
+    assert not sap_rfc_extended.get_work_order_data(order_number('small'))['success']
+
+
+def test_print_job_applies_batch_deadline(fake_fixture, monkeypatch, tmp_path):
+    _use_pool(monkeypatch, _pool(fake_fixture, latency=0.5))
+    monkeypatch.setattr(sap_breaker, 'BATCH_REQUEST_DEADLINE', 0.1)
+    result = print_job.print_work_orders([order_number('small')], output_path=str(tmp_path / 'out.pdf'))
+
+    assert result['success'] is False
+    assert 'SAP请求超过时限' in result['error']
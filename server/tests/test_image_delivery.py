@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""图片交付方式：file 写入有大小上限的图片目录，frame 在响应行之后发送原始PNG字节"""
+
+import io
+import json
+import hashlib
+
+import pytest
+
+import work_order_image
+from conftest import order_number
+from image_cache import RenderCache
+from sap_rfc_extended import get_work_order_report
+from sap_worker import SapWorker, load_methods
+from work_order_image import save_png
+
+
+@pytest.fixture
+def image_store(tmp_path, monkeypatch):
+    store = RenderCache(str(tmp_path / 'images'))
+    monkeypatch.setattr(work_order_image, '_image_store', store)
+    return store
+
+
+def _png(seed: int) -> bytes:
+    """内容不同、大小相同的数据（目录只按内容哈希命名，不检查格式）"""
+    return seed.to_bytes(4, 'big') * 256
+
+
+def test_file_delivery_writes_image(image_store, fake_conn):
+    result = get_work_order_report(order_number('small'), fake_conn, image_options={'delivery': 'file'})
+
+    assert result['success'] and 'image' not in result
+    with open(result['image_file'], 'rb') as f:
+        png = f.read()
+    assert png.startswith(b'\x89PNG')
+    assert (len(png), hashlib.sha256(png).hexdigest()) == (result['image_size'], result['image_sha256'])
+    assert image_store.tracked_size() == len(png)
+
+
+def test_file_delivery_directory_is_bounded(tmp_path):
+    store = RenderCache(str(tmp_path / 'images'), max_bytes=4 * 1024)
+    paths = []
+    for seed in range(3):
+        paths.append(save_png(_png(seed), store)[0])
+    # 再次交付第一张图片，使其成为最近使用的
+    assert save_png(_png(0), store)[0] == paths[0]
+    save_png(_png(3), store)
+    save_png(_png(4), store)
+
+    stats = store.stats()
+    assert stats['size_bytes'] <= store.max_bytes
+    assert stats['evictions'] == 2
+    assert [store.contains(hashlib.sha256(_png(seed)).hexdigest()) for seed in range(5)] == \
+        [True, False, False, True, True]
+
+
+def test_frame_delivery_sends_png_after_response_line():
+    worker = SapWorker(load_methods(['get_work_order_reports']))
+    request = {'id': 7, 'method': 'get_work_order_reports',
+               'params': {'order_numbers': [order_number('small'), '999999', order_number('medium')],
+                          'image_options': {'delivery': 'frame', 'format': '1bit'}}}
+    output = io.BytesIO(worker.handle_line(json.dumps(request)))
+
+    response = json.loads(output.readline())
+    assert response['id'] == 7 and '_image_bytes' not in json.dumps(response)
+    frames = [item['image_frame'] for item in response['result']['results'] if item['success']]
+    assert [frame['index'] for frame in frames] == [0, 1]
+    for frame in frames:
+        png = output.read(frame['length'])
+        assert png.startswith(b'\x89PNG')
+        assert hashlib.sha256(png).hexdigest() == frame['sha256']
+    assert output.read() == b''
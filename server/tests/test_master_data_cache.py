@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""主数据缓存：跨进程失效、SQLite条目清理与累计计数（两个 MasterDataCache 实例共用一个文件，模拟两个进程）"""
+
+import time
+
+import pytest
+
+import sap_cache
+from sap_cache import MasterDataCache
+
+ROWS = [{'MATNR': '000000000000300000', 'MAKTX': '物料300000'}]
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'master_data.sqlite3')
+
+
+def test_invalidate_reaches_other_processes(cache_path, monkeypatch):
+    writer = MasterDataCache(cache_path)
+    worker = MasterDataCache(cache_path)
+    writer.put('MAKT', 'v', '300000', ROWS)
+    assert worker.get('MAKT', 'v', '300000') == (True, ROWS)
+
+    assert writer.invalidate('MAKT', '300000') == 1
+    # 检查间隔内常驻进程仍可使用内存中的条目，间隔过后丢弃
+    monkeypatch.setattr(sap_cache, 'GENERATION_CHECK_SECONDS', 0.0)
+    assert worker.get('MAKT', 'v', '300000') == (False, None)
+
+
+def test_invalidate_keeps_other_tables_in_memory(cache_path, monkeypatch):
+    writer = MasterDataCache(cache_path)
+    worker = MasterDataCache(cache_path)
+    writer.put('MARA', 'v', '300000', ROWS)
+    assert worker.get('MARA', 'v', '300000')[0]
+
+    writer.invalidate('MAKT')
+    monkeypatch.setattr(sap_cache, 'GENERATION_CHECK_SECONDS', 0.0)
+    assert worker.get('MARA', 'v', '300000') == (True, ROWS)
+
+
+def test_put_purges_expired_rows(cache_path, monkeypatch):
+    cache = MasterDataCache(cache_path, purge_every=1)
+    cache.put('MAKT', 'v', 'old', ROWS)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + sap_cache.MASTER_DATA_TTLS['MAKT'] + 1)
+    cache.put('MAKT', 'v', 'new', ROWS)
+
+    assert cache.stats()['disk_entries'] == 1
+
+
+def test_put_caps_disk_entries(cache_path):
+    cache = MasterDataCache(cache_path, max_disk_entries=3, purge_every=1)
+    for i in range(5):
+        cache.put('MAKT', 'v', str(i), ROWS)
+
+    assert cache.stats()['disk_entries'] == 3
+    reader = MasterDataCache(cache_path, max_entries=0)
+    assert reader.get('MAKT', 'v', '4')[0]
+    assert not reader.get('MAKT', 'v', '0')[0]
+
+
+def test_stats_cover_all_processes(cache_path):
+    worker = MasterDataCache(cache_path)
+    worker.put('MAKT', 'v', '300000', ROWS)
+    worker.get('MAKT', 'v', '300000')
+    worker.get('MAKT', 'v', 'missing')
+    worker.flush_stats()
+
+    stats = MasterDataCache(cache_path).stats()
+    assert (stats['hits'], stats['misses']) == (0, 0)
+    assert stats['all_processes'] == {'hits': 1, 'misses': 1, 'evictions': 0, 'hit_rate': 0.5}
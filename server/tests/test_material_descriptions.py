@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""物料描述（MAKT）批量查询：次数只与去重后的物料数 / IN_QUERY_CHUNK_SIZE 有关，与组件行数无关"""
+
+import io
+import json
+import math
+
+import pytest
+
+from conftest import canonical_digest, order_number, table_calls
+from sap_common import IN_QUERY_CHUNK_SIZE, read_material_descriptions
+from sap_fake import FIXTURE_SIZES
+from sap_rfc import get_order_details, stream_order_details
+
+# 改动前（每个组件单独查询 MAKT）的 get_order_details 输出
+PRE_CHANGE_DIGESTS = {
+    'small': '993d4e4b0c732a0e23a38bcc9a485e9e374ca6408b2c04579f826e0ea3df039d',
+    'medium': '2494cd4a8e23ec5a4cdc54202e73f16c1e33b0c9cc8b8a212cb0381a5456cb24',
+    'huge': '5a853e37fe2a3009ec3d5040aacb2c6100a35720854a02e2c08d0f390a46c5d9',
+}
+
+
+def _makt_batches(size: str) -> int:
+    """组件物料加产成品，去重后按块查询的次数"""
+    components = FIXTURE_SIZES[size][3]
+    return math.ceil((min(components, 2000) + 1) / IN_QUERY_CHUNK_SIZE)
+
+
+def test_descriptions_are_read_in_chunks(fake_conn):
+    matnrs = [str(300000 + i).zfill(18) for i in range(150)]
+    descriptions = read_material_descriptions(fake_conn, matnrs + matnrs)
+
+    assert table_calls(fake_conn, 'MAKT') == math.ceil(150 / IN_QUERY_CHUNK_SIZE)
+    assert len(descriptions) == 150
+    assert descriptions[matnrs[0]] == '物料300000'
+
+
+@pytest.mark.parametrize('size', ['small', 'medium', 'huge'])
+def test_order_details_batches_makt(fake_conn, size):
+    result = get_order_details(order_number(size), fake_conn)
+
+    assert table_calls(fake_conn, 'MAKT') == _makt_batches(size)
+    assert len(result['components']) == FIXTURE_SIZES[size][3]
+    assert canonical_digest(result) == PRE_CHANGE_DIGESTS[size]
+
+
+def test_150_component_order_makes_constant_makt_calls(fake_conn):
+    result = get_order_details(order_number('medium'), fake_conn)
+
+    assert len(result['components']) == 150
+    # 151 个物料（含产成品）分4块查询，而不是每个组件一次
+    assert table_calls(fake_conn, 'MAKT') == 4
+    assert fake_conn.calls == 6
+
+
+def test_stream_batches_makt_per_page(fake_conn):
+    out = io.StringIO()
+    stream_order_details(order_number('medium'), fake_conn, out)
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    assert records[-1] == {'type': 'end', 'success': True, 'components': 150}
+    assert table_calls(fake_conn, 'MAKT') == 4
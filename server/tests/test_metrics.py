@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""请求跟踪与 Prometheus 指标：跟踪记录与实际的RFC调用一致，计数器按表累计相同的行数和字节数"""
+
+import re
+
+import pytest
+
+import sap_metrics
+import sap_worker
+from conftest import order_number
+from sap_fake import FakeConnection
+from sap_metrics import Metrics, call_traced
+from sap_rfc import get_order_details
+from sap_worker import SapWorker, load_methods, prometheus_metrics
+
+METRIC_LINE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+
+
+class ByteCountingConnection(FakeConnection):
+    """记录每次调用返回的 (表, 行数, 字节数)"""
+
+    def __init__(self, fixture):
+        super().__init__(fixture)
+        self.returned = []
+
+    def call(self, func_name, **params):
+        result = super().call(func_name, **params)
+        data = result.get('DATA') or []
+        self.returned.append((params.get('QUERY_TABLE', ''), len(data), sum(len(row['WA']) for row in data)))
+        return result
+
+
+@pytest.fixture
+def fresh_metrics(monkeypatch):
+    """每个测试使用新的进程内计数"""
+    fresh = Metrics()
+    monkeypatch.setattr(sap_metrics, 'metrics', fresh)
+    monkeypatch.setattr(sap_worker, 'metrics', fresh)
+    return fresh
+
+
+def _samples(text):
+    """Prometheus 文本 -> {(指标名, 标签): 值}"""
+    samples = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            labels = tuple(re.findall(r'(\w+)="([^"]*)"', match.group(2)))
+            samples[(match.group(1), labels)] = float(match.group(3))
+    return samples
+
+
+@pytest.mark.parametrize('size', ['small', 'medium'])
+def test_trace_matches_rfc_calls(fresh_metrics, fake_fixture, size):
+    conn = ByteCountingConnection(fake_fixture)
+    result = call_traced(True, get_order_details, order_number(size), conn)
+
+    trace = result['trace']
+    assert result['success']
+    assert trace['rfc_calls'] == conn.calls == len(conn.returned)
+    assert sorted((c['table'], c['rows'], c['bytes']) for c in trace['calls']) == sorted(conn.returned)
+    assert all(c['function'] == 'RFC_READ_TABLE' and c['ms'] >= 0 for c in trace['calls'])
+    assert trace['rfc_ms'] <= trace['total_ms']
+    assert trace['errors'] == []
+
+
+def test_worker_trace_and_prometheus_counters(fresh_metrics):
+    worker = SapWorker(load_methods(['get_order_details']))
+    response = worker.handle({'id': 1, 'method': 'get_order_details',
+                              'params': {'order_number': order_number('medium'), 'trace': True}})
+    trace = response['result']['trace']
+    samples = _samples(prometheus_metrics(worker))
+
+    per_table = {}
+    for call in trace['calls']:
+        entry = per_table.setdefault(call['table'], [0, 0, 0])
+        entry[0] += 1
+        entry[1] += call['rows']
+        entry[2] += call['bytes']
+    assert per_table
+    for table, (calls, rows, nbytes) in per_table.items():
+        labels = (('function', 'RFC_READ_TABLE'), ('table', table))
+        assert samples[('sap_rfc_calls_total', labels)] == calls
+        assert samples[('sap_rfc_rows_total', labels)] == rows
+        assert samples[('sap_rfc_bytes_total', labels)] == nbytes
+        assert samples[('sap_rfc_errors_total', labels)] == 0
+        assert samples[('sap_rfc_seconds_total', labels)] >= 0
+    for name in {entry['phase'] for entry in trace['phases']}:
+        count = sum(1 for entry in trace['phases'] if entry['phase'] == name)
+        assert samples[('sap_phase_total', (('phase', name),))] == count
+    assert samples[('sap_worker_requests_total', (('method', 'get_order_details'), ('outcome', 'success')))] == 1
+    assert samples[('sap_pool_connections', (('state', 'idle'),))] == 1
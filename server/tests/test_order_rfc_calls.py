@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""报工单取数（get_production_order_data）的RFC调用次数与输出
+
+每张表按订单号/工艺路线号合并查询后，调用次数与工序数、员工数无关；输出与改动前逐道工序查询的结果相同。
+"""
+
+import pytest
+
+from conftest import canonical_digest, order_number, table_calls
+from sap_rfc_extended import get_production_order_data, get_production_orders_data
+
+# 改动前（逐道工序查询 CRHD/CRTX/AFVV/ZAFVC）的输出，huge 工单按不限制行数（ROWCOUNT=0）读取
+PRE_CHANGE_DIGESTS = {
+    'small': '2104809ce50b6dfc1b1eb07e620ea5db276096a4676dce7a79f3bd6d35a361f2',
+    'medium': 'd682cd04debdb4a071ca270dab8f27967af1e4e06b1cd61cade908621a682610',
+    'huge': '1a4a313bc98d420f6813386d4225e817587eefc41fdcaba0dd8b5ec59a3f8e7a',
+}
+# AUFK、AFKO、AFVC、AFVV、ZAFVC、MAKT、MARA、CRHD、CRTX 各一次
+REPORT_CALLS = 9
+
+
+@pytest.mark.parametrize('size', ['small', 'medium', 'huge'])
+def test_report_reads_each_table_once(fake_conn, size):
+    order_data = get_production_order_data(fake_conn, order_number(size))
+
+    assert fake_conn.calls == REPORT_CALLS
+    for table in ('AUFK', 'AFKO', 'AFVC', 'AFVV', 'ZAFVC', 'MAKT', 'MARA', 'CRHD', 'CRTX'):
+        assert table_calls(fake_conn, table) == 1, table
+    assert canonical_digest(order_data) == PRE_CHANGE_DIGESTS[size]
+
+
+def test_batch_reads_each_table_once(fake_conn):
+    sizes = ['small', 'medium', 'huge']
+    orders_data = get_production_orders_data(fake_conn, [order_number(size) for size in sizes])
+
+    assert fake_conn.calls == REPORT_CALLS
+    for size in sizes:
+        assert canonical_digest(orders_data[order_number(size)]) == PRE_CHANGE_DIGESTS[size]
+
+
+def test_unknown_order_stops_after_header(fake_conn):
+    assert get_production_order_data(fake_conn, '9999999') is None
+    assert [name for name, _, _ in fake_conn.history] == ['AUFK']
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""工单缓存（sap_order.set_bundle_cache）：只读取请求的视图，两种视图的输出与分别读取时相同；预读只在启用时进行"""
+
+import threading
+
+import pytest
+
+import sap_common
+from conftest import canonical_digest, order_number, table_calls
+from sap_common import ConnectionPool
+from sap_fake import FakeConnection
+from sap_order import get_order_views, set_bundle_cache
+from sap_rfc import get_order_details
+from sap_rfc_extended import get_production_order_data
+from test_material_descriptions import PRE_CHANGE_DIGESTS as DETAILS_DIGESTS
+from test_order_rfc_calls import PRE_CHANGE_DIGESTS as REPORT_DIGESTS, REPORT_CALLS
+
+SIZES = ['small', 'medium', 'huge']
+
+
+@pytest.fixture
+def bundle_cache():
+    """测试结束后关闭工单缓存（进程内全局设置）"""
+    yield set_bundle_cache
+    set_bundle_cache(0)
+
+
+def _join_prefetch():
+    for thread in threading.enumerate():
+        if thread.name == 'sap-order-prefetch':
+            thread.join()
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_views_match_separate_paths(fake_conn, size):
+    views = get_order_views(order_number(size), fake_conn)
+
+    assert views['success']
+    assert views['order_details'] == get_order_details(order_number(size), fake_conn)
+    assert views['order_data'] == get_production_order_data(fake_conn, order_number(size))
+    assert canonical_digest(views['order_details']) == DETAILS_DIGESTS[size]
+    assert canonical_digest(views['order_data']) == REPORT_DIGESTS[size]
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_cache_reads_only_requested_view(fake_fixture, bundle_cache, size):
+    uncached = FakeConnection(fake_fixture)
+    expected = get_order_details(order_number(size), uncached)
+    bundle_cache(5)
+    conn = FakeConnection(fake_fixture)
+
+    assert get_order_details(order_number(size), conn) == expected
+    assert conn.calls == uncached.calls
+    assert table_calls(conn, 'AFVC') == 0
+
+    conn.reset_stats()
+    order_data = get_production_order_data(conn, order_number(size))
+    assert conn.calls == REPORT_CALLS
+    assert canonical_digest(order_data) == REPORT_DIGESTS[size]
+
+    # 两种视图都已缓存
+    conn.reset_stats()
+    views = get_order_views(order_number(size), conn)
+    assert conn.calls == 0
+    assert (views['order_details'], views['order_data']) == (expected, order_data)
+
+
+def test_prefetch_reads_other_view_in_background(fake_conn, bundle_cache):
+    bundle_cache(5, prefetch=True)
+    get_order_details(order_number('medium'), fake_conn)
+    _join_prefetch()
+
+    # 后台预读使用连接池中的连接，紧接着的报工单请求不再访问SAP
+    fake_conn.reset_stats()
+    order_data = get_production_order_data(fake_conn, order_number('medium'))
+    assert fake_conn.calls == 0
+    assert canonical_digest(order_data) == REPORT_DIGESTS['medium']
+
+
+def test_prefetch_skipped_when_pool_busy(fake_conn, bundle_cache, monkeypatch):
+    pool = ConnectionPool(max_size=1)
+    monkeypatch.setattr(sap_common, '_connection_pool', pool)
+    bundle_cache(5, prefetch=True)
+    with pool.connection():
+        get_order_details(order_number('small'), fake_conn)
+        _join_prefetch()
+
+    fake_conn.reset_stats()
+    get_production_order_data(fake_conn, order_number('small'))
+    assert fake_conn.calls == REPORT_CALLS
+
+
+def test_no_prefetch_by_default(fake_conn, bundle_cache):
+    bundle_cache(5)
+    get_order_details(order_number('small'), fake_conn)
+
+    assert not any(thread.name == 'sap-order-prefetch' for thread in threading.enumerate())
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""批量打印：多页PDF/TIFF的页数与各工单分页之和一致，渲染失败或没有数据的工单被跳过"""
+
+import pytest
+from PIL import Image, PdfParser
+
+from print_job import write_print_job
+from work_order_image import sample_order_data
+
+# 第二个工单的数据不完整，在渲染进程中出错
+ORDERS = [('1000001', sample_order_data(1)), ('1000002', {'基础信息': None}),
+          ('1000003', None), ('1000004', sample_order_data(40))]
+
+
+def _page_count(path: str, output_format: str) -> int:
+    if output_format == 'pdf':
+        return len(PdfParser.PdfParser(filename=path).pages)
+    with Image.open(path) as image:
+        return image.n_frames
+
+
+@pytest.mark.parametrize('output_format', ['pdf', 'tiff'])
+def test_batch_skips_failed_order(tmp_path, output_format):
+    path = str(tmp_path / f'shift.{output_format}')
+    result = write_print_job(ORDERS, path, output_format, workers=2)
+
+    assert result['success']
+    assert [r['success'] for r in result['results']] == [True, False, False, True]
+    assert [r['order_number'] for r in result['results']] == [number for number, _ in ORDERS]
+    pages = [r['pages'] for r in result['results'] if r['success']]
+    assert pages[0] == 1 and pages[1] > 1
+    assert result['pages'] == sum(pages) == _page_count(path, output_format)
+
+
+def test_batch_without_printable_orders(tmp_path):
+    result = write_print_job([('1000002', {'基础信息': None})], str(tmp_path / 'shift.pdf'), workers=1)
+
+    assert not result['success']
+    assert not (tmp_path / 'shift.pdf').exists()
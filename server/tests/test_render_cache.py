@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""渲染缓存：启动时不扫描目录、覆盖写入时的大小统计、跨进程累计的计数"""
+
+import pytest
+
+from image_cache import RenderCache
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / 'renders')
+
+
+def test_open_does_not_scan_directory(cache_dir, monkeypatch):
+    RenderCache(cache_dir).put('a', b'x' * 10)
+
+    def fail_scan(self):
+        raise AssertionError('启动时扫描了缓存目录')
+    monkeypatch.setattr(RenderCache, '_scan', fail_scan)
+    cache = RenderCache(cache_dir)
+    assert cache.get('a') == b'x' * 10
+    cache.put('b', b'y' * 5)
+    assert cache.tracked_size() == 15
+
+
+def test_overwrite_does_not_inflate_size(cache_dir):
+    cache = RenderCache(cache_dir, max_bytes=250)
+    cache.put('other', b'o' * 100)
+    for _ in range(3):
+        cache.put('same', b's' * 100)
+    cache.put('same', b's' * 60)
+
+    assert cache.tracked_size() == 160
+    assert cache.evictions == 0
+    assert cache.get('other') is not None
+
+
+def test_eviction_keeps_size_below_limit(cache_dir):
+    cache = RenderCache(cache_dir, max_bytes=250)
+    for key in 'abc':
+        cache.put(key, b'z' * 100)
+
+    assert cache.evictions == 1
+    assert cache.tracked_size() == 200
+    assert cache.stats()['size_bytes'] == 200
+
+
+def test_stats_cover_all_processes(cache_dir):
+    worker = RenderCache(cache_dir)
+    worker.put('a', b'x' * 10)
+    worker.get('a')
+    worker.get('missing')
+    worker.flush_stats()
+
+    stats = RenderCache(cache_dir).stats()
+    assert (stats['hits'], stats['bytes_saved']) == (0, 0)
+    assert stats['all_processes'] == {'hits': 1, 'misses': 1, 'bytes_saved': 10, 'evictions': 0, 'hit_rate': 0.5}
+    assert (stats['entries'], stats['size_bytes']) == (1, 10)
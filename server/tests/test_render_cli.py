@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""--render 的输入检查：失败的取数结果或非工单数据不生成空白报工单，命令返回非0"""
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from sap_rfc_extended import get_work_order_data, order_data_from_payload
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _render_cli(payload: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, 'sap_rfc_extended.py', '--render'], input=payload.encode('utf-8'),
+                          cwd=SERVER_DIR, capture_output=True, env={**os.environ, 'SAP_RENDER_CACHE_DISABLED': '1'})
+
+
+@pytest.mark.parametrize('payload, error', [
+    ({'success': False, 'error': 'SAP连接失败: 超时'}, 'SAP连接失败: 超时'),
+    ({'success': False}, '取数失败'),
+    ({'success': True, 'order_data': {}}, '工单数据格式错误: 缺少基础信息'),
+    ({'工序与员工分配': []}, '工单数据格式错误: 缺少基础信息'),
+    ([], '工单数据格式错误: 需要JSON对象'),
+])
+def test_rejects_non_order_payloads(payload, error):
+    with pytest.raises(ValueError) as excinfo:
+        order_data_from_payload(payload)
+    assert str(excinfo.value) == error
+
+
+def test_accepts_data_only_result_and_bare_order_data(fake_conn):
+    result = get_work_order_data('1000001', fake_conn)
+
+    assert order_data_from_payload(result) is result['order_data']
+    assert order_data_from_payload(result['order_data']) is result['order_data']
+
+
+@pytest.mark.parametrize('payload', ['{"success": false, "error": "未找到工单数据"}', '{"foo": 1}', 'not json'])
+def test_cli_exits_non_zero(payload):
+    completed = _render_cli(payload)
+
+    assert completed.returncode == 1
+    assert json.loads(completed.stdout)['success'] is False
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""按条带绘制和编码的报工单与一次绘制完整画布的像素相同；员工很多的工序不会被裁掉"""
+
+import io
+
+import pytest
+from PIL import Image
+
+import work_order_image
+from work_order_image import IMAGE_FORMATS, STRIP_HEIGHT, WorkOrderRenderer, sample_order_data
+
+
+@pytest.fixture(scope='module')
+def renderer():
+    return WorkOrderRenderer()
+
+
+def _decode(png):
+    with Image.open(io.BytesIO(png)) as image:
+        image.load()
+        # gray 的调色板索引转换为灰度值后比较
+        return image.convert('L') if image.mode == 'P' else image.copy()
+
+
+@pytest.mark.parametrize('image_format', IMAGE_FORMATS)
+def test_strips_match_full_canvas(renderer, monkeypatch, image_format):
+    order_data = sample_order_data(30)
+    full = _decode(renderer.render_png(order_data, image_format))
+    monkeypatch.setattr(work_order_image, 'MAX_CANVAS_HEIGHT', 500)
+    strips = _decode(renderer.render_png(order_data, image_format))
+
+    assert full.height > 4 * STRIP_HEIGHT
+    assert (strips.mode, strips.size) == (full.mode, full.size)
+    assert strips.tobytes() == full.tobytes()
+
+
+def test_many_employees_are_not_clipped(renderer):
+    employees = 60
+    order_data = sample_order_data(3, employees=employees)
+    layout = renderer.layout(order_data)
+    image = renderer.render_image(order_data)
+
+    # 高度按内容计算：每多一名员工每道工序多一行
+    assert image.height == layout.height == renderer.layout(sample_order_data(3)).height + 3 * (employees - 2) * 18
+    last = max(command for command in layout.commands if command[2] == 'text'
+               and f'员工{employees - 1}，' in command[3][1])
+    barcode_bottom = max(command[1] for command in layout.commands if command[2] == 'barcode')
+    assert barcode_bottom <= image.height
+    gray = image.convert('L')
+    y = last[3][0][1]
+    assert min(gray.crop((100, y, 500, y + 14)).getdata()) < 128
+    assert min(gray.crop((0, barcode_bottom - 10, image.width, barcode_bottom)).getdata()) == 0
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""进程内共享的渲染器：并发的第一次调用只创建一个渲染器"""
+
+import threading
+import time
+
+import work_order_image
+
+
+def test_concurrent_first_calls_share_one_renderer(monkeypatch):
+    created = []
+
+    class SlowRenderer:
+        def __init__(self):
+            # 加载字体、绘制抬头期间其他线程也在请求渲染器
+            time.sleep(0.05)
+            created.append(self)
+
+    monkeypatch.setattr(work_order_image, '_renderer', None)
+    monkeypatch.setattr(work_order_image, 'WorkOrderRenderer', SlowRenderer)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def request():
+        barrier.wait()
+        results.append(work_order_image.get_renderer())
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(renderer is created[0] for renderer in results)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""本地副本的增量同步与新鲜度：夹具中的修改都不更新 AUFK.AEDAT，只能由 AFKO 窗口比较或全量同步发现"""
+
+import pytest
+
+import sap_replica
+from conftest import order_number
+from sap_replica import ReplicaConnection, SapReplica
+from sap_rfc import get_order_details
+from sap_rfc_extended import get_production_orders_data
+
+WINDOW = ('1000', '20250101', '20250131')
+SIZES = ['small', 'medium', 'huge']
+
+
+@pytest.fixture
+def replica(tmp_path):
+    replica = SapReplica(str(tmp_path / 'replica.sqlite3'))
+    yield replica
+    replica.close()
+
+
+def _update(fixture, table, aufnr_field, key, **values):
+    """修改夹具中的行（不修改 AUFK.AEDAT，模拟增量同步看不到的修改）"""
+    for row in fixture.tables[table]['rows']:
+        if row[aufnr_field] == key:
+            row.update(values)
+    fixture.tables[table].pop('indexes', None)
+
+
+def _results(conn):
+    orders = [order_number(size) for size in SIZES]
+    return [get_order_details(order, conn) for order in orders], get_production_orders_data(conn, orders)
+
+
+def _assert_matches_sap(replica, conn):
+    assert _results(ReplicaConnection(replica, conn)) == _results(conn)
+
+
+def _age_full_sync(replica, seconds):
+    with replica._lock:
+        replica._db.execute("UPDATE replica_scopes SET last_full_sync = last_full_sync - ?", (seconds,))
+
+
+def test_full_sync_matches_sap(replica, fake_conn):
+    stats = replica.sync(fake_conn, *WINDOW)
+
+    assert (stats['mode'], stats['orders']) == ('full', 3)
+    assert replica.covers([order_number(size) for size in SIZES])
+    _assert_matches_sap(replica, fake_conn)
+
+
+def test_incremental_picks_up_reschedule_into_window(replica, fake_fixture, fake_conn):
+    small = order_number('small').zfill(12)
+    _update(fake_fixture, 'AFKO', 'AUFNR', small, GSTRP='20250301')
+    assert replica.sync(fake_conn, *WINDOW)['orders'] == 2
+
+    _update(fake_fixture, 'AFKO', 'AUFNR', small, GSTRP='20250115')
+    stats = replica.sync(fake_conn, *WINDOW)
+
+    assert (stats['mode'], stats['orders'], stats['orders_reloaded']) == ('incremental', 3, 1)
+    _assert_matches_sap(replica, fake_conn)
+
+
+def test_incremental_removes_order_rescheduled_out(replica, fake_fixture, fake_conn):
+    replica.sync(fake_conn, *WINDOW)
+    _update(fake_fixture, 'AFKO', 'AUFNR', order_number('small').zfill(12), GSTRP='20250301')
+    stats = replica.sync(fake_conn, *WINDOW)
+
+    assert (stats['orders'], stats['orders_removed']) == (2, 1)
+    assert not replica.covers([order_number('small')])
+
+
+def test_incremental_reloads_order_with_changed_afko(replica, fake_fixture, fake_conn):
+    replica.sync(fake_conn, *WINDOW)
+    _update(fake_fixture, 'AFKO', 'AUFNR', order_number('medium').zfill(12), GAMNG='250.000', GLTRP='20250120')
+    stats = replica.sync(fake_conn, *WINDOW)
+
+    assert (stats['mode'], stats['orders_reloaded']) == ('incremental', 1)
+    _assert_matches_sap(replica, fake_conn)
+
+
+def test_operation_change_is_picked_up_by_periodic_full_sync(replica, fake_fixture, fake_conn):
+    replica.sync(fake_conn, *WINDOW)
+    aufpl = next(row['AUFPL'] for row in fake_fixture.tables['AFKO']['rows']
+                 if row['AUFNR'] == order_number('small').zfill(12))
+    _update(fake_fixture, 'AFVC', 'AUFPL', aufpl, LTXA1='改后的工序描述')
+    assert replica.sync(fake_conn, *WINDOW)['mode'] == 'incremental'
+
+    _age_full_sync(replica, sap_replica.REPLICA_FULL_INTERVAL)
+    assert replica.sync(fake_conn, *WINDOW)['mode'] == 'full'
+    _assert_matches_sap(replica, fake_conn)
+
+
+def test_stale_full_sync_is_not_fresh(replica, fake_conn):
+    replica.sync(fake_conn, *WINDOW)
+    _age_full_sync(replica, sap_replica.REPLICA_FULL_INTERVAL + sap_replica.REPLICA_MAX_AGE + 1)
+
+    assert not replica.covers([order_number('small')])
+    assert not replica.covers_window(*WINDOW)
+    assert not replica.status()['scopes'][0]['fresh']
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""组件需求汇总：按物料+单位的合计与每个工单的明细，与逐行计算的结果一致（NumPy 与纯Python两种汇总）"""
+
+import pytest
+
+from conftest import order_number
+from sap_requirements import RequirementRollup, read_requirements
+
+ORDERS = [order_number('small'), order_number('medium')]
+
+
+def _numpy_modes():
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return [False]
+    return [True, False]
+
+
+@pytest.fixture
+def resb(fake_fixture):
+    """在夹具中加入已删除的预留行、同一物料的另一单位以及超领的行"""
+    rows = fake_fixture.tables['RESB']['rows']
+    small = order_number('small').zfill(12)
+    first = next(row for row in rows if row['AUFNR'] == small)
+    rows.append({**first, 'RSPOS': '0901', 'BDMNG': '99.000', 'ENMNG': '0.000', 'XLOEK': 'X'})
+    rows.append({**first, 'RSPOS': '0902', 'MEINS': 'KG', 'BDMNG': '2.500', 'ENMNG': '0.500'})
+    rows.append({**first, 'RSPOS': '0903', 'AUFNR': order_number('medium').zfill(12),
+                 'BDMNG': '1.000', 'ENMNG': '4.000'})
+    fake_fixture.tables['RESB'].pop('indexes', None)
+    return rows
+
+
+def _expected(rows):
+    """逐行计算的合计与明细"""
+    orders = [number.zfill(12) for number in ORDERS]
+    totals = {}
+    by_order = {number: {} for number in ORDERS}
+    for row in rows:
+        if row['AUFNR'] not in orders or row['XLOEK']:
+            continue
+        key = (int(row['MATNR']), row['MEINS'])
+        required, withdrawn = float(row['BDMNG']), float(row['ENMNG'])
+        quantities = (required, withdrawn, max(required - withdrawn, 0.0))
+        total = totals.setdefault(key, {'sums': [0.0] * 3, 'lines': 0, 'orders': set()})
+        total['sums'] = [a + b for a, b in zip(total['sums'], quantities)]
+        total['lines'] += 1
+        total['orders'].add(row['AUFNR'])
+        components = by_order[str(int(row['AUFNR']))]
+        components[key] = [a + b for a, b in zip(components.get(key, [0.0] * 3), quantities)]
+
+    def entry(key, sums):
+        return {'matnr': str(key[0]), 'unit': key[1], 'required_qty': pytest.approx(sums[0]),
+                'withdrawn_qty': pytest.approx(sums[1]), 'open_qty': pytest.approx(sums[2])}
+
+    materials = [{**entry(key, total['sums']), 'orders': len(total['orders']), 'lines': total['lines']}
+                 for key, total in sorted(totals.items())]
+    return materials, {number: [entry(key, sums) for key, sums in sorted(components.items())]
+                       for number, components in by_order.items()}
+
+
+@pytest.mark.parametrize('use_numpy', _numpy_modes())
+def test_rollup_matches_row_by_row(resb, fake_conn, use_numpy):
+    result = read_requirements(fake_conn, ORDERS).result(use_numpy=use_numpy)
+    materials, by_order = _expected(resb)
+
+    assert (result['orders'], result['lines']) == (2, 10 + 150 + 2)
+    assert result['materials'] == materials
+    assert result['by_order'] == by_order
+
+
+@pytest.mark.parametrize('use_numpy', _numpy_modes())
+def test_deleted_lines_and_units(resb, fake_conn, use_numpy):
+    result = read_requirements(fake_conn, ORDERS).result(use_numpy=use_numpy)
+    small = {(c['matnr'], c['unit']): c for c in result['by_order'][order_number('small')]}
+    medium = {(c['matnr'], c['unit']): c for c in result['by_order'][order_number('medium')]}
+
+    # 已删除的行（需求99）不计入，同一物料的 KG 与 EA 分别汇总
+    assert (small[('300000', 'EA')]['required_qty'], small[('300000', 'KG')]['required_qty']) == (2.0, 2.5)
+    assert small[('300000', 'KG')]['open_qty'] == 2.0
+    # 超领的行（需求1、已领4）未领数量计为0，不抵消同一物料另一行的缺口1
+    assert medium[('300000', 'EA')]['open_qty'] == 1.0
+    totals = {(m['matnr'], m['unit']): m for m in result['materials']}
+    assert (totals[('300000', 'EA')]['orders'], totals[('300000', 'EA')]['lines']) == (2, 3)
+
+
+def test_page_field_order_does_not_matter(fake_conn):
+    """字段顺序不同的页按 FIELDS 元数据解析"""
+    page = fake_conn.call('RFC_READ_TABLE', QUERY_TABLE='RESB', DELIMITER='|',
+                          FIELDS=[{'FIELDNAME': name} for name in ['ENMNG', 'MEINS', 'BDMNG', 'MATNR', 'AUFNR']],
+                          OPTIONS=[{'TEXT': f"AUFNR = '{order_number('small').zfill(12)}'"}])
+    rollup = RequirementRollup()
+    rollup.add_page(page)
+
+    expected = read_requirements(fake_conn, [order_number('small')]).result()
+    assert rollup.result() == expected
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""常驻进程的请求合并与结果缓存：相同请求共享一次读取，过期结果只后台刷新一次，刷新失败时保留旧结果"""
+
+import threading
+import time
+
+import pytest
+
+from result_cache import ResultCache, estimate_size
+from sap_worker import SapWorker
+
+REQUEST = {'id': 1, 'method': 'get_order_details', 'params': {'order_number': '1000001'}}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class BlockingMethod:
+    """替代 get_order_details：记录调用次数，release 之前一直阻塞"""
+
+    def __init__(self):
+        self.calls = 0
+        self.succeed = True
+        self.released = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, order_number, conn=None):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        assert self.released.wait(5)
+        if not self.succeed:
+            return {'success': False, 'error': 'SAP不可用'}
+        return {'success': True, 'order_number': order_number, 'call': call}
+
+
+def _wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def _join_refresh(worker):
+    _wait_until(lambda: not worker._refreshing)
+
+
+@pytest.fixture
+def method():
+    return BlockingMethod()
+
+
+def _worker(method, cache=None):
+    return SapWorker({'get_order_details': method}, result_cache=cache)
+
+
+def test_concurrent_identical_requests_share_one_fetch(method):
+    worker = _worker(method)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(worker.handle(dict(REQUEST))['result']))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    _wait_until(lambda: worker.flights.coalesced == 4)
+    method.released.set()
+    for thread in threads:
+        thread.join()
+
+    assert method.calls == 1
+    assert results == [{'success': True, 'order_number': '1000001', 'call': 1}] * 5
+    assert worker.coalesced_counts == {'get_order_details': 4}
+
+
+def test_stale_hit_triggers_one_background_refresh(method):
+    clock = FakeClock()
+    worker = _worker(method, ResultCache(ttl=5, stale=30, clock=clock))
+    method.released.set()
+    assert worker.handle(dict(REQUEST))['result']['call'] == 1
+
+    method.released.clear()
+    clock.now += 6
+    # 刷新进行中的请求都立即得到旧结果
+    for _ in range(3):
+        assert worker.handle(dict(REQUEST))['result']['call'] == 1
+    method.released.set()
+    _join_refresh(worker)
+
+    assert method.calls == 2
+    assert worker.refresh_counts == {'success': 1}
+    assert worker.handle(dict(REQUEST))['result']['call'] == 2
+    assert worker.result_cache.stats()['stale_hits'] == 3
+
+
+def test_failed_refresh_keeps_old_result(method):
+    clock = FakeClock()
+    worker = _worker(method, ResultCache(ttl=5, stale=30, clock=clock))
+    method.released.set()
+    worker.handle(dict(REQUEST))
+
+    method.succeed = False
+    clock.now += 6
+    assert worker.handle(dict(REQUEST))['result']['call'] == 1
+    _join_refresh(worker)
+
+    assert worker.refresh_counts == {'error': 1}
+    assert worker.handle(dict(REQUEST))['result']['call'] == 1
+    # 超过可返回旧结果的时间后重新读取
+    clock.now += 30
+    assert worker.handle(dict(REQUEST))['result'] == {'success': False, 'error': 'SAP不可用'}
+
+
+def test_cache_bounded_by_bytes():
+    cache = ResultCache(ttl=5, sizeof=estimate_size, max_bytes=3000)
+    image = 'x' * 1000
+    for key in range(3):
+        cache.put(key, {'success': True, 'image': image})
+    cache.put('huge', {'success': True, 'image': image * 4})
+
+    stats = cache.stats()
+    assert (stats['entries'], stats['evictions']) == (2, 1)
+    assert stats['size_bytes'] <= 3000
+    assert cache.lookup(0)[0] == 'miss'
+    assert cache.lookup('huge')[0] == 'miss'
+
+
+def test_expired_entries_are_purged():
+    clock = FakeClock()
+    cache = ResultCache(ttl=5, stale=10, clock=clock)
+    for key in range(3):
+        cache.put(key, {'success': True})
+    clock.now += 16
+    cache.put('new', {'success': True})
+
+    stats = cache.stats()
+    assert (stats['entries'], stats['expired'], stats['evictions']) == (1, 3, 0)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""班次预热：预热过的工单第一次打印时工单数据和图片都来自缓存，不访问SAP"""
+
+import pytest
+
+import image_cache
+import sap_cache
+from conftest import order_number, table_calls
+from image_cache import RenderCache
+from sap_cache import MasterDataCache, WarmOrderCache
+from sap_common import ConnectionPool
+from sap_fake import FakeConnection
+from sap_rfc_extended import get_work_order_report
+from shift_prewarm import prewarm_shift
+
+@pytest.fixture
+def caches(tmp_path, monkeypatch):
+    """在临时目录中启用主数据缓存、预热数据缓存和渲染缓存"""
+    monkeypatch.delenv('SAP_CACHE_DISABLED')
+    monkeypatch.delenv('SAP_RENDER_CACHE_DISABLED')
+    path = str(tmp_path / 'master_data.sqlite3')
+    monkeypatch.setattr(sap_cache, '_master_data_cache', MasterDataCache(path))
+    monkeypatch.setattr(sap_cache, '_warm_order_cache', WarmOrderCache(path))
+    render_cache = RenderCache(str(tmp_path / 'render'))
+    monkeypatch.setattr(image_cache, '_render_cache', render_cache)
+    return render_cache
+
+
+@pytest.fixture
+def shift_pool(fake_fixture):
+    """预热使用的连接池；huge 工单（渲染需要数十秒）改到班次之后，预热只处理 small 和 medium"""
+    huge = order_number('huge').zfill(12)
+    for row in fake_fixture.tables['AFKO']['rows']:
+        if row['AUFNR'] == huge:
+            row['GSTRP'] = '20250301'
+    fake_fixture.tables['AFKO'].pop('indexes', None)
+    pool = ConnectionPool(lambda: FakeConnection(fake_fixture))
+    yield pool
+    pool.close()
+
+
+def test_warmed_order_prints_without_rfc_calls(caches, shift_pool, fake_conn):
+    report = prewarm_shift('20250102', werks='1000', pool=shift_pool)
+    assert (report['success'], report['rendered'], report['failed']) == (True, 2, [])
+
+    result = get_work_order_report(order_number('medium'), fake_conn)
+    assert result['success'] and result['image']
+    assert fake_conn.calls == 0
+    assert caches.stats()['hits'] == 1
+
+
+def test_invalidated_order_is_read_from_sap(caches, shift_pool, fake_conn):
+    prewarm_shift('20250102', werks='1000', pool=shift_pool)
+    assert sap_cache.get_warm_order_cache().invalidate(order_number('small')) == 1
+
+    assert get_work_order_report(order_number('small'), fake_conn)['success']
+    # 物料描述等主数据仍由主数据缓存提供，工单数据重新从SAP读取
+    assert table_calls(fake_conn, 'AUFK') == table_calls(fake_conn, 'AFVC') == 1
+
+
+def test_expired_warm_data_is_not_used(tmp_path, caches, shift_pool, fake_conn, monkeypatch):
+    monkeypatch.setattr(sap_cache, '_warm_order_cache', WarmOrderCache(str(tmp_path / 'warm.sqlite3'), ttl=-1))
+    prewarm_shift('20250102', werks='1000', pool=shift_pool)
+
+    assert get_work_order_report(order_number('small'), fake_conn)['success']
+    # 物料描述等主数据仍由主数据缓存提供，工单数据重新从SAP读取
+    assert table_calls(fake_conn, 'AUFK') == table_calls(fake_conn, 'AFVC') == 1
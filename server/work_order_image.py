@@ -1,194 +1,679 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os
+import sys
+import json
+import time
 import base64
+import hashlib
 import io
+import zlib
+import bisect
+import struct
+import tempfile
+import threading
 from PIL import Image, ImageDraw, ImageFont
 from barcode import Code128
-from barcode.writer import ImageWriter
+from image_cache import RenderCache, get_render_cache
+from sap_metrics import phase
 
-def generate_work_order_image(order_data):
-    """生成工序报工单图片并返回base64编码"""
-    # 动态计算图片高度
-    base_height = 400
-    operation_height = 220
-    mold_height = 40
-    total_height = base_height + len(order_data.get("工序与员工分配", [])) * operation_height + len(order_data.get("模具信息", [])) * mold_height
-    width = 800
-    
-    image = Image.new("RGB", (width, total_height), "white")
-    draw = ImageDraw.Draw(image)
-    
-    # 加载项目内的中文字体
-    import os
+# 渲染器版本：修改版面、字体或条形码绘制方式时递增，使渲染缓存中的旧图片失效
+RENDERER_VERSION = "2"
+
+# 报工单图片宽度
+WIDTH = 800
+# 固定抬头（公司名称、分隔线、标题）所占高度
+HEADER_HEIGHT = 90
+# 最后一道工序下方的留白
+BOTTOM_MARGIN = 20
+# 高度不超过该值的报工单一次绘制完整画布；更高的按 STRIP_HEIGHT 行的水平条带逐条绘制和编码
+MAX_CANVAS_HEIGHT = int(os.getenv("SAP_IMAGE_MAX_CANVAS_HEIGHT", "4000"))
+STRIP_HEIGHT = 512
+# 按优先级查找的项目内中文字体
+FONT_FILES = ["simhei.ttf", "msyh.ttc", "NotoSansCJK-Regular.ttc"]
+
+# 条形码区域大小（像素）
+BARCODE_WIDTH = 400
+BARCODE_HEIGHT = 60
+# Code128 两侧静区宽度（模块数）
+BARCODE_QUIET_MODULES = 10
+
+
+def code128_modules(text):
+    """Code128 编码后的模块串（"1" 为条、"0" 为空），与 python-barcode 的编码完全相同"""
+    return Code128(text).build()[0]
+
+
+def draw_code128_modules(draw, modules, x, y, width=BARCODE_WIDTH, height=BARCODE_HEIGHT):
+    """在 (x, y) 开始的 width×height 区域内居中绘制已编码的条形码，每个模块取整数像素宽度
+
+    编码过长、模块取1像素也放不下时（连同静区），按比例压缩到区域宽度内，条纹宽度不再完全均匀，但不会超出区域。
+    """
+    total = len(modules) + 2 * BARCODE_QUIET_MODULES
+    module_px = width // total
+    if module_px >= 1:
+        left = x + (width - len(modules) * module_px) // 2
+        edges = [left + i * module_px for i in range(len(modules) + 1)]
+    else:
+        edges = [x + (BARCODE_QUIET_MODULES + i) * width // total for i in range(len(modules) + 1)]
+    bar_start = None
+    for i, bit in enumerate(modules + "0"):
+        if bit == "1":
+            if bar_start is None:
+                bar_start = i
+        elif bar_start is not None:
+            draw.rectangle([edges[bar_start], y, max(edges[bar_start], edges[i] - 1), y + height - 1], fill="black")
+            bar_start = None
+
+
+def draw_code128(draw, text, x, y, width=BARCODE_WIDTH, height=BARCODE_HEIGHT):
+    """在 (x, y) 开始的 width×height 区域内居中绘制 Code128 条形码
+
+    编码与 python-barcode 的 Code128 完全相同，只是不再经过 ImageWriter 生成PNG、解码再缩放：
+    每个模块取整数像素宽度，条纹边缘清晰。
+    """
+    draw_code128_modules(draw, code128_modules(text), x, y, width, height)
+
+# 输出格式：rgb 为原来的RGB PNG；gray 为4级灰度调色板PNG（每像素2位）；1bit 为黑白PNG（每像素1位）
+IMAGE_FORMATS = ("rgb", "gray", "1bit")
+DEFAULT_IMAGE_FORMAT = os.getenv("SAP_IMAGE_FORMAT", "rgb")
+# PNG zlib 压缩级别（0-9），越大文件越小、编码越慢
+DEFAULT_COMPRESS_LEVEL = int(os.getenv("SAP_IMAGE_COMPRESS_LEVEL", "6"))
+# gray 输出：灰度值映射到4个调色板索引（黑、深灰、浅灰、白）
+GRAY_LEVEL_LUT = [min(3, (v + 42) // 85) for v in range(256)]
+GRAY_PALETTE = [0, 0, 0, 85, 85, 85, 170, 170, 170, 255, 255, 255]
+# 1bit 输出时灰度低于该值的像素视为黑色（保留 #dddddd 的分隔线）
+ONE_BIT_THRESHOLD = 224
+# 按内容哈希保存的图片目录（delivery=file 时使用）
+DEFAULT_IMAGE_DIR = os.getenv(
+    "SAP_IMAGE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "images")
+)
+# 图片目录总大小上限（字节），超过时按最近使用时间淘汰
+MAX_IMAGE_DIR_BYTES = int(os.getenv("SAP_IMAGE_DIR_MAX_BYTES", str(200 * 1024 * 1024)))
+
+
+def _convert_for_format(image, image_format):
+    """把RGB图片转换为输出格式对应的模式（rgb: RGB，gray: 4色调色板，1bit: 黑白）"""
+    if image_format == "gray":
+        # 报工单只有黑白和抗锯齿的灰色边缘，4级灰度足够
+        levels = image.convert("L").point(GRAY_LEVEL_LUT)
+        image = Image.frombytes("P", levels.size, levels.tobytes())
+        image.putpalette(GRAY_PALETTE)
+    elif image_format == "1bit":
+        image = image.convert("L").point(lambda v: 255 if v >= ONE_BIT_THRESHOLD else 0, mode="1")
+    return image
+
+
+def _resolve_encoding(image_format, compress_level):
+    image_format = image_format or DEFAULT_IMAGE_FORMAT
+    compress_level = DEFAULT_COMPRESS_LEVEL if compress_level is None else int(compress_level)
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"不支持的图片格式: {image_format}")
+    return image_format, compress_level
+
+
+def encode_png(image, image_format=None, compress_level=None):
+    """把RGB报工单图片编码为指定格式的PNG字节"""
+    image_format, compress_level = _resolve_encoding(image_format, compress_level)
+    options = {"format": "PNG", "compress_level": compress_level}
+    if image_format == "gray":
+        options["bits"] = 2
+
+    buffer = io.BytesIO()
+    _convert_for_format(image, image_format).save(buffer, **options)
+    return buffer.getvalue()
+
+
+def _png_chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def encode_png_strips(strips, width, height, image_format=None, compress_level=None):
+    """把依次产生的RGB水平条带编码为一张PNG，同一时间只有一个条带在内存中
+
+    每行使用 None 过滤，压缩数据边生成边写入 IDAT 块。
+    """
+    image_format, compress_level = _resolve_encoding(image_format, compress_level)
+    if image_format == "gray":
+        header, raw_mode, row_bytes = (2, 3), ("raw", "P;2"), (width + 3) // 4
+    elif image_format == "1bit":
+        header, raw_mode, row_bytes = (1, 0), ("raw", "1"), (width + 7) // 8
+    else:
+        header, raw_mode, row_bytes = (8, 2), ("raw", "RGB"), width * 3
+
+    out = io.BytesIO()
+    out.write(b"\x89PNG\r\n\x1a\n")
+    out.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, header[0], header[1], 0, 0, 0)))
+    if image_format == "gray":
+        out.write(_png_chunk(b"PLTE", bytes(GRAY_PALETTE)))
+    compressor = zlib.compressobj(compress_level)
+    for strip in strips:
+        data = _convert_for_format(strip, image_format).tobytes(*raw_mode)
+        rows = b"".join(b"\x00" + data[i:i + row_bytes] for i in range(0, len(data), row_bytes))
+        compressed = compressor.compress(rows)
+        if compressed:
+            out.write(_png_chunk(b"IDAT", compressed))
+    out.write(_png_chunk(b"IDAT", compressor.flush()))
+    out.write(_png_chunk(b"IEND", b""))
+    return out.getvalue()
+
+
+_image_store = None
+_image_store_lock = threading.Lock()
+
+
+def get_image_store():
+    """delivery=file 使用的图片目录，与渲染缓存一样由 RenderCache 管理总大小和淘汰"""
+    global _image_store
+    with _image_store_lock:
+        if _image_store is None:
+            _image_store = RenderCache(DEFAULT_IMAGE_DIR, MAX_IMAGE_DIR_BYTES)
+        return _image_store
+
+
+def save_png(png, store=None):
+    """按内容哈希保存PNG，返回 (文件路径, sha256)；内容相同的图片只写一次
+
+    目录总大小超过 SAP_IMAGE_DIR_MAX_BYTES 时删除最久未使用的图片，调用方应在收到路径后尽快读取文件。
+    """
+    store = store or get_image_store()
+    digest = hashlib.sha256(png).hexdigest()
+    path = store.path(digest)
+    try:
+        # 已保存过的图片记为最近使用，不会先于其他图片被淘汰
+        os.utime(path)
+    except OSError:
+        store.put(digest, png)
+        if not store.contains(digest):
+            raise OSError(f"保存图片失败: {path}")
+    return path, digest
+
+
+def _load_fonts():
+    """加载项目内的中文字体，返回 (标题, 小标题, 正文) 字体"""
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    font_paths = [
-        os.path.join(script_dir, "fonts", "simhei.ttf"),
-        os.path.join(script_dir, "fonts", "msyh.ttc"),
-        os.path.join(script_dir, "fonts", "NotoSansCJK-Regular.ttc")
-    ]
-    
-    font_title = None
-    font_subtitle = None
-    font_content = None
+    font_paths = [os.path.join(script_dir, "fonts", name) for name in FONT_FILES]
     
     for font_path in font_paths:
         try:
             if os.path.exists(font_path):
-                font_title = ImageFont.truetype(font_path, 22)
-                font_subtitle = ImageFont.truetype(font_path, 16)
-                font_content = ImageFont.truetype(font_path, 14)
-                break
+                return (ImageFont.truetype(font_path, 22),
+                        ImageFont.truetype(font_path, 16),
+                        ImageFont.truetype(font_path, 14))
         except:
             continue
     
     # 如果没有找到字体文件，使用默认字体
-    if not font_title:
-        font_title = ImageFont.load_default()
-        font_subtitle = ImageFont.load_default()
-        font_content = ImageFont.load_default()
-    
-    # 绘制标题
-    draw.text((width // 2, 30), "和泰机电股份有限公司", fill="black", font=font_title, anchor="mm")
-    draw.line([(50, 50), (width - 50, 50)], fill="black", width=2)
-    draw.text((width // 2, 70), "工序报工单", fill="black", font=font_title, anchor="mm")
-    
-    # 绘制基础信息
-    y = 100
-    基础信息 = order_data.get("基础信息", {})
-    draw.text((50, y), f"生产订单: {基础信息.get('工单号', '')}", fill="black", font=font_content)
-    draw.text((400, y), f"订单类型: {基础信息.get('订单类型', '')}", fill="black", font=font_content)
-    y += 25
-    draw.text((50, y), f"销售订单: {基础信息.get('销售订单', '')} 行项目: {基础信息.get('销售订单行项目', '')}", fill="black", font=font_content)
-    draw.text((400, y), f"客户名称: {基础信息.get('客户名称', '')}", fill="black", font=font_content)
-    y += 25
-    draw.text((50, y), f"工厂: {基础信息.get('工厂', '')}", fill="black", font=font_content)
-    draw.text((400, y), f"创建人: {基础信息.get('创建人', '')} 日期: {基础信息.get('创建日期', '')}", fill="black", font=font_content)
-    y += 25
-    
-    # 绘制生产信息
-    draw.line([(50, y + 5), (width - 50, y + 5)], fill="black", width=1)
-    y += 15
-    draw.text((50, y), "生产信息:", fill="black", font=font_subtitle)
-    y += 20
-    生产信息 = order_data.get("生产信息", {})
-    draw.text((70, y), f"物料编码: {生产信息.get('物料号', '')}", fill="black", font=font_content)
-    draw.text((400, y), f"图号: {生产信息.get('图号', '')}", fill="black", font=font_content)
-    y += 20
-    draw.text((70, y), f"物料描述: {生产信息.get('物料描述', '')}", fill="black", font=font_content)
-    y += 20
-    draw.text((70, y), f"生产数量: {生产信息.get('生产数量', '')} {生产信息.get('单位', '')}", fill="black", font=font_content)
-    draw.text((400, y), f"库存地点: {生产信息.get('库存地点', '')} {生产信息.get('库存地点描述', '')}", fill="black", font=font_content)
-    y += 20
-    draw.text((70, y), f"开始: {生产信息.get('开始日期', '')}", fill="black", font=font_content)
-    draw.text((400, y), f"MRP控制者: {生产信息.get('MRP控制者', '')}", fill="black", font=font_content)
-    y += 20
-    draw.text((70, y), f"完成: {生产信息.get('结束日期', '')}", fill="black", font=font_content)
-    draw.text((400, y), f"生产管理员: {生产信息.get('生产管理员', '')}", fill="black", font=font_content)
-    y += 20
-    
-    # 绘制模具信息
-    模具信息 = order_data.get("模具信息", [])
-    if 模具信息:
-        draw.line([(50, y + 5), (width - 50, y + 5)], fill="black", width=1)
+    return ImageFont.load_default(), ImageFont.load_default(), ImageFont.load_default()
+
+
+class WorkOrderLayout:
+    """版面计算结果：按纵坐标排列的绘制命令、精确高度以及可以分页的位置
+
+    每条命令为 (上边界, 下边界, 类型, 参数)。下边界是保守估计，只用于选出与某个区域相交的命令，
+    超出区域的部分在绘制时自然被裁掉。
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.height = 0
+        # 文本行、分隔线、条形码的起始纵坐标：在这些位置分页不会切断内容
+        self.row_starts = []
+        # 每道工序的起始纵坐标（分隔线处），分页时优先使用
+        self.block_starts = []
+        self._tops = []
+
+    def text(self, xy, text, font, anchor=None):
+        x, y = xy
+        size = getattr(font, "size", 11)
+        if anchor:
+            self.commands.append((y - size, y + size, "text", (xy, text, font, anchor)))
+        else:
+            self.commands.append((y, y + 2 * size, "text", (xy, text, font, anchor)))
+            self.row_starts.append(y)
+
+    def line(self, y, x1, x2, fill="black", width=1):
+        self.commands.append((y - width, y + width, "line", ([(x1, y), (x2, y)], fill, width)))
+        self.row_starts.append(y)
+
+    def barcode(self, modules, x, y):
+        self.commands.append((y, y + BARCODE_HEIGHT, "barcode", (modules, x, y)))
+        self.row_starts.append(y)
+
+    def tile(self, image, y):
+        self.commands.append((y, y + image.height, "tile", (image, y)))
+
+    def finish(self, height):
+        self.height = height
+        self.commands.sort(key=lambda command: command[0])
+        self._tops = [command[0] for command in self.commands]
+        self._max_span = max((command[1] - command[0] for command in self.commands), default=0)
+        self.row_starts = sorted(set(self.row_starts))
+        return self
+
+    def commands_between(self, top, bottom):
+        """与 [top, bottom) 相交的命令"""
+        first = bisect.bisect_left(self._tops, top - self._max_span)
+        last = bisect.bisect_left(self._tops, bottom)
+        return [command for command in self.commands[first:last] if command[1] > top]
+
+    def page_breaks(self, page_height):
+        """返回每一页的起始纵坐标（第一个为0）
+
+        每页尽量在最靠下的工序起始处分页（不早于半页），其次在最靠下的行首分页，
+        单行内容超过一页时才直接在页面底部切开。
+        """
+        breaks = [0]
+        top = 0
+        while self.height - top > page_height:
+            limit = top + page_height
+            i = bisect.bisect_right(self.block_starts, limit) - 1
+            if i >= 0 and self.block_starts[i] > top + page_height // 2:
+                cut = self.block_starts[i]
+            else:
+                i = bisect.bisect_right(self.row_starts, limit) - 1
+                cut = self.row_starts[i] if i >= 0 and self.row_starts[i] > top else limit
+            breaks.append(cut)
+            top = cut
+        return breaks
+
+
+class WorkOrderRenderer:
+    """报工单渲染器：字体和固定抬头只在创建时加载/绘制一次，之后每次渲染直接复用
+
+    渲染分两步：layout 计算所有内容的位置和精确高度（不分配画布），draw_region 只绘制指定的纵向区域。
+    较高的报工单按水平条带逐条绘制、逐条编码，内存占用不随工序数量增长。
+    """
+
+    def __init__(self):
+        self.font_title, self.font_subtitle, self.font_content = _load_fonts()
+        self.header_tile = self._render_header()
+
+    def _render_header(self):
+        tile = Image.new("RGB", (WIDTH, HEADER_HEIGHT), "white")
+        draw = ImageDraw.Draw(tile)
+        draw.text((WIDTH // 2, 30), "和泰机电股份有限公司", fill="black", font=self.font_title, anchor="mm")
+        draw.line([(50, 50), (WIDTH - 50, 50)], fill="black", width=2)
+        draw.text((WIDTH // 2, 70), "工序报工单", fill="black", font=self.font_title, anchor="mm")
+        return tile
+
+    def render(self, order_data, image_format=None, compress_level=None):
+        """渲染报工单并返回base64编码的PNG"""
+        png = self.render_png(order_data, image_format, compress_level)
+        return base64.b64encode(png).decode('utf-8')
+
+    def render_png(self, order_data, image_format=None, compress_level=None):
+        """渲染报工单并返回PNG字节；高度超过 MAX_CANVAS_HEIGHT 时按条带绘制和编码"""
+        with phase("render.layout"):
+            layout = self.layout(order_data)
+        if layout.height <= MAX_CANVAS_HEIGHT:
+            with phase("render.draw"):
+                image = self.draw_region(layout, 0, layout.height)
+            with phase("render.encode"):
+                return encode_png(image, image_format, compress_level)
+        strips = (self.draw_region(layout, top, min(top + STRIP_HEIGHT, layout.height))
+                  for top in range(0, layout.height, STRIP_HEIGHT))
+        with phase("render.strips"):
+            return encode_png_strips(strips, WIDTH, layout.height, image_format, compress_level)
+
+    def render_image(self, order_data):
+        """按工单数据绘制报工单，返回完整高度的RGB图片"""
+        layout = self.layout(order_data)
+        return self.draw_region(layout, 0, layout.height)
+
+    def iter_pages(self, order_data, page_height):
+        """按分页位置逐页绘制，每页为不超过 page_height 的RGB图片"""
+        layout = self.layout(order_data)
+        breaks = layout.page_breaks(page_height) + [layout.height]
+        for top, bottom in zip(breaks, breaks[1:]):
+            yield self.draw_region(layout, top, bottom)
+
+    def draw_region(self, layout, top, bottom):
+        """绘制版面中 [top, bottom) 的部分"""
+        image = Image.new("RGB", (WIDTH, bottom - top), "white")
+        draw = ImageDraw.Draw(image)
+        for _, _, kind, args in layout.commands_between(top, bottom):
+            if kind == "text":
+                (x, y), text, font, anchor = args
+                draw.text((x, y - top), text, fill="black", font=font, anchor=anchor)
+            elif kind == "line":
+                points, fill, width = args
+                draw.line([(x, y - top) for x, y in points], fill=fill, width=width)
+            elif kind == "barcode":
+                modules, x, y = args
+                draw_code128_modules(draw, modules, x, y - top)
+            else:
+                tile, y = args
+                image.paste(tile, (0, y - top))
+        return image
+
+    def layout(self, order_data):
+        """计算报工单版面，返回 WorkOrderLayout（高度按实际内容计算，不再预估）"""
+        width = WIDTH
+        font_subtitle = self.font_subtitle
+        font_content = self.font_content
+        layout = WorkOrderLayout()
+        
+        # 固定抬头
+        layout.tile(self.header_tile, 0)
+        
+        # 绘制基础信息
+        y = 100
+        基础信息 = order_data.get("基础信息", {})
+        layout.text((50, y), f"生产订单: {基础信息.get('工单号', '')}", font_content)
+        layout.text((400, y), f"订单类型: {基础信息.get('订单类型', '')}", font_content)
+        y += 25
+        layout.text((50, y), f"销售订单: {基础信息.get('销售订单', '')} 行项目: {基础信息.get('销售订单行项目', '')}", font_content)
+        layout.text((400, y), f"客户名称: {基础信息.get('客户名称', '')}", font_content)
+        y += 25
+        layout.text((50, y), f"工厂: {基础信息.get('工厂', '')}", font_content)
+        layout.text((400, y), f"创建人: {基础信息.get('创建人', '')} 日期: {基础信息.get('创建日期', '')}", font_content)
+        y += 25
+        
+        # 绘制生产信息
+        layout.line(y + 5, 50, width - 50)
         y += 15
-        draw.text((50, y), "模具信息:", fill="black", font=font_subtitle)
+        layout.text((50, y), "生产信息:", font_subtitle)
         y += 20
-        for mold in 模具信息:
-            draw.text((70, y), f"物料号: {mold.get('物料号', '')}，描述: {mold.get('描述', '')}，数量: {mold.get('数量', '')} {mold.get('单位', '')}", fill="black", font=font_content)
-            y += 20
-    
-    # 绘制工序信息
-    draw.line([(50, y + 5), (width - 50, y + 5)], fill="black", width=1)
-    y += 15
-    draw.text((50, y), "工序信息:", fill="black", font=font_subtitle)
-    y += 25
-    
-    工序列表 = order_data.get("工序与员工分配", [])
-    for idx, 工序 in enumerate(工序列表, 1):
-        draw.line([(70, y), (width - 70, y)], fill="#dddddd", width=1)
-        y += 15
-        
-        draw.text((70, y), f"工序 {idx}: {工序.get('工序号', '')} {工序.get('工序描述', '')}", fill="black", font=font_subtitle)
+        生产信息 = order_data.get("生产信息", {})
+        layout.text((70, y), f"物料编码: {生产信息.get('物料号', '')}", font_content)
+        layout.text((400, y), f"图号: {生产信息.get('图号', '')}", font_content)
         y += 20
-        draw.text((90, y), f"控制码: {工序.get('控制码', '')}", fill="black", font=font_content)
-        draw.text((300, y), f"工作中心: {工序.get('工作中心编号', '')}（{工序.get('工作中心描述', '')}）", fill="black", font=font_content)
+        layout.text((70, y), f"物料描述: {生产信息.get('物料描述', '')}", font_content)
         y += 20
-        
-        # 工时数据
-        工时数据 = 工序.get('工时数据', {})
-        draw.text((90, y), "工时数据:", fill="black", font=font_content)
-        y += 18
-        draw.text((110, y), f"准备工时: {工时数据.get('准备工时', '')}", fill="black", font=font_content)
-        draw.text((350, y), f"人工工时: {工时数据.get('人工工时', '')}", fill="black", font=font_content)
-        y += 18
-        draw.text((110, y), f"机器工时: {工时数据.get('机器工时', '')}", fill="black", font=font_content)
-        draw.text((350, y), f"加工工时: {工时数据.get('加工工时', '')}", fill="black", font=font_content)
+        layout.text((70, y), f"生产数量: {生产信息.get('生产数量', '')} {生产信息.get('单位', '')}", font_content)
+        layout.text((400, y), f"库存地点: {生产信息.get('库存地点', '')} {生产信息.get('库存地点描述', '')}", font_content)
+        y += 20
+        layout.text((70, y), f"开始: {生产信息.get('开始日期', '')}", font_content)
+        layout.text((400, y), f"MRP控制者: {生产信息.get('MRP控制者', '')}", font_content)
+        y += 20
+        layout.text((70, y), f"完成: {生产信息.get('结束日期', '')}", font_content)
+        layout.text((400, y), f"生产管理员: {生产信息.get('生产管理员', '')}", font_content)
         y += 20
         
-        # 下一道工序
-        下一道工序 = 工序.get("下一道工序")
-        if 下一道工序:
-            draw.text((90, y), f"下一道工序: {下一道工序.get('工序号', '')} {下一道工序.get('工序描述', '')}", fill="black", font=font_content)
-            draw.text((90, y + 18), f"下道工作中心: {下一道工序.get('工作中心编号', '')}（{下一道工序.get('工作中心描述', '')}）", fill="black", font=font_content)
-            y += 36
-        else:
-            draw.text((90, y), "下一道工序: 无（最终工序）", fill="black", font=font_content)
-            y += 18
+        # 绘制模具信息
+        模具信息 = order_data.get("模具信息", [])
+        if 模具信息:
+            layout.line(y + 5, 50, width - 50)
+            y += 15
+            layout.text((50, y), "模具信息:", font_subtitle)
+            y += 20
+            for mold in 模具信息:
+                layout.text((70, y), f"物料号: {mold.get('物料号', '')}，描述: {mold.get('描述', '')}，数量: {mold.get('数量', '')} {mold.get('单位', '')}", font_content)
+                y += 20
+        
+        # 绘制工序信息
+        layout.line(y + 5, 50, width - 50)
+        y += 15
+        layout.text((50, y), "工序信息:", font_subtitle)
+        y += 25
         
-        # 员工分配
-        draw.text((90, y), "员工分配:", fill="black", font=font_content)
-        y += 18
-        员工分配 = 工序.get("员工分配", [])
-        if isinstance(员工分配, list) and 员工分配:
-            for emp in 员工分配:
-                draw.text((110, y), f"人员号: {emp.get('PERNR', '')}，姓名: {emp.get('PERNM', '')}，分配数量: {emp.get('ASENG', '')}", fill="black", font=font_content)
+        工序列表 = order_data.get("工序与员工分配", [])
+        for idx, 工序 in enumerate(工序列表, 1):
+            layout.block_starts.append(y)
+            layout.line(y, 70, width - 70, fill="#dddddd")
+            y += 15
+            
+            layout.text((70, y), f"工序 {idx}: {工序.get('工序号', '')} {工序.get('工序描述', '')}", font_subtitle)
+            y += 20
+            layout.text((90, y), f"控制码: {工序.get('控制码', '')}", font_content)
+            layout.text((300, y), f"工作中心: {工序.get('工作中心编号', '')}（{工序.get('工作中心描述', '')}）", font_content)
+            y += 20
+            
+            # 工时数据
+            工时数据 = 工序.get('工时数据', {})
+            layout.text((90, y), "工时数据:", font_content)
+            y += 18
+            layout.text((110, y), f"准备工时: {工时数据.get('准备工时', '')}", font_content)
+            layout.text((350, y), f"人工工时: {工时数据.get('人工工时', '')}", font_content)
+            y += 18
+            layout.text((110, y), f"机器工时: {工时数据.get('机器工时', '')}", font_content)
+            layout.text((350, y), f"加工工时: {工时数据.get('加工工时', '')}", font_content)
+            y += 20
+            
+            # 下一道工序
+            下一道工序 = 工序.get("下一道工序")
+            if 下一道工序:
+                layout.text((90, y), f"下一道工序: {下一道工序.get('工序号', '')} {下一道工序.get('工序描述', '')}", font_content)
+                layout.text((90, y + 18), f"下道工作中心: {下一道工序.get('工作中心编号', '')}（{下一道工序.get('工作中心描述', '')}）", font_content)
+                y += 36
+            else:
+                layout.text((90, y), "下一道工序: 无（最终工序）", font_content)
                 y += 18
-        else:
-            draw.text((110, y), "无员工分配", fill="black", font=font_content)
+            
+            # 员工分配
+            layout.text((90, y), "员工分配:", font_content)
             y += 18
-        
-        # 生成条形码
-        工单号 = 基础信息.get('工单号', '').replace('000000', '')
-        工序号 = 工序.get('工序号', '').zfill(4)
-        
-        # 获取第一个员工的人员号
-        员工分配 = 工序.get("员工分配", [])
-        人员号 = ""
-        if isinstance(员工分配, list) and 员工分配:
-            人员号 = 员工分配[0].get('PERNR', '')
-        
-        barcode_text = f"{工单号}{人员号}{工序号}"
-        
-        try:
-            # 生成条形码图片
-            code = Code128(barcode_text, writer=ImageWriter())
-            barcode_buffer = io.BytesIO()
-            code.write(barcode_buffer, options={'write_text': False, 'module_height': 15, 'module_width': 0.4})
-            barcode_buffer.seek(0)
-            barcode_img = Image.open(barcode_buffer)
+            员工分配 = 工序.get("员工分配", [])
+            if isinstance(员工分配, list) and 员工分配:
+                for emp in 员工分配:
+                    layout.text((110, y), f"人员号: {emp.get('PERNR', '')}，姓名: {emp.get('PERNM', '')}，分配数量: {emp.get('ASENG', '')}", font_content)
+                    y += 18
+            else:
+                layout.text((110, y), "无员工分配", font_content)
+                y += 18
             
-            # 设置条形码大小
-            barcode_width = 400
-            barcode_height = 60
-            barcode_img = barcode_img.resize((barcode_width, barcode_height))
+            # 生成条形码
+            工单号 = 基础信息.get('工单号', '').replace('000000', '')
+            工序号 = 工序.get('工序号', '').zfill(4)
             
-            # 居中显示条形码
-            barcode_x = (width - barcode_width) // 2
-            image.paste(barcode_img, (barcode_x, y))
+            # 获取第一个员工的人员号
+            员工分配 = 工序.get("员工分配", [])
+            人员号 = ""
+            if isinstance(员工分配, list) and 员工分配:
+                人员号 = 员工分配[0].get('PERNR', '')
             
-            y += barcode_height + 10
-        except:
-            # 如果条形码生成失败，居中显示文本
-            draw.text((width // 2, y), f"#{barcode_text}#", fill="black", font=font_content, anchor="mm")
-            y += 25
+            barcode_text = f"{工单号}{人员号}{工序号}"
+            
+            try:
+                # 按整数像素的模块宽度直接在画布上绘制条形码
+                layout.barcode(code128_modules(barcode_text), (width - BARCODE_WIDTH) // 2, y)
+                
+                y += BARCODE_HEIGHT + 10
+            except:
+                # 如果条形码生成失败，居中显示文本
+                layout.text((width // 2, y), f"#{barcode_text}#", font_content, anchor="mm")
+                y += 25
+            
+            y += 10
         
-        y += 10
-    
-    # 转换为base64
-    buffer = io.BytesIO()
-    image.save(buffer, format='PNG')
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    
-    return image_base64
\ No newline at end of file
+        return layout.finish(y + BOTTOM_MARGIN)
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    """进程内共享的渲染器，第一次调用时创建（并发的第一次调用只加载一次字体）"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = WorkOrderRenderer()
+        return _renderer
+
+
+def generate_work_order_image(order_data, image_format=None, compress_level=None):
+    """生成工序报工单图片并返回base64编码"""
+    return base64.b64encode(generate_work_order_png(order_data, image_format, compress_level)).decode('utf-8')
+
+
+def render_cache_key(order_data, image_format=None, compress_level=None):
+    """渲染缓存键：规范化（键排序）后的工单数据 + 渲染器版本 + 输出格式的SHA-256"""
+    image_format, compress_level = _resolve_encoding(image_format, compress_level)
+    normalized = json.dumps(order_data, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(f"{RENDERER_VERSION}|{image_format}|{compress_level}|".encode("utf-8"))
+    digest.update(normalized.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def generate_work_order_png(order_data, image_format=None, compress_level=None):
+    """生成工序报工单图片并返回PNG字节（不做base64编码）
+
+    工单数据与输出格式都未变化时直接返回渲染缓存中的图片（SAP_RENDER_CACHE_DISABLED=1 关闭）。
+    """
+    cache = get_render_cache()
+    if cache is None:
+        return get_renderer().render_png(order_data, image_format, compress_level)
+
+    with phase("render.cache_lookup"):
+        key = render_cache_key(order_data, image_format, compress_level)
+        png = cache.get(key)
+    if png is None:
+        png = get_renderer().render_png(order_data, image_format, compress_level)
+        cache.put(key, png)
+    return png
+
+
+def sample_order_data(operations=10, employees=2):
+    """构造用于基准测试的工单数据，结构与 get_production_order_data 的返回值相同"""
+    工序列表 = []
+    for i in range(operations):
+        工序列表.append({
+            "工序号": str((i + 1) * 10).zfill(4),
+            "工序描述": f"工序{i + 1}",
+            "控制码": "PP01",
+            "工作中心编号": f"WC{i % 5}",
+            "工作中心描述": "数控车床",
+            "工时数据": {"准备工时": "0.750 H", "人工工时": "1.000 H", "机器工时": "", "加工工时": "1.500 MIN"},
+            "下一道工序": None,
+            "员工分配": [{"PERNR": str(10000 + j), "PERNM": f"员工{j}", "ASENG": "5"} for j in range(employees)]
+        })
+    for i in range(operations - 1):
+        下一道工序 = 工序列表[i + 1]
+        工序列表[i]["下一道工序"] = {key: 下一道工序[key] for key in ("工序号", "工序描述", "控制码", "工作中心编号", "工作中心描述")}
+    return {
+        "基础信息": {"工单号": "000001234567", "订单类型": "ZP01", "销售订单": "0010000001", "销售订单行项目": "000010",
+                 "工厂": "1000", "创建人": "PLANNER", "创建日期": "20250101", "客户名称": ""},
+        "生产信息": {"物料号": "000000000000200001", "物料描述": "电机端盖", "图号": "DWG-200001", "开始日期": "20250102",
+                 "结束日期": "20250105", "生产数量": "100.000", "单位": "EA", "库存地点": "", "库存地点描述": "",
+                 "MRP控制者": "001", "生产管理员": "002"},
+        "模具信息": [],
+        "工序与员工分配": 工序列表
+    }
+
+
+def _benchmark(operations, runs):
+    """冷启动（加载字体、绘制抬头）与复用渲染器的渲染耗时对比，单位毫秒"""
+    order_data = sample_order_data(operations)
+
+    started = time.perf_counter()
+    renderer = WorkOrderRenderer()
+    setup_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    renderer.render(order_data)
+    cold_ms = setup_ms + (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for _ in range(runs):
+        renderer.render(order_data)
+    warm_ms = (time.perf_counter() - started) * 1000 / runs
+
+    # 渲染缓存命中：计算键并读取文件，使用临时目录，不影响实际缓存
+    with tempfile.TemporaryDirectory() as directory:
+        cache = RenderCache(directory)
+        cache.put(render_cache_key(order_data), renderer.render_png(order_data))
+        started = time.perf_counter()
+        for _ in range(runs):
+            cache.get(render_cache_key(order_data))
+        cached_ms = (time.perf_counter() - started) * 1000 / runs
+
+    return {
+        'operations': operations,
+        'runs': runs,
+        'renderer_setup_ms': round(setup_ms, 2),
+        'cold_render_ms': round(cold_ms, 2),
+        'warm_render_ms': round(warm_ms, 2),
+        'cache_hit_ms': round(cached_ms, 2),
+    }
+
+
+def _benchmark_barcodes(operations):
+    """对比原 ImageWriter 方式（生成PNG、解码、缩放、粘贴）与直接绘制条形码的耗时，单位毫秒"""
+    from barcode.writer import ImageWriter
+
+    texts = [f"1234567{10000 + i}{str((i + 1) * 10).zfill(4)}" for i in range(operations)]
+    canvas = Image.new("RGB", (WIDTH, operations * 70), "white")
+
+    started = time.perf_counter()
+    for i, text in enumerate(texts):
+        code = Code128(text, writer=ImageWriter())
+        barcode_buffer = io.BytesIO()
+        code.write(barcode_buffer, options={'write_text': False, 'module_height': 15, 'module_width': 0.4})
+        barcode_buffer.seek(0)
+        barcode_img = Image.open(barcode_buffer).resize((BARCODE_WIDTH, BARCODE_HEIGHT))
+        canvas.paste(barcode_img, ((WIDTH - BARCODE_WIDTH) // 2, i * 70))
+    png_ms = (time.perf_counter() - started) * 1000
+
+    draw = ImageDraw.Draw(canvas)
+    started = time.perf_counter()
+    for i, text in enumerate(texts):
+        draw_code128(draw, text, (WIDTH - BARCODE_WIDTH) // 2, i * 70)
+    direct_ms = (time.perf_counter() - started) * 1000
+
+    return {
+        'operations': operations,
+        'imagewriter_png_ms': round(png_ms, 2),
+        'direct_draw_ms': round(direct_ms, 2),
+    }
+
+
+def _benchmark_long(operations, employees):
+    """超长工艺路线压力测试：对比按条带编码与一次绘制完整画布的耗时和进程峰值内存增量"""
+    import resource
+
+    renderer = get_renderer()
+    order_data = sample_order_data(operations, employees)
+
+    def peak_rss_mb():
+        # Linux 下 ru_maxrss 单位为KB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    started = time.perf_counter()
+    layout = renderer.layout(order_data)
+    layout_ms = (time.perf_counter() - started) * 1000
+
+    report = {
+        'operations': operations,
+        'employees_per_operation': employees,
+        'exact_height': layout.height,
+        'estimated_height_before': 400 + operations * 220,
+        'layout_ms': round(layout_ms, 2),
+    }
+    # 先测条带方式，避免完整画布抬高的峰值内存掩盖条带方式的实际占用
+    for name, encode in (
+        ('strips', lambda: renderer.render_png(order_data, "1bit")),
+        ('full_canvas', lambda: encode_png(renderer.draw_region(layout, 0, layout.height), "1bit")),
+    ):
+        rss_before = peak_rss_mb()
+        started = time.perf_counter()
+        png = encode()
+        report[name] = {
+            'ms': round((time.perf_counter() - started) * 1000, 1),
+            'png_bytes': len(png),
+            'peak_rss_growth_mb': round(peak_rss_mb() - rss_before, 1),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    # 基准测试：python work_order_image.py --bench [工序数] [次数]
+    #          python work_order_image.py --bench-barcode [工序数]
+    #          python work_order_image.py --bench-long [工序数] [每道工序员工数]
+    sys.stdout.reconfigure(encoding='utf-8')
+    if len(sys.argv) >= 2 and sys.argv[1] == '--bench':
+        operations = int(sys.argv[2]) if len(sys.argv) >= 3 else 10
+        runs = int(sys.argv[3]) if len(sys.argv) >= 4 else 10
+        print(json.dumps(_benchmark(operations, runs), ensure_ascii=False, indent=2))
+    elif len(sys.argv) >= 2 and sys.argv[1] == '--bench-barcode':
+        operations = int(sys.argv[2]) if len(sys.argv) >= 3 else 30
+        print(json.dumps(_benchmark_barcodes(operations), ensure_ascii=False, indent=2))
+    elif len(sys.argv) >= 2 and sys.argv[1] == '--bench-long':
+        operations = int(sys.argv[2]) if len(sys.argv) >= 3 else 500
+        employees = int(sys.argv[3]) if len(sys.argv) >= 4 else 5
+        print(json.dumps(_benchmark_long(operations, employees), ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps({'success': False, 'error': '用法: work_order_image.py --bench [工序数] [次数] | --bench-barcode [工序数] | --bench-long [工序数] [员工数]'}, ensure_ascii=False))
+        sys.exit(1)